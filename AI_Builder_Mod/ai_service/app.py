@@ -1,35 +1,135 @@
 # AI建设助手服务
 # 提供DeepSeek API集成和本地决策服务
+# Flask、requests等较重的依赖按需导入：只使用GameContext/AIService的脚本不必加载Web框架，
+# 数据库在第一次写入时才创建，Flask应用通过 create_app() 构建
 
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import requests
 import json
 import time
 import logging
 import re
+import threading
 from typing import Dict, Any, Optional, Tuple
 import os
 from dataclasses import dataclass, asdict
 import sqlite3
-from datetime import datetime, timedelta
+
+import metrics
+import tracing
+from cache import LRUCache, content_hash, make_cache
+from bucketing import decision_bucket_key
+from jobs import JobQueue
+from chat_index import ChatResponseIndex
+from codegen import CodegenPipeline, parse_temperatures
+from context_schema import GAME_CONTEXT_FIELDS, ContextValidationError, compile_context_parser
+from sessions import ROLE_LABELS, SessionResyncRequired, SessionStore
+from pacing import DecisionPacer
+from speculation import SpeculativeEngine
+from warmup import CacheWarmer
+from lua_safety import check_lua_code_safety, lua_code_key
+from task_library import TaskLibrary
+from backends import BackendRouter, parse_backends
+from scheduler import URGENT, LoadShed, SchedulerTimeout, UpstreamScheduler, parse_weights
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 创建Flask应用
-app = Flask(__name__)
-CORS(app)
-
 # DeepSeek API配置
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "your_api_key_here")
-DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
-DEEPSEEK_CHAT_URL = f"{DEEPSEEK_BASE_URL}/chat/completions"
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
+
+# 多后端路由（JSON数组，未配置时只使用上面的DeepSeek地址）；策略 ewma / least_outstanding
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+LLM_ROUTING_POLICY = os.getenv("LLM_ROUTING_POLICY", "ewma")
+LLM_FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD", "3"))  # 连续失败该次数后摘除后端
+LLM_COOLDOWN = float(os.getenv("LLM_COOLDOWN", "30"))  # 摘除秒数
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "2"))  # 单次调用最多尝试的后端数
+
+# 缓存配置（多进程部署时设置SHARED_CACHE_PATH，各工作进程通过SQLite共享缓存）
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH")
+DECISION_CACHE_SIZE = int(os.getenv("DECISION_CACHE_SIZE", "2048"))
+CODE_CACHE_SIZE = int(os.getenv("CODE_CACHE_SIZE", "512"))
+CODE_CACHE_TTL = int(os.getenv("CODE_CACHE_TTL", "3600"))
+
+# 聊天回复索引（重复的玩家消息攒够CHAT_INDEX_MIN_VARIANTS种上游回复后在本地随机回复，0为关闭）
+CHAT_INDEX_ENABLED = os.getenv("CHAT_INDEX_ENABLED", "1") != "0"
+CHAT_INDEX_MAX_KEYS = int(os.getenv("CHAT_INDEX_MAX_KEYS", "1024"))
+CHAT_INDEX_POOL_SIZE = int(os.getenv("CHAT_INDEX_POOL_SIZE", "4"))
+CHAT_INDEX_MIN_VARIANTS = int(os.getenv("CHAT_INDEX_MIN_VARIANTS", "3"))
+CHAT_INDEX_TTL = float(os.getenv("CHAT_INDEX_TTL", "1800"))
+CHAT_INDEX_REFRESH_RATE = float(os.getenv("CHAT_INDEX_REFRESH_RATE", "0.1"))  # 命中时仍回源的概率
+
+# 任务代码库（生成代码前先检索已验证的模板，0为关闭）
+TASK_LIBRARY_ENABLED = os.getenv("TASK_LIBRARY_ENABLED", "1") != "0"
+
+# 代码生成流水线（同时生成的候选数、各候选temperature、未通过验证时的修复轮数）
+CODEGEN_CANDIDATES = int(os.getenv("CODEGEN_CANDIDATES", "1"))
+CODEGEN_TEMPERATURES = parse_temperatures(os.getenv("CODEGEN_TEMPERATURES", "0.3,0.5,0.7"))
+CODEGEN_MAX_REPAIRS = int(os.getenv("CODEGEN_MAX_REPAIRS", "1"))
+
+# 异步代码生成任务（工作线程数、排队上限、完成后保留秒数、长轮询最长等待秒数）
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "64"))
+JOB_TTL = float(os.getenv("JOB_TTL", "300"))
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "25"))
+
+# 代码验证配置
+VALIDATION_CACHE_SIZE = int(os.getenv("VALIDATION_CACHE_SIZE", "4096"))
+VALIDATION_RAW_CACHE_SIZE = int(os.getenv("VALIDATION_RAW_CACHE_SIZE", "256"))  # 以原始代码为键的一级缓存，命中时跳过规范化和哈希
+BATCH_POOL_THRESHOLD = int(os.getenv("BATCH_POOL_THRESHOLD", "32"))  # 批量超过该数量时使用进程池
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+
+# 会话配置（增量上下文和对话历史）
+SESSION_MAX = int(os.getenv("SESSION_MAX", "4096"))
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "600"))
+SESSION_HISTORY_TURNS = int(os.getenv("SESSION_HISTORY_TURNS", "12"))
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "600"))  # 超出后旧记录折叠进摘要
+SESSION_SUMMARY_CHARS = int(os.getenv("SESSION_SUMMARY_CHARS", "400"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", "8192"))
+
+# 上游调度配置（并发上限、各类别权重、排队超时秒数）
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "8"))
+UPSTREAM_WEIGHTS = parse_weights(os.getenv("UPSTREAM_WEIGHTS", ""))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "10"))
+UPSTREAM_MAX_PENDING = int(os.getenv("UPSTREAM_MAX_PENDING", "64"))  # 进行中+排队超过该数量时拒绝新请求
+UPSTREAM_MAX_QUEUE_WAIT = float(os.getenv("UPSTREAM_MAX_QUEUE_WAIT", "5"))  # 预计排队超过该秒数时拒绝新请求
+
+# 决策预计算配置（上游空闲时为活跃会话预测下一阶段并预先请求决策）
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "1") != "0"
+SPECULATION_INTERVAL = float(os.getenv("SPECULATION_INTERVAL", "5"))
+SPECULATION_MAX_PER_CYCLE = int(os.getenv("SPECULATION_MAX_PER_CYCLE", "8"))
+SPECULATION_IDLE_IN_FLIGHT = int(os.getenv("SPECULATION_IDLE_IN_FLIGHT", "0"))  # 进行中调用不超过该数时视为空闲
+SEASON_LENGTH = int(os.getenv("SEASON_LENGTH", "20"))  # 每季天数（世界设置默认值）
+
+# 决策间隔建议（随决策返回下次请求的建议秒数）
+DECISION_INTERVAL_MIN = float(os.getenv("DECISION_INTERVAL_MIN", "5"))
+DECISION_INTERVAL_MAX = float(os.getenv("DECISION_INTERVAL_MAX", "60"))
+DECISION_INTERVAL_JITTER = float(os.getenv("DECISION_INTERVAL_JITTER", "0.1"))
+
+# 启动缓存预热配置（history：从历史记录回填；upstream：为常见分档限速请求上游）
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") != "0"
+WARMUP_MODE = os.getenv("WARMUP_MODE", "history")
+WARMUP_TOP_K = int(os.getenv("WARMUP_TOP_K", "50"))
+WARMUP_HISTORY_ROWS = int(os.getenv("WARMUP_HISTORY_ROWS", "5000"))
+WARMUP_RATE = float(os.getenv("WARMUP_RATE", "1"))  # upstream模式每秒最多调用次数
+
+# 生存紧急阈值：后备规则据此优先保命，调度器据此让决策插队
+URGENT_HEALTH = 30
+URGENT_HUNGER = 20
+
+_validation_pool = None
+
+def _get_validation_pool():
+    """按需创建验证进程池"""
+    global _validation_pool
+    if _validation_pool is None:
+        from concurrent.futures import ProcessPoolExecutor
+        _validation_pool = ProcessPoolExecutor()
+    return _validation_pool
 
 @dataclass
 class GameContext:
-    """游戏上下文数据结构"""
+    """游戏上下文数据结构（请求数据通过 parse_game_context 构建）"""
     health: float
     hunger: float  
     sanity: float
@@ -50,6 +150,9 @@ class GameContext:
     resource_needs: Optional[list] = None
     collection_targets: Optional[int] = None
 
+# 所有接口共用的上下文解析函数：类型转换、范围裁剪和默认值，无效数据抛出ContextValidationError
+parse_game_context = compile_context_parser(GameContext)
+
 @dataclass
 class AIDecision:
     """AI决策结果"""
@@ -64,10 +167,61 @@ class AIService:
     """AI服务主类"""
     
     def __init__(self):
-        self.db_path = "ai_builder.db"
-        self.init_database()
-        self.decision_cache = {}
-        self.cache_expiry = 300  # 5分钟缓存
+        self.db_path = os.getenv("DATABASE_PATH", "ai_builder.db")
+        self._db_ready = False  # 数据库表在第一次写入前创建
+        self._db_lock = threading.Lock()
+        self.cache_expiry = int(os.getenv("CACHE_EXPIRY", "300"))  # 5分钟缓存
+        self.decision_cache = make_cache("decision", DECISION_CACHE_SIZE, ttl=self.cache_expiry,
+                                         shared_path=SHARED_CACHE_PATH)
+        self.code_cache = make_cache("generated_code", CODE_CACHE_SIZE, ttl=CODE_CACHE_TTL,
+                                     shared_path=SHARED_CACHE_PATH)
+        self.validation_cache = make_cache("validation", VALIDATION_CACHE_SIZE, shared_path=SHARED_CACHE_PATH)
+        metrics.register_cache("decision", self.decision_cache)
+        metrics.register_cache("generated_code", self.code_cache)
+        self.validation_raw_cache = LRUCache(VALIDATION_RAW_CACHE_SIZE)
+        metrics.register_cache("validation", self.validation_cache)
+        metrics.register_cache("validation_raw", self.validation_raw_cache)
+        self.chat_index = ChatResponseIndex(CHAT_INDEX_MAX_KEYS, CHAT_INDEX_POOL_SIZE, CHAT_INDEX_MIN_VARIANTS,
+                                            CHAT_INDEX_TTL, CHAT_INDEX_REFRESH_RATE)
+        metrics.register_cache("chat_index", self.chat_index)
+        self.task_library = TaskLibrary()
+        self.codegen = CodegenPipeline(self, CODEGEN_CANDIDATES, CODEGEN_TEMPERATURES, CODEGEN_MAX_REPAIRS)
+        # 过载降级和后备代码的任务结果不复用，负载下降后相同请求重新生成
+        self.jobs = JobQueue(JOB_WORKERS, JOB_MAX_QUEUED, JOB_TTL, shared_path=SHARED_CACHE_PATH,
+                             reusable=lambda result: result.get("source") not in ("shed", "fallback"))
+        
+        # 按实体ID保存的会话：最近的完整上下文和有界的对话/决策历史
+        self.sessions = SessionStore(parse_game_context, [field.name for field in GAME_CONTEXT_FIELDS],
+                                     max_sessions=SESSION_MAX, idle_timeout=SESSION_IDLE_TIMEOUT,
+                                     history_turns=SESSION_HISTORY_TURNS, history_tokens=SESSION_HISTORY_TOKENS,
+                                     summary_chars=SESSION_SUMMARY_CHARS, max_session_bytes=SESSION_MAX_BYTES,
+                                     shared_path=SHARED_CACHE_PATH)
+        metrics.register_session_store("context", self.sessions)
+        
+        # 上游调度器：三类流量共用DeepSeek并发名额
+        self.scheduler = UpstreamScheduler(UPSTREAM_CONCURRENCY, UPSTREAM_WEIGHTS, UPSTREAM_QUEUE_TIMEOUT,
+                                           max_pending=UPSTREAM_MAX_PENDING, max_queue_wait=UPSTREAM_MAX_QUEUE_WAIT)
+        metrics.register_scheduler("deepseek", self.scheduler)
+        
+        # 上游后端路由：按接口筛选后端，按延迟/进行中请求数选择，失败时换下一个后端
+        self.backends = BackendRouter(parse_backends(LLM_BACKENDS, DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL),
+                                      policy=LLM_ROUTING_POLICY, failure_threshold=LLM_FAILURE_THRESHOLD,
+                                      cooldown=LLM_COOLDOWN)
+        metrics.register_backends("deepseek", self.backends)
+        
+        # 决策预计算：由create_app在配置了API密钥时启动
+        self.speculation = SpeculativeEngine(self, interval=SPECULATION_INTERVAL,
+                                             max_per_cycle=SPECULATION_MAX_PER_CYCLE,
+                                             idle_in_flight=SPECULATION_IDLE_IN_FLIGHT,
+                                             season_length=SEASON_LENGTH)
+        
+        # 决策间隔建议：局势平稳时少请求，紧急时尽快再请求
+        self.pacer = DecisionPacer(DECISION_INTERVAL_MIN, DECISION_INTERVAL_MAX, DECISION_INTERVAL_JITTER,
+                                   is_urgent=self.is_urgent)
+        
+        # 启动缓存预热：由create_app在后台启动
+        self.warmer = CacheWarmer(self, mode=WARMUP_MODE, top_k=WARMUP_TOP_K,
+                                  history_rows=WARMUP_HISTORY_ROWS, rate=WARMUP_RATE)
         
         # 系统提示词模板
         self.system_prompt = """
@@ -110,6 +264,19 @@ class AIService:
             )
         ''')
         
+        # 创建代码生成历史表（用于启动时预热代码缓存）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS generation_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                task_type TEXT,
+                instruction TEXT,
+                context TEXT,
+                lua_code TEXT,
+                reasoning TEXT
+            )
+        ''')
+        
         # 创建学习数据表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS learning_data (
@@ -124,73 +291,183 @@ class AIService:
         
         conn.commit()
         conn.close()
+        self._db_ready = True
         
-    def get_deepseek_decision(self, context: GameContext) -> AIDecision:
-        """使用DeepSeek API获取AI决策"""
-        try:
-            # 构建上下文描述
-            context_description = self._build_context_description(context)
-            
-            # 构建提示词
-            user_prompt = f"""
-当前游戏状态：
-{context_description}
-
-可选行动：{', '.join(self.available_actions)}
+    def _ensure_database(self):
+        """第一次使用数据库时建表"""
+        if not self._db_ready:
+            with self._db_lock:
+                if not self._db_ready:
+                    self.init_database()
+        
+    def _call_deepseek(self, endpoint: str, user_prompt: str, temperature: float, max_tokens: int,
+                       traffic_class: Optional[str] = None, wait: bool = True) -> str:
+        """经调度器排队后调用DeepSeek聊天接口并返回回复内容，同时记录上游调用指标
 
-请基于当前情况，选择最合适的行动并说明理由。
-回应格式：
-{{
-    "action": "选择的行动",
-    "reasoning": "详细的分析理由",
-    "priority": 0.0-1.0的优先级数值,
-    "message": "对玩家说的话（50字以内）"
-}}
-"""
-            
-            # 调用DeepSeek API
+        traffic_class默认与endpoint相同；排队超时抛出SchedulerTimeout，由调用方走后备逻辑；
+        上游积压时抛出LoadShed，由路由立即返回降级响应。wait=False时不排队，没有空闲名额直接抛出SchedulerTimeout。
+        """
+        traffic_class = traffic_class or endpoint
+        if not wait:
+            if not self.scheduler.try_acquire(traffic_class):
+                raise SchedulerTimeout(traffic_class, 0.0)
+        else:
+            with tracing.span("upstream_queue"):
+                self.scheduler.acquire(traffic_class)
+        start_time = time.perf_counter()
+        try:
+            return self._post_deepseek(endpoint, user_prompt, temperature, max_tokens)
+        finally:
+            self.scheduler.release(time.perf_counter() - start_time)
+    
+    def _post_deepseek(self, endpoint: str, user_prompt: str, temperature: float, max_tokens: int) -> str:
+        """选择上游后端发送请求；后端失败时换另一个可处理该接口的后端重试（最多LLM_MAX_ATTEMPTS个）"""
+        tried = []
+        attempts = min(LLM_MAX_ATTEMPTS, self.backends.candidates(endpoint)) or 1
+        while True:
+            backend = self.backends.acquire(endpoint, exclude=tried)
+            tried.append(backend)
+            try:
+                return self._post_backend(backend, endpoint, user_prompt, temperature, max_tokens)
+            except Exception as e:
+                if len(tried) >= attempts:
+                    raise
+                logger.warning(f"上游后端 {backend.name} 调用失败，改用其他后端: {e}")
+    
+    def _post_backend(self, backend, endpoint: str, user_prompt: str, temperature: float, max_tokens: int) -> str:
+        import requests  # 首次调用上游时才加载
+        
+        outcome = "error"
+        metrics.UPSTREAM_IN_FLIGHT.inc(endpoint)
+        start_time = time.perf_counter()
+        try:
             response = requests.post(
-                DEEPSEEK_CHAT_URL,
+                backend.chat_url,
                 headers={
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+                    "Authorization": f"Bearer {backend.api_key}",
                     "Content-Type": "application/json"
                 },
                 json={
-                    "model": "deepseek-chat",
+                    "model": backend.model,
                     "messages": [
                         {"role": "system", "content": self.system_prompt},
                         {"role": "user", "content": user_prompt}
                     ],
-                    "temperature": 0.7,
-                    "max_tokens": 500
+                    "temperature": temperature,
+                    "max_tokens": max_tokens
                 },
-                timeout=30
+                timeout=backend.timeout
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
-                decision_data = self._parse_decision_response(content)
-                
-                decision = AIDecision(
-                    action=decision_data.get("action", "idle"),
-                    reasoning=decision_data.get("reasoning", "AI正在分析情况"),
-                    priority=decision_data.get("priority", 0.5),
-                    message=decision_data.get("message", "让我想想..."),
-                    source="deepseek",
-                    confidence=0.9
-                )
-                
-                # 记录决策
-                self._record_decision(context, decision)
-                
-                return decision
-            else:
+            if response.status_code != 200:
+                outcome = f"http_{response.status_code}"
                 raise Exception(f"DeepSeek API错误: {response.status_code}")
             
+            result = response.json()
+            content = result['choices'][0]['message']['content']
+            outcome = "ok"
+            return content
+        except requests.Timeout:
+            outcome = "timeout"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.backends.release(backend, elapsed, outcome == "ok")
+            metrics.UPSTREAM_IN_FLIGHT.dec(endpoint)
+            metrics.UPSTREAM_LATENCY.observe(endpoint, outcome, value=elapsed)
+            metrics.UPSTREAM_BACKEND_REQUESTS.inc(backend.name, outcome)
+    
+    def _decision_cache_key(self, context: GameContext) -> str:
+        """决策缓存键：按 bucketing.DECISION_BUCKETS 分档，相近的状态共享同一决策（与Lua客户端一致）"""
+        return decision_bucket_key(context)
+    
+    def get_deepseek_decision(self, context: GameContext, entity_id: Optional[str] = None) -> AIDecision:
+        """获取AI决策，指定entity_id时记入该实体的会话历史"""
+        decision = self._get_decision(context)
+        if entity_id:
+            self.sessions.record_turn(entity_id, "decision", f"{decision.action}：{decision.message}",
+                                     topic=decision.action)
+        return decision
+    
+    def _get_decision(self, context: GameContext) -> AIDecision:
+        """使用DeepSeek API获取AI决策"""
+        cache_key = self._decision_cache_key(context)
+        cached = self.decision_cache.get(cache_key)
+        if cached is not None:
+            self.speculation.note_hit(cache_key)
+            decision = AIDecision(**cached)
+            decision.source = "cache"
+            return decision
+        
+        try:
+            decision = self._request_decision(
+                context, traffic_class=URGENT if self.is_urgent(context) else None)
+            
+            # 记录决策
+            with tracing.span("record_decision"):
+                self._record_decision(context, decision)
+            self.decision_cache.set(cache_key, asdict(decision))
+            
+            return decision
+            
+        except LoadShed:
+            raise  # 准入控制拒绝由路由返回降级响应
         except Exception as e:
             logger.error(f"DeepSeek API调用失败: {e}")
-            return self._get_fallback_decision(context)
+            with tracing.span("fallback_decision"):
+                return self._get_fallback_decision(context)
+    
+    def _request_decision(self, context: GameContext, traffic_class: Optional[str] = None,
+                          wait: bool = True) -> AIDecision:
+        """构建提示词并调用上游获取决策（不查缓存、不记录）"""
+        # 构建上下文描述
+        with tracing.span("build_context_description"):
+            context_description = self._build_context_description(context)
+        
+        # 构建提示词
+        user_prompt = f"""
+当前游戏状态：
+{context_description}
+
+可选行动：{', '.join(self.available_actions)}
+
+请基于当前情况，选择最合适的行动并说明理由。
+回应格式：
+{{
+    "action": "选择的行动",
+    "reasoning": "详细的分析理由",
+    "priority": 0.0-1.0的优先级数值,
+    "message": "对玩家说的话（50字以内）"
+}}
+"""
+        
+        # 调用DeepSeek API
+        with tracing.span("upstream"):
+            content = self._call_deepseek("decision", user_prompt, temperature=0.7, max_tokens=500,
+                                          traffic_class=traffic_class, wait=wait)
+        with tracing.span("parse_decision_response"):
+            decision_data = self._parse_decision_response(content)
+        
+        return AIDecision(
+            action=decision_data.get("action", "idle"),
+            reasoning=decision_data.get("reasoning", "AI正在分析情况"),
+            priority=decision_data.get("priority", 0.5),
+            message=decision_data.get("message", "让我想想..."),
+            source="deepseek",
+            confidence=0.9
+        )
+    
+    def precompute_decision(self, context: GameContext, traffic_class: str = "speculative") -> Optional[str]:
+        """在上游有空闲名额时预先计算决策并写入缓存
+
+        返回新写入的缓存键，已缓存时返回None；上游没有空闲名额时抛出SchedulerTimeout（不排队）。
+        """
+        cache_key = self._decision_cache_key(context)
+        if self.decision_cache.contains(cache_key):
+            return None
+        decision = self._request_decision(context, traffic_class=traffic_class, wait=False)
+        self.decision_cache.set(cache_key, asdict(decision))
+        return cache_key
     
     def _build_context_description(self, context: GameContext) -> str:
         """构建上下文描述"""
@@ -253,10 +530,15 @@ class AIService:
         
         return decision_data
     
+    @staticmethod
+    def is_urgent(context: GameContext) -> bool:
+        """是否处于生存紧急状态（与后备规则的前两条一致）"""
+        return context.health < URGENT_HEALTH or context.hunger < URGENT_HUNGER
+    
     def _get_fallback_decision(self, context: GameContext) -> AIDecision:
         """获取后备决策（本地规则引擎）"""
         # 紧急情况处理
-        if context.health < 30:
+        if context.health < URGENT_HEALTH:
             return AIDecision(
                 action="seek_safety",
                 reasoning="生命值过低，需要寻找安全地点",
@@ -265,7 +547,7 @@ class AIService:
                 source="fallback"
             )
         
-        if context.hunger < 20:
+        if context.hunger < URGENT_HUNGER:
             return AIDecision(
                 action="collect_food",
                 reasoning="饥饿值过低，急需食物",
@@ -324,7 +606,9 @@ class AIService:
     
     def _record_decision(self, context: GameContext, decision: AIDecision):
         """记录决策到数据库"""
+        start_time = time.perf_counter()
         try:
+            self._ensure_database()
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
@@ -337,17 +621,84 @@ class AIService:
             conn.close()
         except Exception as e:
             logger.error(f"记录决策失败: {e}")
+        finally:
+            metrics.DB_WRITE_LATENCY.observe("decision_history", value=time.perf_counter() - start_time)
     
-    def get_chat_response(self, player_message: str, context: GameContext) -> str:
-        """获取聊天响应"""
+    def _record_generation(self, task_type: str, instruction: str, context: GameContext,
+                           lua_code: str, reasoning: str):
+        """记录生成的代码到数据库"""
+        start_time = time.perf_counter()
         try:
-            context_description = self._build_context_description(context)
+            self._ensure_database()
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('''
+                INSERT INTO generation_history (task_type, instruction, context, lua_code, reasoning)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (task_type, instruction, json.dumps(asdict(context)), lua_code, reasoning))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"记录代码生成失败: {e}")
+        finally:
+            metrics.DB_WRITE_LATENCY.observe("generation_history", value=time.perf_counter() - start_time)
+    
+    def _build_history_description(self, entity_id: Optional[str]) -> str:
+        """构建会话历史描述（更早记录的摘要 + 最近记录），没有历史时为空"""
+        summary, turns = self.sessions.conversation(entity_id)
+        if not summary and not turns:
+            return ""
+        description = ""
+        if summary:
+            description += f"\n更早的记录摘要：\n{summary}\n"
+        if turns:
+            recent = "\n".join(f"{ROLE_LABELS.get(role, role)}: {text}" for role, text in turns)
+            description += f"\n最近的对话和决策：\n{recent}\n"
+        return description
+    
+    def get_chat_response(self, player_message: str, context: GameContext, entity_id: Optional[str] = None) -> str:
+        """获取聊天响应，指定entity_id时带上该实体的对话历史并记录本轮对话"""
+        response = self._get_chat_response(player_message, context, entity_id)
+        if entity_id:
+            self.sessions.record_turn(entity_id, "player", player_message)
+            self.sessions.record_turn(entity_id, "assistant", response)
+        return response
+    
+    def _chat_index_key(self, player_message: str, context: GameContext) -> Optional[str]:
+        """聊天回复索引键：归一化消息 + 粗粒度状态（季节、阶段、是否紧急、木材/食物是否充足）"""
+        if not CHAT_INDEX_ENABLED:
+            return None
+        bucket = "|".join(str(part) for part in (
+            context.season,
+            context.time_phase,
+            int(self.is_urgent(context)),
+            int(context.wood_count >= 10),
+            int(context.food_count >= 5),
+        ))
+        return self.chat_index.key(player_message, bucket)
+    
+    def _get_chat_response(self, player_message: str, context: GameContext, entity_id: Optional[str]) -> str:
+        """获取聊天响应：重复的常见消息优先使用回复索引
+
+        索引按消息和粗粒度状态共享给所有实体，只收录不带会话历史生成的回复，
+        避免把引用某个实体对话内容的回复发给其他玩家。
+        """
+        index_key = self._chat_index_key(player_message, context)
+        if index_key is not None:
+            indexed = self.chat_index.lookup(index_key)
+            if indexed is not None:
+                metrics.RESPONSE_SOURCE.inc("chat", "cache")
+                return indexed
+        
+        try:
+            with tracing.span("build_context_description"):
+                context_description = self._build_context_description(context)
+                history_description = self._build_history_description(entity_id)
             
             user_prompt = f"""
 玩家对你说："{player_message}"
 
 当前情况：
-{context_description}
+{context_description}{history_description}
 
 请以建造师艾德的身份回应，要求：
 1. 符合建设工程师的专业形象
@@ -356,33 +707,26 @@ class AIService:
 4. 语气友善专业
 """
             
-            response = requests.post(
-                DEEPSEEK_CHAT_URL,
-                headers={
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "deepseek-chat",
-                    "messages": [
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    "temperature": 0.8,
-                    "max_tokens": 200
-                },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content'].strip()
-            else:
-                raise Exception(f"DeepSeek API错误: {response.status_code}")
+            with tracing.span("upstream"):
+                content = self._call_deepseek("chat", user_prompt, temperature=0.8, max_tokens=200)
+            metrics.RESPONSE_SOURCE.inc("chat", "deepseek")
+            content = content.strip()
+            if index_key is not None and not history_description:
+                self.chat_index.add(index_key, content)
+            return content
             
+        except LoadShed:
+            raise  # 准入控制拒绝由路由返回降级响应
         except Exception as e:
             logger.error(f"聊天响应失败: {e}")
-            return self._get_fallback_chat_response(player_message)
+            metrics.RESPONSE_SOURCE.inc("chat", "fallback")
+            return self.fallback_chat_response(player_message, context)
+    
+    def fallback_chat_response(self, player_message: str, context: GameContext) -> str:
+        """上游不可用时的聊天响应：回复索引中有该消息的回复时优先使用，否则用本地规则"""
+        index_key = self._chat_index_key(player_message, context)
+        indexed = self.chat_index.any_answer(index_key) if index_key is not None else None
+        return indexed or self._get_fallback_chat_response(player_message)
     
     def _get_fallback_chat_response(self, player_message: str) -> str:
         """后备聊天响应"""
@@ -397,13 +741,69 @@ class AIService:
         else:
             return "我明白，让我分析一下最佳的建设方案。"
     
+    def _code_cache_key(self, instruction: str, context: GameContext, task_type: str) -> str:
+        """代码缓存键：任务类型 + 指令 + 决策缓存的状态分档"""
+        return content_hash(f"{task_type}\n{instruction.strip()}\n{self._decision_cache_key(context)}")
+    
     def generate_lua_code(self, instruction: str, context: GameContext, task_type: str = "general") -> Tuple[str, str]:
         """生成Lua执行代码"""
+        lua_code, reasoning, _ = self.generate_lua_code_with_source(instruction, context, task_type)
+        return lua_code, reasoning
+    
+    def generate_lua_code_with_source(self, instruction: str, context: GameContext,
+                                      task_type: str = "general") -> Tuple[str, str, str]:
+        """生成Lua执行代码，返回 (代码, 说明, 来源)，来源为 cache / library / deepseek / fallback"""
+        cache_key = self._code_cache_key(instruction, context, task_type)
+        cached = self.code_cache.get(cache_key)
+        if cached is not None:
+            metrics.RESPONSE_SOURCE.inc("generate_lua_code", "cache")
+            return cached[0], cached[1], "cache"
+        
+        # 先检索任务代码库：完全匹配直接返回模板代码，部分匹配作为示例交给上游
+        match = self.task_library.search(instruction, task_type) if TASK_LIBRARY_ENABLED else None
+        if match is not None and match.full:
+            with tracing.span("task_library"):
+                lua_code, reasoning = match.template.render(instruction)
+            self.code_cache.set(cache_key, [lua_code, reasoning])
+            metrics.RESPONSE_SOURCE.inc("generate_lua_code", "library")
+            return lua_code, reasoning, "library"
+        
         try:
-            context_description = self._build_context_description(context)
+            lua_code, reasoning = self.codegen.run(instruction, context, task_type, match=match)
+            self.code_cache.set(cache_key, [lua_code, reasoning])
+            with tracing.span("record_generation"):
+                self._record_generation(task_type, instruction, context, lua_code, reasoning)
+            metrics.RESPONSE_SOURCE.inc("generate_lua_code", "deepseek")
+            return lua_code, reasoning, "deepseek"
             
-            # 构建代码生成提示词
-            code_prompt = f"""
+        except LoadShed:
+            raise  # 准入控制拒绝由路由返回降级响应
+        except Exception as e:
+            logger.error(f"代码生成失败: {e}")
+            metrics.RESPONSE_SOURCE.inc("generate_lua_code", "fallback")
+            return self.get_fallback_lua_code(task_type), f"使用后备代码: {str(e)}", "fallback"
+    
+    def _request_lua_code(self, instruction: str, context: GameContext, task_type: str,
+                          traffic_class: Optional[str] = None, wait: bool = True, match=None,
+                          temperature: float = 0.3) -> Tuple[str, str]:
+        """构建提示词并调用上游生成代码（不查缓存、不记录），返回 (代码, 说明)
+
+        match为任务代码库的部分匹配时，把该模板代码作为参考示例放进提示词。
+        """
+        with tracing.span("build_context_description"):
+            context_description = self._build_context_description(context)
+            example = ""
+            if match is not None:
+                example_code, _ = match.template.render(instruction)
+                example = f"""
+已验证的相似任务代码（可在此基础上修改，保持相同的结构和返回格式）：
+```lua
+{example_code}
+```
+"""
+        
+        # 构建代码生成提示词
+        code_prompt = f"""
 你是饥荒游戏的AI建造师艾德，需要生成Lua代码来执行玩家的指令。
 
 玩家指令："{instruction}"
@@ -424,7 +824,7 @@ class AIService:
 - 耕地：检查工具→寻找位置→清理区域→耕地→种植
 - 建设：收集材料→选择位置→建造结构
 - 收集：寻找资源→移动到位置→执行收集
-
+{example}
 请生成完整的Lua代码：
 
 ```lua
@@ -435,40 +835,53 @@ function ExecuteAITask(inst)
 end
 ```
 """
-            
-            response = requests.post(
-                DEEPSEEK_CHAT_URL,
-                headers={
-                    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "deepseek-chat",
-                    "messages": [
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": code_prompt}
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 1000
-                },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
-                
-                # 提取Lua代码
-                lua_code = self._extract_lua_code(content)
-                reasoning = self._extract_reasoning(content)
-                
-                return lua_code, reasoning
-            else:
-                raise Exception(f"DeepSeek API错误: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"代码生成失败: {e}")
-            return self.get_fallback_lua_code(task_type), f"使用后备代码: {str(e)}"
+        
+        with tracing.span("upstream"):
+            content = self._call_deepseek("generate_lua_code", code_prompt, temperature=temperature, max_tokens=1000,
+                                          traffic_class=traffic_class, wait=wait)
+        
+        # 提取Lua代码
+        with tracing.span("extract_lua_code"):
+            lua_code = self._extract_lua_code(content)
+            reasoning = self._extract_reasoning(content)
+        return lua_code, reasoning
+    
+    def _request_lua_repair(self, instruction: str, lua_code: str, errors: list,
+                            traffic_class: Optional[str] = None, wait: bool = True) -> Tuple[str, str]:
+        """把未通过安全检查的代码和错误交给上游修复，返回 (代码, 说明)"""
+        error_lines = "\n".join(f"- {error}" for error in errors)
+        repair_prompt = f"""
+下面的Lua代码用于执行玩家指令"{instruction}"，但没有通过安全检查：
+{error_lines}
+
+请修复这些问题并输出完整代码，要求：
+1. 函数名必须是 ExecuteAITask(inst)，返回 {{action=..., status=..., message=...}} 格式的表
+2. 禁止使用：io, os, require, dofile, loadfile, loadstring, debug, getfenv, setfenv, _G
+3. 不要使用没有break的 while true 循环
+
+```lua
+{lua_code}
+```
+"""
+        with tracing.span("upstream"):
+            content = self._call_deepseek("generate_lua_code", repair_prompt, temperature=0.2, max_tokens=1000,
+                                          traffic_class=traffic_class, wait=wait)
+        with tracing.span("extract_lua_code"):
+            return self._extract_lua_code(content), self._extract_reasoning(content)
+    
+    def precompute_lua_code(self, instruction: str, context: GameContext, task_type: str,
+                            traffic_class: str = "warmup") -> bool:
+        """在上游有空闲名额时预先生成代码并写入缓存，已缓存时跳过；返回是否新写入了缓存"""
+        cache_key = self._code_cache_key(instruction, context, task_type)
+        if self.code_cache.contains(cache_key):
+            return False
+        match = self.task_library.search(instruction, task_type) if TASK_LIBRARY_ENABLED else None
+        if match is not None and match.full:
+            self.code_cache.set(cache_key, list(match.template.render(instruction)))
+            return True
+        self.code_cache.set(cache_key, list(self.codegen.run(instruction, context, task_type, match=match,
+                                                             traffic_class=traffic_class, wait_slot=False)))
+        return True
     
     def _extract_lua_code(self, content: str) -> str:
         """从AI响应中提取Lua代码"""
@@ -515,46 +928,53 @@ end'''
         return reasoning if reasoning else "AI正在分析和规划任务执行方案"
     
     def validate_lua_code_safety(self, lua_code: str) -> dict:
-        """验证Lua代码的安全性"""
-        errors = []
-        warnings = []
-        
-        # 危险函数检查
-        dangerous_patterns = [
-            r'\bio\.',           # io操作
-            r'\bos\.',           # 系统操作  
-            r'\brequire\b',      # 模块加载
-            r'\bdofile\b',       # 文件执行
-            r'\bloadfile\b',     # 文件加载
-            r'\bloadstring\b',   # 字符串执行
-            r'\bdebug\.',        # 调试接口
-            r'\bgetfenv\b',      # 环境获取
-            r'\bsetfenv\b',      # 环境设置
-            r'\b_G\b',           # 全局环境
-        ]
-        
-        for pattern in dangerous_patterns:
-            if re.search(pattern, lua_code):
-                errors.append(f"检测到危险函数调用: {pattern}")
-        
-        # 必需函数检查
-        if 'function ExecuteAITask' not in lua_code:
-            errors.append("缺少必需的ExecuteAITask函数")
+        """验证Lua代码的安全性（先查原始代码一级缓存，再按规范化代码哈希缓存）"""
+        result = self.validation_raw_cache.get(lua_code)
+        if result is None:
+            key = lua_code_key(lua_code)
+            result = self.validation_cache.get(key)
+            if result is None:
+                result = check_lua_code_safety(lua_code)
+                self.validation_cache.set(key, result)
+            self.validation_raw_cache.set(lua_code, result)
+        # 规范化后相同的代码共享结果，code_length按本次提交的代码计算
+        return dict(result, code_length=len(lua_code))
+    
+    def validate_lua_code_batch(self, lua_codes: list) -> list:
+        """批量验证Lua代码，未命中缓存的部分在批量较大时交给进程池"""
+        results = {}
+        pending = {}
         
-        # 返回值检查
-        if 'return {' not in lua_code and 'return{' not in lua_code:
-            warnings.append("函数可能没有正确的返回值格式")
+        for code in lua_codes:
+            if code in results or code in pending:
+                continue
+            cached = self.validation_raw_cache.get(code)
+            if cached is not None:
+                results[code] = cached
+                continue
+            key = lua_code_key(code)
+            cached = self.validation_cache.get(key)
+            if cached is not None:
+                results[code] = cached
+                self.validation_raw_cache.set(code, cached)
+            else:
+                pending[code] = key
         
-        # 无限循环检查
-        if re.search(r'\bwhile\s+true\b', lua_code) and 'break' not in lua_code:
-            errors.append("检测到可能的无限循环")
+        if pending:
+            pending_codes = list(pending.keys())
+            if len(pending_codes) >= BATCH_POOL_THRESHOLD:
+                pool = _get_validation_pool()
+                chunksize = max(1, len(pending_codes) // (4 * (os.cpu_count() or 1)))
+                computed = list(pool.map(check_lua_code_safety, pending_codes, chunksize=chunksize))
+            else:
+                computed = [check_lua_code_safety(code) for code in pending_codes]
+            
+            for code, result in zip(pending_codes, computed):
+                self.validation_cache.set(pending[code], result)
+                self.validation_raw_cache.set(code, result)
+                results[code] = result
         
-        return {
-            "is_safe": len(errors) == 0,
-            "errors": errors,
-            "warnings": warnings,
-            "code_length": len(lua_code)
-        }
+        return [dict(results[code], code_length=len(code)) for code in lua_codes]
     
     def get_fallback_lua_code(self, task_type: str) -> str:
         """获取后备Lua代码"""
@@ -604,185 +1024,57 @@ end'''
         
         return fallback_codes.get(task_type, fallback_codes["general"])
 
-# 创建AI服务实例
-ai_service = AIService()
-
-@app.route('/ping', methods=['GET', 'POST'])
-def ping():
-    """健康检查接口"""
-    return jsonify({
-        "status": "ok",
-        "message": "AI建设助手服务运行正常",
-        "timestamp": datetime.now().isoformat()
-    })
-
-@app.route('/decision', methods=['POST'])
-def get_decision():
-    """获取AI决策"""
-    try:
-        data = request.get_json()
-        context_data = data.get('context', {})
-        
-        # 构建游戏上下文
-        context = GameContext(
-            health=context_data.get('health', 100),
-            hunger=context_data.get('hunger', 100),
-            sanity=context_data.get('sanity', 100),
-            day=context_data.get('day', 1),
-            season=context_data.get('season', 'autumn'),
-            time_phase=context_data.get('time_phase', 'day'),
-            is_night=context_data.get('is_night', False),
-            is_dusk=context_data.get('is_dusk', False),
-            inventory_full=context_data.get('inventory_full', False),
-            wood_count=context_data.get('wood_count', 0),
-            stone_count=context_data.get('stone_count', 0),
-            food_count=context_data.get('food_count', 0),
-            has_campfire=context_data.get('has_campfire', False),
-            has_chest=context_data.get('has_chest', False),
-            base_center=context_data.get('base_center'),
-            planning_progress=context_data.get('planning_progress'),
-            total_planned=context_data.get('total_planned'),
-            resource_needs=context_data.get('resource_needs'),
-            collection_targets=context_data.get('collection_targets')
-        )
-        
-        # 获取AI决策
-        decision = ai_service.get_deepseek_decision(context)
-        
-        return jsonify(asdict(decision))
-        
-    except Exception as e:
-        logger.error(f"决策请求处理失败: {e}")
-        return jsonify({
-            "action": "idle",
-            "reasoning": "服务器处理错误",
-            "priority": 0.1,
-            "message": "遇到了一些技术问题，稍后再试。",
-            "source": "error"
-        }), 500
-
-@app.route('/chat', methods=['POST'])
-def chat():
-    """聊天接口"""
-    try:
-        data = request.get_json()
-        player_message = data.get('player_message', '')
-        context_data = data.get('context', {})
-        
-        # 构建游戏上下文
-        context = GameContext(
-            health=context_data.get('health', 100),
-            hunger=context_data.get('hunger', 100),
-            sanity=context_data.get('sanity', 100),
-            day=context_data.get('day', 1),
-            season=context_data.get('season', 'autumn'),
-            time_phase=context_data.get('time_phase', 'day'),
-            is_night=context_data.get('is_night', False),
-            is_dusk=context_data.get('is_dusk', False),
-            inventory_full=context_data.get('inventory_full', False),
-            wood_count=context_data.get('wood_count', 0),
-            stone_count=context_data.get('stone_count', 0),
-            food_count=context_data.get('food_count', 0),
-            has_campfire=context_data.get('has_campfire', False),
-            has_chest=context_data.get('has_chest', False),
-            base_center=context_data.get('base_center')
-        )
-        
-        # 获取聊天响应
-        response_message = ai_service.get_chat_response(player_message, context)
-        
-        return jsonify({
-            "message": response_message,
-            "tone": "professional"
-        })
-        
-    except Exception as e:
-        logger.error(f"聊天请求处理失败: {e}")
-        return jsonify({
-            "message": "抱歉，我现在有点忙，稍后再聊。",
-            "tone": "apologetic"
-        }), 500
-
-@app.route('/generate_lua_code', methods=['POST'])
-def generate_lua_code():
-    """生成Lua执行代码"""
-    try:
-        data = request.get_json()
-        player_instruction = data.get('instruction', '')
-        context_data = data.get('context', {})
-        task_type = data.get('task_type', 'general')
-        
-        # 构建游戏上下文
-        context = GameContext(
-            health=context_data.get('health', 100),
-            hunger=context_data.get('hunger', 100),
-            sanity=context_data.get('sanity', 100),
-            day=context_data.get('day', 1),
-            season=context_data.get('season', 'autumn'),
-            time_phase=context_data.get('time_phase', 'day'),
-            is_night=context_data.get('is_night', False),
-            is_dusk=context_data.get('is_dusk', False),
-            inventory_full=context_data.get('inventory_full', False),
-            wood_count=context_data.get('wood_count', 0),
-            stone_count=context_data.get('stone_count', 0),
-            food_count=context_data.get('food_count', 0),
-            has_campfire=context_data.get('has_campfire', False),
-            has_chest=context_data.get('has_chest', False),
-            base_center=context_data.get('base_center')
-        )
-        
-        # 生成Lua代码
-        lua_code, reasoning = ai_service.generate_lua_code(player_instruction, context, task_type)
-        
-        return jsonify({
-            "success": True,
-            "lua_code": lua_code,
-            "reasoning": reasoning,
-            "task_type": task_type,
-            "timestamp": datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        logger.error(f"Lua代码生成失败: {e}")
-        return jsonify({
-            "success": False,
-            "error": str(e),
-            "fallback_code": ai_service.get_fallback_lua_code(task_type)
-        }), 500
-
-@app.route('/validate_lua_code', methods=['POST'])
-def validate_lua_code():
-    """验证Lua代码安全性"""
-    try:
-        data = request.get_json()
-        lua_code = data.get('lua_code', '')
-        
-        validation_result = ai_service.validate_lua_code_safety(lua_code)
-        
-        return jsonify(validation_result)
-        
-    except Exception as e:
-        logger.error(f"Lua代码验证失败: {e}")
-        return jsonify({
-            "is_safe": False,
-            "errors": [str(e)],
-            "warnings": []
-        }), 500
-
-@app.route('/status', methods=['GET'])
-def get_status():
-    """获取服务状态"""
-    return jsonify({
-        "service": "AI Builder Assistant",
-        "status": "running",
-        "api_available": DEEPSEEK_API_KEY != "your_api_key_here",
-        "code_generation": True,
-        "timestamp": datetime.now().isoformat()
-    })
+
+_ai_service = None
+_ai_service_lock = threading.Lock()
+
+def get_ai_service() -> AIService:
+    """获取进程内共享的AI服务实例（首次调用时创建）"""
+    global _ai_service
+    if _ai_service is None:
+        with _ai_service_lock:
+            if _ai_service is None:
+                _ai_service = AIService()
+    return _ai_service
+
+def create_app(service: Optional[AIService] = None):
+    """创建Flask应用并注册接口，未指定service时使用共享实例"""
+    from flask import Flask
+    from flask_cors import CORS
+    import routes
+    import wire
+    
+    flask_app = Flask(__name__)
+    CORS(flask_app)
+    flask_app.extensions["ai_service"] = service = service or get_ai_service()
+    if SHARED_CACHE_PATH:
+        # 多进程部署：/metrics 合并所有工作进程的计数
+        metrics.REGISTRY.enable_sharing(SHARED_CACHE_PATH)
+    if WARMUP_ENABLED and (WARMUP_MODE == "history" or service.backends.available()):
+        service.warmer.start()
+    if SPECULATION_ENABLED and service.backends.available():
+        service.speculation.start()
+    flask_app.register_blueprint(routes.bp)
+    # 在路由钩子之后注册，响应压缩先于请求指标执行，压缩耗时计入请求耗时
+    wire.init_app(flask_app)
+    return flask_app
+
+_app = None
+
+def __getattr__(name: str):
+    """兼容旧用法 `from app import app, ai_service`：首次访问时才创建"""
+    global _app
+    if name == "ai_service":
+        return get_ai_service()
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
     print("启动AI建设助手服务...")
     print(f"DeepSeek API Key: {'已配置' if DEEPSEEK_API_KEY != 'your_api_key_here' else '未配置'}")
     print("访问 http://localhost:8000/ping 检查服务状态")
     
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=8000, debug=True)
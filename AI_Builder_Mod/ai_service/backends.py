@@ -0,0 +1,164 @@
+# AI建设助手上游后端路由
+# 上游可以是多个兼容OpenAI接口的地址（多个密钥/地域、本地模型服务）：
+# 每次调用按接口筛选可用后端，按延迟EWMA或进行中请求数选择，连续失败的后端暂时摘除
+
+import json
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+ROUTING_POLICIES = ("ewma", "least_outstanding")
+
+PLACEHOLDER_API_KEY = "your_api_key_here"
+
+
+class NoBackendAvailable(Exception):
+    """没有可处理该接口的后端"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        super().__init__(f"没有可处理 {endpoint} 的上游后端")
+
+
+class Backend:
+    """单个兼容OpenAI接口的上游后端及其健康状态"""
+
+    def __init__(self, name: str, base_url: str, api_key: str, model: str = "deepseek-chat",
+                 routes: Optional[Iterable[str]] = None, timeout: float = 30.0):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.chat_url = f"{self.base_url}/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.routes = frozenset(routes) if routes else None  # None表示处理所有接口
+        self.timeout = timeout
+        self.outstanding = 0
+        self.latency_ewma = 0.0
+        self.failures = 0  # 连续失败次数
+        self.down_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def serves(self, endpoint: str) -> bool:
+        return self.routes is None or endpoint in self.routes
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model,
+            "routes": sorted(self.routes) if self.routes else "*",
+            "healthy": self.healthy(now),
+            "outstanding": self.outstanding,
+            "latency_ewma": round(self.latency_ewma, 4),
+            "consecutive_failures": self.failures,
+            "requests": self.requests,
+            "errors": self.errors
+        }
+
+
+def parse_backends(spec: str, default_api_key: str, default_base_url: str) -> List[Backend]:
+    """解析LLM_BACKENDS配置
+
+    JSON数组，每项 {"name", "base_url", "api_key", "model", "routes", "timeout"}，
+    省略api_key/base_url时使用DEEPSEEK_API_KEY/DEEPSEEK_BASE_URL；未配置时只有一个默认后端。
+    """
+    if not spec.strip():
+        return [Backend("deepseek", default_base_url, default_api_key)]
+    backends = []
+    for index, item in enumerate(json.loads(spec)):
+        backends.append(Backend(
+            name=item.get("name") or f"backend{index}",
+            base_url=item.get("base_url") or default_base_url,
+            api_key=item.get("api_key", default_api_key),
+            model=item.get("model", "deepseek-chat"),
+            routes=item.get("routes"),
+            timeout=float(item.get("timeout", 30))
+        ))
+    if not backends:
+        raise ValueError("LLM_BACKENDS 至少需要一个后端")
+    return backends
+
+
+class BackendRouter:
+    """上游后端选择
+
+    - ewma：选择 延迟EWMA × (进行中请求数+1) 最小的后端（尚无延迟数据的后端优先试探）
+    - least_outstanding：选择进行中请求最少的后端，相同时比较延迟EWMA
+    - 连续失败failure_threshold次的后端摘除cooldown秒，到期后重新参与选择；
+      某接口的后端全部被摘除时，仍选择最早恢复的后端，不直接失败
+    """
+
+    def __init__(self, backends: List[Backend], policy: str = "ewma", failure_threshold: int = 3,
+                 cooldown: float = 30.0, alpha: float = 0.3):
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"未知的路由策略: {policy}")
+        self.backends = list(backends)
+        self.policy = policy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """是否至少有一个后端配置了API密钥"""
+        return any(backend.api_key != PLACEHOLDER_API_KEY for backend in self.backends)
+
+    def _score(self, backend: Backend):
+        if self.policy == "least_outstanding":
+            return backend.outstanding, backend.latency_ewma
+        return backend.latency_ewma * (backend.outstanding + 1), backend.outstanding
+
+    def acquire(self, endpoint: str, exclude: Iterable[Backend] = ()) -> Backend:
+        """为一次调用选择后端并计入进行中请求数，调用结束后必须调用release"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [backend for backend in self.backends
+                          if backend.serves(endpoint) and backend not in exclude]
+            if not candidates:
+                raise NoBackendAvailable(endpoint)
+            healthy = [backend for backend in candidates if backend.healthy(now)]
+            if healthy:
+                chosen = min(healthy, key=self._score)
+            else:
+                chosen = min(candidates, key=lambda backend: backend.down_until)
+            chosen.outstanding += 1
+            chosen.requests += 1
+            return chosen
+
+    def release(self, backend: Backend, latency: float, ok: bool):
+        """记录一次调用结果：成功时更新延迟EWMA并清零失败计数，失败达到阈值时摘除"""
+        with self._lock:
+            backend.outstanding -= 1
+            if ok:
+                backend.failures = 0
+                backend.down_until = 0.0
+                backend.latency_ewma = (latency if not backend.latency_ewma
+                                        else (1 - self.alpha) * backend.latency_ewma + self.alpha * latency)
+                return
+            backend.errors += 1
+            backend.failures += 1
+            if backend.failures >= self.failure_threshold:
+                backend.down_until = time.monotonic() + self.cooldown
+
+    def candidates(self, endpoint: str) -> int:
+        return sum(1 for backend in self.backends if backend.serves(endpoint))
+
+    def backend_values(self, field: str) -> Dict[str, float]:
+        """各后端的数值状态（用于指标）"""
+        now = time.monotonic()
+        with self._lock:
+            if field == "healthy":
+                return {backend.name: float(backend.healthy(now)) for backend in self.backends}
+            return {backend.name: float(getattr(backend, field)) for backend in self.backends}
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "backends": [backend.stats(now) for backend in self.backends]
+            }
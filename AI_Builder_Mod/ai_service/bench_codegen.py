@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+代码生成流水线基准测试
+进程内模拟上游按设定比例返回不安全的代码（含 os.execute），
+比较不同候选数K下得到有效代码的比例、端到端耗时、各轮通过率和每次生成消耗的上游调用数
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_deepseek import CODE_REPLY, LatencyModel, MockConfig, MockDeepSeekServer
+
+UNSAFE_CODE_REPLY = CODE_REPLY.replace('print("[AI助手] 开始执行砍树任务")',
+                                       'os.execute("echo chop")\n    print("[AI助手] 开始执行砍树任务")')
+REPAIR_MATCH = "没有通过安全检查"
+
+
+def reply_pool(invalid_rate: float, size: int = 20) -> List[str]:
+    """按比例混合安全/不安全回复，模拟服务随机挑选"""
+    invalid = round(invalid_rate * size)
+    return [UNSAFE_CODE_REPLY] * invalid + [CODE_REPLY] * (size - invalid)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(service, mock: MockDeepSeekServer, candidates: int, repairs: int, temperatures: List[float],
+        requests_count: int, concurrency: int) -> Dict:
+    from app import parse_game_context
+    from codegen import CodegenFailed, CodegenPipeline
+
+    service.codegen = CodegenPipeline(service, candidates, temperatures, repairs)
+    context = parse_game_context({"health": 80, "hunger": 60, "day": 5, "wood_count": 3})
+    latencies: List[float] = []
+    failed = 0
+    lock = threading.Lock()
+    counter = iter(range(requests_count))
+    upstream_before = mock.config.stats["requests"]
+
+    def worker():
+        nonlocal failed
+        for index in counter:
+            start = time.perf_counter()
+            try:
+                service.codegen.run(f"在基地东边开一块农田 #{candidates}-{index}", context, "farming")
+            except CodegenFailed:
+                with lock:
+                    failed += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = service.codegen.stats()
+    upstream_calls = mock.config.stats["requests"] - upstream_before
+    return {
+        "candidates": candidates,
+        "valid_ratio": len(latencies) / requests_count,
+        "failed": failed,
+        "time_to_valid_p50": percentile(latencies, 0.5),
+        "time_to_valid_p95": percentile(latencies, 0.95),
+        "upstream_calls_per_request": upstream_calls / requests_count,
+        "attempts": stats["attempts"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="代码生成流水线基准测试")
+    parser.add_argument("--candidates", default="1,3", help="逗号分隔的候选数列表")
+    parser.add_argument("--max-repairs", type=int, default=1)
+    parser.add_argument("--temperatures", default="0.3,0.5,0.7")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--invalid-rate", type=float, default=0.3, help="首轮生成不安全代码的比例")
+    parser.add_argument("--repair-invalid-rate", type=float, default=0.1, help="修复后仍不安全的比例")
+    parser.add_argument("--latency-dist", default="lognormal")
+    parser.add_argument("--latency-mean", type=float, default=0.2)
+    parser.add_argument("--latency-std", type=float, default=0.1)
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    mock = MockDeepSeekServer(MockConfig(
+        latency=LatencyModel(args.latency_dist, args.latency_mean, args.latency_std),
+        script=[{"match": REPAIR_MATCH, "content": reply_pool(args.repair_invalid_rate)},
+                {"match": "ExecuteAITask", "content": reply_pool(args.invalid_rate)}]
+    )).start()
+    os.environ.update({
+        "DEEPSEEK_BASE_URL": mock.base_url,
+        "DEEPSEEK_API_KEY": "bench-key",
+        "DATABASE_PATH": os.path.join(tempfile.mkdtemp(prefix="ai_builder_codegen_"), "bench.db"),
+        "UPSTREAM_CONCURRENCY": "64",
+    })
+    from app import AIService
+    from codegen import parse_temperatures
+
+    service = AIService()
+    temperatures = parse_temperatures(args.temperatures)
+    print(f"🧪 首轮不安全比例{args.invalid_rate}  修复后不安全比例{args.repair_invalid_rate}  "
+          f"上游延迟{args.latency_dist} 均值{args.latency_mean}s")
+    print(f"{'候选数':>6}{'有效率':>8}{'p50ms':>9}{'p95ms':>9}{'上游调用/次':>12}  各轮通过率")
+    results = []
+    try:
+        for candidates in (int(part) for part in args.candidates.split(",") if part.strip()):
+            result = run(service, mock, candidates, args.max_repairs, temperatures, args.requests, args.concurrency)
+            results.append(result)
+            rounds = "  ".join(f"第{attempt}轮 {counts['success_rate'] * 100:.0f}%"
+                               for attempt, counts in result["attempts"].items())
+            print(f"{candidates:>6}{result['valid_ratio'] * 100:>7.1f}%"
+                  f"{result['time_to_valid_p50'] * 1000:>9.1f}{result['time_to_valid_p95'] * 1000:>9.1f}"
+                  f"{result['upstream_calls_per_request']:>12.2f}  {rounds}")
+    finally:
+        mock.stop()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+服务热点路径微基准测试
+测量每个请求都会经过的纯Python处理函数，使用 independent_test.py 和
+storage_task_test.py 中的示例代码作为测试数据，并按阈值检测性能回退
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# 隔离数据库，避免基准测试写入正式数据
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="ai_builder_bench_"), "bench.db"))
+
+from app import AIService, GameContext, parse_game_context
+from independent_test import MockDeepSeekAPI
+from lua_safety import check_lua_code_safety
+from storage_task_test import StorageTaskSimulator
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_thresholds.json")
+
+# === 测试数据 ===
+
+CHOPPING_CODE = MockDeepSeekAPI.generate_chopping_code()
+STORAGE_CODE = StorageTaskSimulator().generate_storage_lua_code()
+REASONING = MockDeepSeekAPI.generate_reasoning()
+
+# 带说明文字和代码块的长回复（模拟真实的代码生成回复）
+LONG_CODE_COMPLETION = f"""{REASONING}
+
+```lua
+{STORAGE_CODE}
+```
+
+注意事项：
+{REASONING}"""
+
+# 没有代码块标记、需要逐行扫描的回复
+UNFENCED_CODE_COMPLETION = f"{REASONING}\n\n{CHOPPING_CODE}\n\n{REASONING}"
+
+DECISION_REPLY = """根据当前状态分析，木材储备明显不足，建议优先收集木材：
+{
+    "action": "collect_wood",
+    "reasoning": "木材只有8个，后续建设箱子和农场都需要更多木材，白天安全适合外出",
+    "priority": 0.75,
+    "message": "木材不够了，我去砍些树。"
+}
+以上是我的建议。"""
+
+MALFORMED_DECISION_REPLY = "我觉得现在应该去砍树收集一些木材，{因为库存里的木材不够用了，晚上还需要生火"
+
+REQUEST_CONTEXT = {
+    "health": 75.0, "hunger": 60.0, "sanity": 85.0,
+    "day": 5, "season": "autumn", "time_phase": "day",
+    "is_night": False, "is_dusk": False, "inventory_full": False,
+    "wood_count": 8, "stone_count": 3, "food_count": 5,
+    "has_campfire": True, "has_chest": False,
+    "base_center": {"x": 100, "z": 200},
+    "planning_progress": 0.35, "total_planned": 12,
+    "resource_needs": [
+        {"resource": "log", "shortage": 12},
+        {"resource": "rocks", "shortage": 6},
+        {"resource": "cutgrass", "shortage": 4},
+        {"resource": "twigs", "shortage": 3}
+    ],
+    "collection_targets": 3
+}
+
+
+def legacy_context_from_request(context_data: Dict) -> GameContext:
+    """旧版各路由逐字段get的构建方式，用于和 parse_game_context 对比"""
+    return GameContext(
+        health=context_data.get('health', 100),
+        hunger=context_data.get('hunger', 100),
+        sanity=context_data.get('sanity', 100),
+        day=context_data.get('day', 1),
+        season=context_data.get('season', 'autumn'),
+        time_phase=context_data.get('time_phase', 'day'),
+        is_night=context_data.get('is_night', False),
+        is_dusk=context_data.get('is_dusk', False),
+        inventory_full=context_data.get('inventory_full', False),
+        wood_count=context_data.get('wood_count', 0),
+        stone_count=context_data.get('stone_count', 0),
+        food_count=context_data.get('food_count', 0),
+        has_campfire=context_data.get('has_campfire', False),
+        has_chest=context_data.get('has_chest', False),
+        base_center=context_data.get('base_center'),
+        planning_progress=context_data.get('planning_progress'),
+        total_planned=context_data.get('total_planned'),
+        resource_needs=context_data.get('resource_needs'),
+        collection_targets=context_data.get('collection_targets')
+    )
+
+
+def build_cases(service: AIService) -> List[Tuple[str, Callable[[], object]]]:
+    """构建全部基准用例（名称, 无参函数）"""
+    context = parse_game_context(REQUEST_CONTEXT)
+    fallback_contexts = [
+        parse_game_context(dict(REQUEST_CONTEXT, health=20.0)),
+        parse_game_context(dict(REQUEST_CONTEXT, is_night=True, has_campfire=False)),
+        parse_game_context(dict(REQUEST_CONTEXT, wood_count=30, stone_count=10)),
+    ]
+
+    # 预热缓存，用于测量命中路径
+    service.validate_lua_code_safety(STORAGE_CODE)
+
+    return [
+        ("game_context_from_request", lambda: parse_game_context(REQUEST_CONTEXT)),
+        ("game_context_from_request/legacy_get", lambda: legacy_context_from_request(REQUEST_CONTEXT)),
+        ("build_context_description", lambda: service._build_context_description(context)),
+        ("parse_decision_response/realistic", lambda: service._parse_decision_response(DECISION_REPLY)),
+        ("parse_decision_response/malformed", lambda: service._parse_decision_response(MALFORMED_DECISION_REPLY)),
+        ("extract_lua_code/fenced_long", lambda: service._extract_lua_code(LONG_CODE_COMPLETION)),
+        ("extract_lua_code/unfenced", lambda: service._extract_lua_code(UNFENCED_CODE_COMPLETION)),
+        ("extract_reasoning/long", lambda: service._extract_reasoning(LONG_CODE_COMPLETION)),
+        ("validate_lua_code/uncached_chopping", lambda: check_lua_code_safety(CHOPPING_CODE)),
+        ("validate_lua_code/uncached_storage", lambda: check_lua_code_safety(STORAGE_CODE)),
+        ("validate_lua_code/cached_storage", lambda: service.validate_lua_code_safety(STORAGE_CODE)),
+        ("get_fallback_decision", lambda: [service._get_fallback_decision(c) for c in fallback_contexts]),
+    ]
+
+
+def measure(func: Callable[[], object], repeat: int, min_time: float) -> Dict[str, float]:
+    """使用timeit测量单次调用耗时（微秒）
+
+    先自动确定每轮调用次数使单轮耗时不少于min_time，再重复repeat轮，
+    以最小值作为稳定指标（受噪声影响最小），同时给出中位数和波动。
+    """
+    timer = timeit.Timer(func)
+    timer.timeit(number=10)  # 预热
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    runs = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "min_us": round(min(runs), 3),
+        "median_us": round(statistics.median(runs), 3),
+        "stdev_us": round(statistics.stdev(runs), 3) if len(runs) > 1 else 0.0,
+        "loops": number,
+    }
+
+
+def load_thresholds(path: str) -> Dict[str, float]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="服务热点路径微基准测试")
+    parser.add_argument("--repeat", type=int, default=7, help="每个用例重复轮数")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每轮最少耗时（秒）")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE, help="回退阈值文件（微秒）")
+    parser.add_argument("--baseline", help="与之前的结果JSON对比（按min_us）")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="相对基线允许的变慢比例")
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    service = AIService()
+    thresholds = load_thresholds(args.thresholds)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    print("⏱️ 服务热点路径微基准测试")
+    print(f"Python {platform.python_version()}  repeat={args.repeat}  min_time={args.min_time}s")
+    print("=" * 86)
+    print(f"{'用例':<40}{'最小µs':>10}{'中位µs':>10}{'阈值µs':>10}  状态")
+
+    results, failures = {}, []
+    gc.collect()
+    for name, func in build_cases(service):
+        if args.filter and args.filter not in name:
+            continue
+        stats = measure(func, args.repeat, args.min_time)
+        results[name] = stats
+
+        status = "✅"
+        limit = thresholds.get(name)
+        if limit is not None and stats["min_us"] > limit:
+            status = "❌ 超出阈值"
+            failures.append(name)
+        old = baseline.get(name)
+        if old and stats["min_us"] > old["min_us"] * (1 + args.tolerance):
+            status = f"❌ 比基线慢{(stats['min_us'] / old['min_us'] - 1) * 100:.0f}%"
+            failures.append(name)
+
+        limit_text = f"{limit:.1f}" if limit is not None else "-"
+        print(f"{name:<40}{stats['min_us']:>10.2f}{stats['median_us']:>10.2f}{limit_text:>10}  {status}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "timestamp": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已写入 {args.output}")
+
+    if failures:
+        print(f"⚠️  {len(failures)} 个用例出现性能回退: {sorted(set(failures))}")
+        return 1
+    print("🎉 所有用例均在阈值内")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
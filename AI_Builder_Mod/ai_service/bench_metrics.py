@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+指标采集开销基准测试
+对比完整埋点的应用与去掉埋点的应用处理 /decision 的单次请求耗时，验证指标和追踪的开销可以忽略：
+去掉埋点的应用不注册请求前后的指标/追踪钩子，并关闭指标写入
+分别测量缓存命中路径和未命中路径（每次请求前清空决策缓存，走上游调用、解析和数据库写入）；
+两个应用交替执行多轮短测试，取相邻两轮开销的中位数（各自最快一轮的比较一并输出），减少机器抖动的影响
+
+埋点的开销是每个请求固定的几十微秒，不随请求耗时变化：开销上限只检查走完整处理流程的缓存未命中路径，
+缓存命中路径（测试客户端里只有几百微秒）只输出相对比例和每请求耗时供参考
+"""
+
+import argparse
+import gc
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+
+MOCK_REPLY = """{
+    "action": "collect_wood",
+    "reasoning": "木材储备不足，优先收集木材",
+    "priority": 0.7,
+    "message": "我去收集一些木材。"
+}"""
+
+TEST_CONTEXT = {
+    "health": 75.0, "hunger": 60.0, "sanity": 85.0,
+    "day": 5, "season": "autumn", "time_phase": "day",
+    "is_night": False, "is_dusk": False, "inventory_full": False,
+    "wood_count": 8, "stone_count": 3, "food_count": 5,
+    "has_campfire": True, "has_chest": False,
+    "base_center": {"x": 100, "z": 200}
+}
+
+
+def bare_app(create_app, service):
+    """去掉埋点的应用：移除routes注册的请求前后指标/追踪钩子（响应压缩等钩子保留）"""
+    import routes
+
+    flask_app = create_app(service)
+    for hooks, hook in ((flask_app.before_request_funcs, routes._start_request_metrics),
+                        (flask_app.after_request_funcs, routes._record_request_metrics),
+                        (flask_app.teardown_request_funcs, routes._finish_request_metrics)):
+        hooks[None].remove(hook)
+    return flask_app
+
+
+def run_round(client, service, requests_per_round, miss=False):
+    """执行一轮请求，返回平均单次耗时（秒）；miss为True时每次请求前清空决策缓存"""
+    gc.collect()
+    start_time = time.perf_counter()
+    for _ in range(requests_per_round):
+        if miss:
+            service.decision_cache.clear()
+        client.post('/decision', json={"context": TEST_CONTEXT})
+    return (time.perf_counter() - start_time) / requests_per_round
+
+
+def compare(clients, service, rounds, requests_per_round, miss):
+    """埋点/无埋点交替执行，每轮交换先后顺序；返回 {"on"/"off": 每轮耗时列表}"""
+    times = {"on": [], "off": []}
+    for index in range(rounds):
+        order = ("on", "off") if index % 2 == 0 else ("off", "on")
+        for mode in order:
+            metrics.REGISTRY.enabled = mode == "on"
+            times[mode].append(run_round(clients[mode], service, requests_per_round, miss))
+    metrics.REGISTRY.enabled = True
+    return times
+
+
+def overhead(enabled, disabled):
+    return (enabled - disabled) / disabled * 100
+
+
+def paired_overhead(times):
+    """同一轮内相邻执行的开/关两次测量算一次开销，取中位数（不受轮与轮之间机器负载漂移的影响）"""
+    return statistics.median(overhead(on, off) for on, off in zip(times["on"], times["off"]))
+
+
+def paired_cost_us(times):
+    """逐轮每请求多出的耗时（微秒）的中位数"""
+    return statistics.median((on - off) * 1e6 for on, off in zip(times["on"], times["off"]))
+
+
+def bench_primitives(iterations):
+    """测量单次指标写入的耗时（纳秒）"""
+    results = {}
+    for name, op in [
+        ("counter.inc", lambda: metrics.HTTP_REQUESTS.inc("/bench", "POST", "200")),
+        ("histogram.observe", lambda: metrics.HTTP_LATENCY.observe("/bench", value=0.0123)),
+    ]:
+        start_time = time.perf_counter()
+        for _ in range(iterations):
+            op()
+        results[name] = (time.perf_counter() - start_time) / iterations * 1e9
+    return results
+
+
+def bench_contention(threads, iterations):
+    """多线程并发写入直方图的总吞吐（次/秒）"""
+    def worker():
+        for _ in range(iterations):
+            metrics.UPSTREAM_LATENCY.observe("bench", "ok", value=0.2)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start_time = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    return threads * iterations / (time.perf_counter() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="指标采集开销基准测试")
+    parser.add_argument("--rounds", type=int, default=300, help="埋点/无埋点交替的轮数")
+    parser.add_argument("--requests", type=int, default=20, help="每轮请求数")
+    parser.add_argument("--max-overhead", type=float, default=5.0, help="缓存未命中路径允许的最大开销百分比")
+    args = parser.parse_args()
+
+    # 隔离上游、数据库和后台线程，只测量服务本身的处理路径；导入app前设置，不触碰工作目录下的数据库
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ.setdefault("WARMUP_ENABLED", "0")
+    os.environ.setdefault("SPECULATION_ENABLED", "0")
+    from app import create_app, get_ai_service
+
+    service = get_ai_service()
+    service._call_deepseek = lambda *a, **kw: MOCK_REPLY
+    clients = {"on": create_app(service).test_client(), "off": bare_app(create_app, service).test_client()}
+    for client in clients.values():  # 预热
+        run_round(client, service, 20)
+        run_round(client, service, 20, miss=True)
+
+    paths = (("缓存命中", False), ("缓存未命中", True))
+    results = {path: compare(clients, service, args.rounds, args.requests, miss) for path, miss in paths}
+
+    print("📊 指标采集开销基准测试")
+    print("=" * 50)
+    for name, ns in bench_primitives(100000).items():
+        print(f"  {name:<20} {ns:8.0f} ns/次")
+    print(f"  8线程并发observe     {bench_contention(8, 20000):8.0f} 次/秒")
+
+    passed = True
+    for path, miss in paths:
+        times = results[path]
+        paired = paired_overhead(times)
+        cost = paired_cost_us(times)
+        best = overhead(min(times["on"]), min(times["off"]))
+        print()
+        print(f"  /decision {path}（{args.rounds}轮 × {args.requests}次）")
+        print(f"    完整埋点（最快/中位）: {min(times['on']) * 1e6:8.1f} / {statistics.median(times['on']) * 1e6:8.1f} µs/请求")
+        print(f"    无埋点（最快/中位）:   {min(times['off']) * 1e6:8.1f} / {statistics.median(times['off']) * 1e6:8.1f} µs/请求")
+        print(f"    最快一轮相比开销:      {best:8.2f} %")
+        limit = f"  (上限 {args.max_overhead}%)" if miss else ""
+        print(f"    逐轮开销中位数:        {paired:8.2f} %{limit}")
+        print(f"    每请求埋点耗时中位数:  {cost:8.1f} µs")
+        if miss:
+            passed = passed and paired <= args.max_overhead
+
+    print("✅ 通过" if passed else "❌ 开销超出上限")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
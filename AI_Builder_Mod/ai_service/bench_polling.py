@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+决策请求频率基准测试
+模拟若干建造者在昼夜循环中的状态变化（饥饿下降、偶发受伤、采集和建造），
+比较固定间隔轮询、按服务端建议间隔请求、事件触发（与 ai_decision_triggers.lua 相同的规则）
+三种方式的每建造者每小时请求数，以及关键事件（黄昏、入夜、进入紧急状态）发生后到下一次决策的延迟
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import AIService, parse_game_context
+from bucketing import decision_bucket_key
+from pacing import DecisionPacer
+
+# 默认世界设置：一天480秒，白天240秒、黄昏120秒、夜晚120秒
+DAY_SECONDS = 480
+DUSK_START = 240
+NIGHT_START = 360
+
+
+def phase_at(t: float) -> str:
+    offset = t % DAY_SECONDS
+    if offset < DUSK_START:
+        return "day"
+    return "dusk" if offset < NIGHT_START else "night"
+
+
+class Builder:
+    """一个建造者的状态，每秒推进一次"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.health = 100.0
+        self.hunger = rng.uniform(60, 100)
+        self.sanity = rng.uniform(70, 100)
+        self.wood = rng.randint(0, 20)
+        self.stone = rng.randint(0, 10)
+        self.food = rng.randint(0, 6)
+        self.has_campfire = False
+        self.total_planned = 6
+        self.built = 0
+        self.inventory_full = False
+        self._previous: Optional[Dict] = None
+
+    def step(self, t: float):
+        rng = self.rng
+        phase = phase_at(t)
+        self.hunger = max(0.0, self.hunger - 100 / (3 * DAY_SECONDS))
+        if rng.random() < 1 / 600:
+            self.health -= rng.uniform(15, 45)
+        if phase == "night" and not self.has_campfire:
+            self.health -= 0.2
+            self.sanity -= 0.1
+        self.health = max(1.0, min(100.0, self.health + 0.05))
+        self.sanity = max(0.0, min(100.0, self.sanity + (0.02 if phase == "day" else -0.02)))
+        if phase == "day" and rng.random() < 1 / 15:
+            self.wood += 1
+            if rng.random() < 0.3:
+                self.stone += 1
+            if rng.random() < 0.2:
+                self.food += 1
+        self.inventory_full = self.wood + self.stone + self.food >= 60
+        if self.wood >= 10 and self.stone >= 5 and self.built < self.total_planned and rng.random() < 1 / 60:
+            self.wood -= 10
+            self.stone -= 5
+            self.built += 1
+        if phase == "dusk" and not self.has_campfire and self.wood >= 5:
+            self.has_campfire = True
+            self.wood -= 5
+        if phase == "day" and t % DAY_SECONDS == 0:
+            self.has_campfire = False  # 火堆燃尽，每晚重新生火
+
+    def decide(self):
+        """决策的效果：饿了就吃，受伤就治疗（两种模式相同，只有决策时机不同）"""
+        if self.hunger < 40 and self.food > 0:
+            self.food -= 1
+            self.hunger = min(100.0, self.hunger + 35)
+        elif self.hunger < 20:
+            self.hunger += 25  # 没有存粮时就地觅食
+        if self.health < 50:
+            self.health = min(100.0, self.health + 30)
+        if self.inventory_full:
+            self.wood, self.stone, self.food = min(self.wood, 20), min(self.stone, 10), min(self.food, 10)  # 存进箱子
+
+    def context(self, t: float):
+        phase = phase_at(t)
+        return parse_game_context({
+            "health": self.health, "hunger": self.hunger, "sanity": self.sanity,
+            "day": int(t // DAY_SECONDS) + 1, "time_phase": phase,
+            "is_night": phase == "night", "is_dusk": phase == "dusk",
+            "inventory_full": self.inventory_full,
+            "wood_count": self.wood, "stone_count": self.stone, "food_count": self.food,
+            "has_campfire": self.has_campfire,
+            "planning_progress": self.built / self.total_planned, "total_planned": self.total_planned,
+        })
+
+    def events(self, t: float) -> List[str]:
+        """本秒新出现的关键事件"""
+        state = {"phase": phase_at(t), "urgent": self.health < 30 or self.hunger < 20}
+        previous, self._previous = self._previous, state
+        found = []
+        if previous is not None:
+            if state["phase"] != previous["phase"] and state["phase"] in ("dusk", "night"):
+                found.append(state["phase"])
+            if state["urgent"] and not previous["urgent"]:
+                found.append("urgent")
+        return found
+
+
+class EventTriggers:
+    """ai_decision_triggers.lua 的模拟：阈值（带滞回）、阶段变化、库存装满、建造完成，
+    去抖合并后只在决策缓存键变化（或建造完成、紧急）时触发，定时决策放宽为兜底间隔"""
+
+    THRESHOLDS = {"health": (30, 50), "hunger": (20, 40)}
+
+    def __init__(self, debounce: float = 2, min_gap: float = 5, heartbeat: float = 90,
+                 short_interval: float = 15, hysteresis: float = 2):
+        self.debounce = debounce
+        self.min_gap = min_gap
+        self.heartbeat = heartbeat
+        self.short_interval = short_interval
+        self.hysteresis = hysteresis
+        self.levels: Dict[str, int] = {}
+        self.phase: Optional[str] = None
+        self.was_full = False
+        self.built = 0
+        self.pending: Optional[Dict] = None
+        self.last_fire = float("-inf")
+        self.last_key: Optional[str] = None
+        self.stats = {"events": 0, "coalesced": 0, "unchanged": 0, "fired": 0}
+
+    def _level_events(self, stat: str, percent: float) -> List[Tuple[bool, bool]]:
+        thresholds = self.THRESHOLDS[stat]
+        new_level = sum(1 for threshold in thresholds if percent >= threshold)
+        level = self.levels.setdefault(stat, new_level)
+        if new_level < level and percent < thresholds[new_level] - self.hysteresis:
+            self.levels[stat] = new_level
+            return [(False, new_level == 0)]
+        if new_level > level and percent >= thresholds[new_level - 1] + self.hysteresis:
+            self.levels[stat] = new_level
+            return [(False, False)]
+        return []
+
+    def _raw_events(self, t: float, builder: "Builder") -> List[Tuple[bool, bool]]:
+        """本秒的事件 [(总是触发, 紧急)]"""
+        found = self._level_events("health", builder.health) + self._level_events("hunger", builder.hunger)
+        phase = phase_at(t)
+        if self.phase is not None and phase != self.phase:
+            found.append((False, False))
+        self.phase = phase
+        if builder.inventory_full and not self.was_full:
+            found.append((False, False))
+        self.was_full = builder.inventory_full
+        if builder.built > self.built:
+            found.append((True, False))
+        self.built = builder.built
+        return found
+
+    def update(self, t: float, builder: "Builder") -> bool:
+        """推进一秒，返回是否触发决策"""
+        for always, urgent in self._raw_events(t, builder):
+            self.stats["events"] += 1
+            if self.pending is not None:
+                self.stats["coalesced"] += 1
+                self.pending["always"] |= always
+                if urgent:
+                    self.pending["urgent"] = True
+                    self.pending["fire_at"] = t
+                continue
+            delay = 0 if urgent else max(self.debounce, self.last_fire + self.min_gap - t)
+            self.pending = {"always": always, "urgent": urgent, "fire_at": t + delay}
+        if self.pending is None or t < self.pending["fire_at"]:
+            return False
+        pending, self.pending = self.pending, None
+        key = decision_bucket_key(builder.context(t))
+        if not pending["always"] and not pending["urgent"] and key == self.last_key:
+            self.stats["unchanged"] += 1
+            return False
+        self.last_fire = t
+        self.stats["fired"] += 1
+        return True
+
+    def note_decision(self, t: float, builder: "Builder"):
+        self.last_key = decision_bucket_key(builder.context(t))
+
+    def timer_interval(self, interval: float) -> float:
+        return interval if interval <= self.short_interval else max(interval, self.heartbeat)
+
+
+def simulate(mode: str, builders: int, hours: float, fixed_interval: float, seed: int,
+             min_interval: float = 5.0, max_interval: float = 60.0) -> Dict:
+    """mode: fixed（固定间隔）、advised（服务端建议间隔）或 events（事件触发 + 建议间隔兜底）"""
+    pacer = DecisionPacer(min_interval, max_interval, is_urgent=AIService.is_urgent, rng=random.Random(seed))
+    duration = int(hours * 3600)
+    requests = 0
+    lags: Dict[str, List[float]] = {"dusk": [], "night": [], "urgent": []}
+    trigger_stats = {"events": 0, "coalesced": 0, "unchanged": 0, "fired": 0}
+    for index in range(builders):
+        rng = random.Random(seed * 1000 + index)
+        builder = Builder(rng)
+        next_request = rng.uniform(0, fixed_interval)  # 各建造者的起始时刻错开
+        triggers = EventTriggers() if mode == "events" else None
+        pending: List = []  # [(事件, 发生时刻)]，等待下一次决策
+        for t in range(duration):
+            builder.step(t)
+            pending.extend((event, t) for event in builder.events(t))
+            triggered = triggers is not None and triggers.update(t, builder)
+            if t < next_request and not triggered:
+                continue
+            requests += 1
+            for event, since in pending:
+                lags[event].append(t - since)
+            pending = []
+            builder.decide()
+            if mode == "fixed":
+                interval = fixed_interval
+            else:
+                interval, _ = pacer.recommend(builder.context(t))
+            if triggers is not None:
+                triggers.note_decision(t, builder)
+                interval = triggers.timer_interval(interval)
+            next_request = t + interval
+        if triggers is not None:
+            for name, count in triggers.stats.items():
+                trigger_stats[name] += count
+    return {
+        "mode": f"fixed_{fixed_interval:g}s" if mode == "fixed" else mode,
+        "requests_per_builder_hour": requests / builders / hours,
+        "lag": {event: (sum(values) / len(values) if values else 0.0, max(values, default=0))
+                for event, values in lags.items()},
+        "pacing": pacer.stats()["reasons"] if mode != "fixed" else {},
+        "triggers": trigger_stats if mode == "events" else {},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="决策请求频率基准测试")
+    parser.add_argument("--builders", type=int, default=20)
+    parser.add_argument("--hours", type=float, default=2.0)
+    parser.add_argument("--fixed", default="10,30", help="逗号分隔的固定轮询间隔（秒）")
+    parser.add_argument("--min-interval", type=float, default=5.0, help="建议间隔下限（DECISION_INTERVAL_MIN）")
+    parser.add_argument("--max-interval", type=float, default=60.0, help="建议间隔上限（DECISION_INTERVAL_MAX）")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    runs = [("fixed", float(part)) for part in args.fixed.split(",") if part.strip()]
+    runs += [("advised", 10.0), ("events", 10.0)]
+    print(f"🧪 {args.builders}个建造者，模拟{args.hours:g}小时（一天{DAY_SECONDS}秒）")
+    print(f"{'模式':<14}{'请求/建造者·小时':>16}{'黄昏延迟':>14}{'入夜延迟':>14}{'紧急延迟':>14}")
+    results = []
+    for mode, interval in runs:
+        result = simulate(mode, args.builders, args.hours, interval, args.seed,
+                          args.min_interval, args.max_interval)
+        results.append(result)
+        lag = "".join(f"{result['lag'][event][0]:>7.1f}s/{result['lag'][event][1]:>4.0f}s"
+                      for event in ("dusk", "night", "urgent"))
+        print(f"{result['mode']:<14}{result['requests_per_builder_hour']:>16.1f}{lag}")
+    print(f"建议原因分布（advised）: {results[-2]['pacing']}")
+    print(f"事件触发统计（events）: {results[-1]['triggers']}")
+    print("（延迟为 平均/最大，从事件发生到下一次决策请求）")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
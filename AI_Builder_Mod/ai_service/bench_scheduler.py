@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+上游调度器基准测试
+用固定耗时的模拟上游让代码生成、聊天、决策和紧急决策同时积压，
+统计各类别的排队耗时和放行份额（普通类别应接近权重比例），验证紧急决策不被长代码生成请求拖慢
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Dict, List
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from scheduler import DEFAULT_WEIGHTS, URGENT, UpstreamScheduler
+
+# 各类别的模拟上游耗时（秒），代码生成的回复最长
+SERVICE_TIME = {"generate_lua_code": 0.08, "chat": 0.03, "decision": 0.02, URGENT: 0.02}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(scheduler: UpstreamScheduler, clients: Dict[str, int], duration: float) -> Dict:
+    waits: Dict[str, List[float]] = {name: [] for name in clients}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(traffic_class: str, seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            if traffic_class == URGENT:
+                time.sleep(rng.uniform(0.02, 0.08))  # 紧急决策零星出现
+            waited = scheduler.acquire(traffic_class, timeout=30)
+            try:
+                time.sleep(SERVICE_TIME[traffic_class])
+            finally:
+                scheduler.release()
+            with lock:
+                waits[traffic_class].append(waited)
+
+    threads = [threading.Thread(target=client, args=(name, index * 100 + seed))
+               for index, (name, count) in enumerate(clients.items()) for seed in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    weighted_total = sum(len(values) for name, values in waits.items() if name != URGENT) or 1
+    return {
+        name: {
+            "requests": len(values),
+            "wait_p50_ms": round(percentile(values, 0.5) * 1000, 1),
+            "wait_p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            "dispatch_share": round(len(values) / weighted_total, 3) if name != URGENT else None,
+        }
+        for name, values in waits.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上游调度器基准测试")
+    parser.add_argument("--concurrency", type=int, default=4, help="上游并发上限")
+    parser.add_argument("--duration", type=float, default=5.0, help="运行秒数")
+    parser.add_argument("--clients", type=int, default=8, help="每个普通类别的并发客户端数")
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    clients = {"generate_lua_code": args.clients, "chat": args.clients, "decision": args.clients, URGENT: 2}
+    print(f"⚖️  上游并发{args.concurrency}，权重{DEFAULT_WEIGHTS}，运行{args.duration}s")
+    results = run(UpstreamScheduler(args.concurrency, DEFAULT_WEIGHTS), clients, args.duration)
+
+    print(f"{'类别':<20}{'请求数':>8}{'p50等待ms':>12}{'p95等待ms':>12}{'放行份额':>10}")
+    for name, stats in results.items():
+        share = "-" if stats["dispatch_share"] is None else f"{stats['dispatch_share']:.2f}"
+        print(f"{name:<20}{stats['requests']:>8}{stats['wait_p50_ms']:>12.1f}"
+              f"{stats['wait_p95_ms']:>12.1f}{share:>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"concurrency": args.concurrency, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
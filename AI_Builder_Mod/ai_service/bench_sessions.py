@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+会话内存基准测试
+模拟大量NPC持续对话，用tracemalloc观察会话表的内存占用：
+会话数和单会话历史都有上限，内存应在达到上限后保持平稳
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import GAME_CONTEXT_FIELDS, parse_game_context
+from sessions import SessionResyncRequired, SessionStore
+
+PLAYER_LINES = ["木头还够吗？", "今晚要不要多点一堆火？", "我们去采点浆果吧", "基地的箱子满了",
+                "Can you build a chest near the campfire?", "冬天快到了，准备得怎么样"]
+ASSISTANT_LINES = ["木材还差一些，我先去砍树。", "好的，我会在天黑前把火堆点上。",
+                   "附近有几丛浆果，我这就去采。", "I'll place a new chest next to the fire pit."]
+
+
+def base_context(rng: random.Random) -> dict:
+    return {
+        "health": rng.uniform(50, 100), "hunger": rng.uniform(30, 100), "sanity": rng.uniform(40, 100),
+        "day": rng.randint(1, 70), "season": "autumn", "time_phase": "day",
+        "wood_count": rng.randint(0, 20), "stone_count": rng.randint(0, 10), "food_count": rng.randint(0, 8),
+        "base_center": {"x": 0.0, "y": 0.0, "z": 0.0}
+    }
+
+
+def run(npcs: int, rounds: int, max_sessions: int, checkpoints: int) -> list:
+    rng = random.Random(7)
+    store = SessionStore(parse_game_context, [field.name for field in GAME_CONTEXT_FIELDS],
+                         max_sessions=max_sessions, idle_timeout=1e9)
+    versions = {}
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    samples = []
+    step = max(1, rounds // checkpoints)
+    for round_index in range(1, rounds + 1):
+        for npc in range(npcs):
+            entity_id = f"ed{npc}"
+            version = versions.get(entity_id, 0) + 1
+            versions[entity_id] = version
+            try:
+                store.apply(entity_id, version, delta={"wood_count": rng.randint(0, 20)})
+            except SessionResyncRequired:
+                # 首轮或会话已被淘汰：重新发送完整上下文
+                store.apply(entity_id, version, context=base_context(rng))
+            store.record_turn(entity_id, "player", rng.choice(PLAYER_LINES))
+            store.record_turn(entity_id, "assistant", rng.choice(ASSISTANT_LINES))
+            action = rng.choice(["collect_wood", "collect_food", "build_campfire"])
+            store.record_turn(entity_id, "decision", f"{action}：{rng.choice(ASSISTANT_LINES)}", topic=action)
+        if round_index % step == 0 or round_index == rounds:
+            current = tracemalloc.get_traced_memory()[0] - baseline
+            stats = store.stats()
+            samples.append({
+                "round": round_index,
+                "turns": round_index * npcs * 3,
+                "sessions": stats["sessions"],
+                "traced_kb": round(current / 1024, 1),
+                "session_kb": round(stats["session_bytes"] / 1024, 1),
+            })
+            print(f"{round_index:>6}{samples[-1]['turns']:>10}{stats['sessions']:>8}"
+                  f"{samples[-1]['traced_kb']:>12.1f}{samples[-1]['session_kb']:>12.1f}")
+    tracemalloc.stop()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话内存基准测试")
+    parser.add_argument("--npcs", type=int, default=3000, help="同时对话的NPC数量")
+    parser.add_argument("--rounds", type=int, default=40, help="每个NPC的对话轮数")
+    parser.add_argument("--max-sessions", type=int, default=4096, help="会话数上限（小于NPC数量时会持续LRU淘汰）")
+    parser.add_argument("--checkpoints", type=int, default=8, help="采样次数")
+    parser.add_argument("--max-growth", type=float, default=0.1,
+                        help="历史填满后（后半程）允许的内存增长比例，超过时返回非0")
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    print(f"🧠 {args.npcs}个NPC × {args.rounds}轮，会话上限{args.max_sessions}")
+    print(f"{'轮次':>6}{'记录数':>10}{'会话':>8}{'追踪KB':>12}{'会话KB':>12}")
+    samples = run(args.npcs, args.rounds, args.max_sessions, args.checkpoints)
+
+    # 历史在十几轮内填满，后半程的内存应基本不变
+    middle = samples[len(samples) // 2]
+    growth = (samples[-1]["traced_kb"] - middle["traced_kb"]) / max(middle["traced_kb"], 1)
+    print(f"\n后半程内存增长: {growth * 100:.1f}%")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"npcs": args.npcs, "rounds": args.rounds, "max_sessions": args.max_sessions,
+                       "samples": samples, "growth": round(growth, 4)}, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已写入 {args.output}")
+
+    if growth > args.max_growth:
+        print("❌ 会话内存未保持平稳")
+        sys.exit(1)
+    print("✅ 会话内存保持平稳")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+服务启动耗时基准测试
+在全新的解释器中分别测量：导入核心模块、构建Flask应用，以及从启动进程到 /ping 可用的总耗时
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 在子进程中执行，输出耗时（秒）和已加载的重量级依赖
+IMPORT_SNIPPET = """
+import sys, time, json
+start = time.perf_counter()
+import app
+{extra}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in ("flask", "requests", "werkzeug") if m in sys.modules]}}))
+"""
+
+SERVE_SNIPPET = (
+    "import logging; logging.disable(logging.ERROR); import app; "
+    "app.create_app().run(host='127.0.0.1', port={port}, threaded=True)"
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _child_env(tmpdir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["DATABASE_PATH"] = os.path.join(tmpdir, "startup.db")
+    env.pop("SHARED_CACHE_PATH", None)
+    return env
+
+
+def measure_import(extra: str, env: Dict[str, str]) -> Dict:
+    """在新进程中测量导入（及可选的额外步骤）耗时"""
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(extra=extra)],
+        cwd=SERVICE_DIR, env=env, stderr=subprocess.DEVNULL
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def measure_ready(env: Dict[str, str], timeout: float = 30.0) -> float:
+    """启动服务进程，轮询 /ping 直到返回200，返回耗时（秒）"""
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", SERVE_SNIPPET.format(port=port)],
+                               cwd=SERVICE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"服务进程提前退出（返回码 {process.returncode}）")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/ping")
+                if conn.getresponse().status == 200:
+                    return time.perf_counter() - start
+            except OSError:
+                pass
+            finally:
+                conn.close()
+            time.sleep(0.005)
+        raise TimeoutError(f"服务在{timeout}秒内未就绪")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "min_ms": round(min(samples) * 1000, 1),
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="服务启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="每项测量的次数")
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    env = _child_env(tempfile.mkdtemp(prefix="ai_builder_startup_"))
+
+    print("🚀 服务启动耗时基准测试")
+    print("=" * 60)
+
+    results = {}
+    core_loaded = []
+    for name, extra in (("import_core", ""),
+                        ("import_and_create_app", "app.create_app()")):
+        samples = []
+        for _ in range(args.runs):
+            sample = measure_import(extra, env)
+            samples.append(sample["elapsed"])
+            if name == "import_core":
+                core_loaded = sample["loaded"]
+        results[name] = summarize(samples)
+
+    results["ready_to_serve_ping"] = summarize([measure_ready(env) for _ in range(args.runs)])
+
+    for name, stats in results.items():
+        print(f"{name:<28} 最小 {stats['min_ms']:>8.1f}ms  中位 {stats['median_ms']:>8.1f}ms  最大 {stats['max_ms']:>8.1f}ms")
+    print(f"导入核心模块时已加载的重量级依赖: {core_loaded or '无'}")
+    database_created = os.path.exists(env["DATABASE_PATH"])
+    print(f"仅导入/启动后数据库文件已创建: {'是' if database_created else '否'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "timestamp": datetime.now().isoformat(),
+                "runs": args.runs,
+                "core_loaded_modules": core_loaded,
+                "database_created": database_created,
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
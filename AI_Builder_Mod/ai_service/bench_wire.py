@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+传输格式基准测试
+对比各编码（JSON、orjson、MessagePack，以及gzip/deflate压缩）下典型请求和响应的
+负载大小与序列化/反序列化耗时
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from independent_test import MockDeepSeekAPI
+from storage_task_test import StorageTaskSimulator
+from wire import compress, decompress, msgpack, orjson
+
+PREFABS = ["evergreen", "sapling", "grass", "rock1", "berrybush", "flint", "twigs", "pond", "rabbithole", "spiderden"]
+
+
+def code_generation_request(entity_count: int = 30) -> Dict:
+    """AIManager:RequestAICodeGeneration 发送的请求（附近实体数量决定大小）"""
+    rng = random.Random(42)
+    return {
+        "task_type": "building",
+        "character_state": {
+            "health": 112.5, "hunger": 96.0, "sanity": 143.2,
+            "position": {"x": 312.4, "y": 0.0, "z": -87.9},
+            "inventory_full": False,
+            "current_tool": {"prefab": "axe", "uses": 71, "tool_type": "axe"},
+            "time_of_day": 0.37
+        },
+        "environment_info": {
+            "season": "autumn", "weather": 0.0, "time_remaining": 4.2, "ground_type": 6,
+            "nearby_entities": [
+                {
+                    "prefab": rng.choice(PREFABS),
+                    "distance": round(rng.uniform(1, 225), 2),
+                    "position": {"x": round(rng.uniform(290, 330), 2), "y": 0.0, "z": round(rng.uniform(-110, -60), 2)}
+                }
+                for _ in range(entity_count)
+            ]
+        },
+        "available_resources": {"log": 8, "rocks": 3, "cutgrass": 12, "twigs": 9, "flint": 2, "berries": 5},
+        "current_needs": [
+            {"type": "food", "urgency": 0.7, "value": 96.0},
+            {"type": "resource", "resource_type": "log", "urgency": 0.3, "value": 8},
+            {"type": "resource", "resource_type": "rocks", "urgency": 0.15, "value": 3}
+        ],
+        "context": {
+            "health": 75.0, "hunger": 60.0, "sanity": 71.6, "day": 12, "season": "autumn",
+            "time_phase": "day", "is_night": False, "is_dusk": False, "inventory_full": False,
+            "wood_count": 8, "stone_count": 3, "food_count": 5, "has_campfire": True, "has_chest": False,
+            "base_center": {"x": 300.0, "y": 0.0, "z": -80.0}
+        }
+    }
+
+
+def code_generation_response() -> Dict:
+    """/generate_lua_code 的响应（完整Lua代码 + 推理说明）"""
+    return {
+        "success": True,
+        "lua_code": StorageTaskSimulator().generate_storage_lua_code(),
+        "reasoning": MockDeepSeekAPI.generate_reasoning(),
+        "task_type": "building",
+        "timestamp": "2024-05-01T12:00:00.000000"
+    }
+
+
+def decision_response() -> Dict:
+    return {
+        "action": "collect_wood",
+        "reasoning": "木材储备不足，优先收集木材以满足后续建设需求",
+        "priority": 0.7,
+        "message": "我去收集一些木材，咱们的建设需要更多材料。",
+        "source": "deepseek",
+        "confidence": 0.9
+    }
+
+
+def build_formats() -> List[Tuple[str, Callable[[Dict], bytes], Callable[[bytes], Dict]]]:
+    """(名称, 编码函数, 解码函数)，未安装的可选依赖对应的格式会被跳过"""
+    formats = [
+        ("json", lambda obj: json.dumps(obj, ensure_ascii=False).encode("utf-8"), json.loads),
+    ]
+    if orjson is not None:
+        formats.append(("orjson", orjson.dumps, orjson.loads))
+    if msgpack is not None:
+        formats.append(("msgpack", msgpack.packb, lambda data: msgpack.unpackb(data, raw=False)))
+
+    compressed = []
+    for name, encode, decode in formats:
+        for encoding in ("gzip", "deflate"):
+            compressed.append((
+                f"{name}+{encoding}",
+                lambda obj, encode=encode, encoding=encoding: compress(encode(obj), encoding),
+                lambda data, decode=decode, encoding=encoding: decode(decompress(data, encoding)),
+            ))
+    return formats + compressed
+
+
+def measure_us(func: Callable[[], object], repeat: int) -> float:
+    """单次调用耗时（微秒，多轮取最小值）"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传输格式基准测试")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复轮数")
+    parser.add_argument("--entities", type=int, default=30, help="代码生成请求中附近实体数量")
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    payloads = {
+        "generate_lua_code请求": code_generation_request(args.entities),
+        "generate_lua_code响应": code_generation_response(),
+        "decision响应": decision_response(),
+    }
+    formats = build_formats()
+    if msgpack is None:
+        print("ℹ️  未安装msgpack，跳过MessagePack格式（pip install msgpack）")
+    if orjson is None:
+        print("ℹ️  未安装orjson，跳过orjson格式（pip install orjson）")
+
+    results = {}
+    for payload_name, payload in payloads.items():
+        print(f"\n📦 {payload_name}")
+        print(f"{'格式':<20}{'字节':>8}{'相对JSON':>10}{'编码µs':>10}{'解码µs':>10}")
+        baseline_size = None
+        results[payload_name] = {}
+        for name, encode, decode in formats:
+            data = encode(payload)
+            if decode(data) != payload:
+                raise AssertionError(f"{name} 往返结果不一致")
+            size = len(data)
+            baseline_size = baseline_size or size
+            stats = {
+                "bytes": size,
+                "ratio": round(size / baseline_size, 3),
+                "encode_us": round(measure_us(lambda: encode(payload), args.repeat), 2),
+                "decode_us": round(measure_us(lambda: decode(data), args.repeat), 2),
+            }
+            results[payload_name][name] = stats
+            print(f"{name:<20}{size:>8}{stats['ratio']:>10.2f}{stats['encode_us']:>10.1f}{stats['decode_us']:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"entities": args.entities, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
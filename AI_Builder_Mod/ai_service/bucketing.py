@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# AI建设助手决策缓存键分档规则
+# 服务端和Lua客户端的决策缓存必须用同一套分档，否则同一状态在两边落到不同的键：
+# 这里是唯一的定义（带版本号），Python键函数由它生成，Lua模块也由它生成
+#   python bucketing.py --lua ../scripts/ai_bucketing.lua    重新生成Lua模块
+#   python bucketing.py --check ../scripts/ai_bucketing.lua  检查Lua模块是否与规则一致
+
+import argparse
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from context_schema import GAME_CONTEXT_FIELDS
+
+# 分档字段、档宽或上限变化时必须加1：旧版本的缓存键全部失效，客户端也能发现规则不一致
+BUCKET_SPEC_VERSION = 1
+
+
+@dataclass(frozen=True)
+class BucketField:
+    """分档字段定义
+
+    kind:
+    - value：原样使用（季节、时段）
+    - band：先截断到cap（未设置则不截断），再按width分档，取 floor(值 / width)
+    - flag：布尔值，取0或1
+    """
+    name: str
+    kind: str
+    width: Optional[float] = None
+    cap: Optional[float] = None
+
+
+# 分档边界与后备规则的阈值对齐（生命30、饥饿20、木材10、石头5），
+# 保证缓存命中不会跨越规则引擎认为不同的状态
+DECISION_BUCKETS = (
+    BucketField("season", "value"),
+    BucketField("time_phase", "value"),
+    BucketField("health", "band", 10),
+    BucketField("hunger", "band", 10),
+    BucketField("sanity", "band", 20),
+    BucketField("wood_count", "band", 5, 30),
+    BucketField("stone_count", "band", 5, 20),
+    BucketField("food_count", "band", 5, 20),
+    BucketField("inventory_full", "flag"),
+    BucketField("has_campfire", "flag"),
+    BucketField("has_chest", "flag"),
+)
+
+_CONTEXT_FIELDS = {field.name: field for field in GAME_CONTEXT_FIELDS}
+
+
+def band_width(name: str, spec=DECISION_BUCKETS) -> float:
+    """字段的档宽（预测下一档等场景使用）"""
+    for field in spec:
+        if field.name == name and field.kind == "band":
+            return field.width
+    raise KeyError(f"{name}不是分档字段")
+
+
+def _check_spec(spec):
+    for field in spec:
+        if field.name not in _CONTEXT_FIELDS:
+            raise ValueError(f"分档字段{field.name}不在上下文字段定义中")
+        if field.kind not in ("value", "band", "flag"):
+            raise ValueError(f"未知的分档类型: {field.kind}")
+        if field.kind == "band" and not field.width:
+            raise ValueError(f"分档字段{field.name}缺少档宽")
+
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+def compile_bucket_key(spec=DECISION_BUCKETS, version: int = BUCKET_SPEC_VERSION) -> Callable[[Any], str]:
+    """根据分档规则生成键函数 bucket_key(context) -> "v1|autumn|day|8|..."
+
+    输入是已解析的GameContext（类型和范围已校验），生成的函数没有逐字段的循环和分派。
+    """
+    _check_spec(spec)
+    parts = []
+    for field in spec:
+        attr = f"context.{field.name}"
+        if field.kind == "value":
+            parts.append(f"str({attr})")
+        elif field.kind == "flag":
+            parts.append(f"('1' if {attr} else '0')")
+        elif field.cap is not None:
+            parts.append(f"str(int(min({attr}, {_number(field.cap)}) // {_number(field.width)}))")
+        else:
+            parts.append(f"str(int({attr} // {_number(field.width)}))")
+    source = "\n".join([
+        "def bucket_key(context):",
+        f"    return '|'.join(({('v' + str(version))!r}, {', '.join(parts)}))",
+    ])
+    namespace: Dict[str, Any] = {}
+    exec(compile(source, "<bucket_key>", "exec"), namespace)
+    bucket_key = namespace["bucket_key"]
+    bucket_key.__source__ = source
+    return bucket_key
+
+
+decision_bucket_key = compile_bucket_key()
+
+
+def lua_source(spec=DECISION_BUCKETS, version: int = BUCKET_SPEC_VERSION) -> str:
+    """生成Lua模块：分档规则表和 BucketKey(context)
+
+    客户端上下文未经服务端的解析，缺失字段取上下文字段定义的默认值，数字裁剪到同样的取值范围，
+    布尔值按1/0计数（与服务端的类型转换一致）。
+    """
+    _check_spec(spec)
+    lines = [
+        "-- AI决策缓存键分档规则",
+        f"-- 由 ai_service/bucketing.py 生成（规则版本 {version}），请勿手动修改：",
+        "--   python bucketing.py --lua ../scripts/ai_bucketing.lua",
+        "",
+        "local AIBucketing = {}",
+        "",
+        f"AIBucketing.VERSION = {version}",
+        "",
+        "AIBucketing.FIELDS = {",
+    ]
+    for field in spec:
+        context_field = _CONTEXT_FIELDS[field.name]
+        entry = [f'name = "{field.name}"', f'kind = "{field.kind}"']
+        if isinstance(context_field.default, bool):
+            entry.append(f"default = {'true' if context_field.default else 'false'}")
+        elif isinstance(context_field.default, (int, float)):
+            entry.append(f"default = {_number(context_field.default)}")
+        elif isinstance(context_field.default, str):
+            entry.append(f'default = "{context_field.default}"')
+        if field.kind == "band":
+            entry.append(f"width = {_number(field.width)}")
+            for key, value in (("cap", field.cap), ("minimum", context_field.minimum),
+                               ("maximum", context_field.maximum)):
+                if value is not None:
+                    entry.append(f"{key} = {_number(value)}")
+        lines.append("    { " + ", ".join(entry) + " },")
+    lines += [
+        "}",
+        "",
+        "local function ToNumber(value, default)",
+        "    if type(value) == \"boolean\" then",
+        "        return value and 1 or 0",
+        "    end",
+        "    return tonumber(value) or default",
+        "end",
+        "",
+        "local function Band(field, value)",
+        "    value = ToNumber(value, field.default)",
+        "    if field.minimum and value < field.minimum then value = field.minimum end",
+        "    if field.maximum and value > field.maximum then value = field.maximum end",
+        "    if field.cap and value > field.cap then value = field.cap end",
+        "    return math.floor(value / field.width)",
+        "end",
+        "",
+        "-- 决策缓存键，与服务端返回的cache_key一致",
+        "function AIBucketing.BucketKey(context)",
+        "    local parts = { \"v\" .. AIBucketing.VERSION }",
+        "    for _, field in ipairs(AIBucketing.FIELDS) do",
+        "        local value = context[field.name]",
+        "        if value == nil then",
+        "            value = field.default",
+        "        end",
+        "        if field.kind == \"band\" then",
+        "            value = Band(field, value)",
+        "        elseif field.kind == \"flag\" then",
+        "            value = (value and value ~= 0) and 1 or 0",
+        "        end",
+        "        table.insert(parts, tostring(value))",
+        "    end",
+        "    return table.concat(parts, \"|\")",
+        "end",
+        "",
+        "return AIBucketing",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="决策缓存键分档规则")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--lua", metavar="PATH", help="生成Lua模块")
+    group.add_argument("--check", metavar="PATH", help="检查Lua模块是否与当前规则一致")
+    args = parser.parse_args()
+
+    source = lua_source()
+    if args.lua:
+        with open(args.lua, "w", encoding="utf-8", newline="\n") as f:
+            f.write(source)
+        print(f"📄 已生成 {args.lua}（规则版本 {BUCKET_SPEC_VERSION}）")
+        return 0
+    try:
+        with open(args.check, encoding="utf-8") as f:
+            current = f.read()
+    except FileNotFoundError:
+        current = ""
+    if current != source:
+        print(f"❌ {args.check} 与分档规则版本 {BUCKET_SPEC_VERSION} 不一致，请重新生成")
+        return 1
+    print(f"✅ {args.check} 与分档规则版本 {BUCKET_SPEC_VERSION} 一致")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+# AI建设助手缓存工具
+# 提供进程内LRU缓存、跨进程共享的SQLite缓存和内容哈希
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def content_hash(text: str) -> str:
+    """计算文本内容的强哈希（SHA-256）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """线程安全的LRU缓存，可选过期时间"""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，命中时刷新其LRU位置"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def contains(self, key: str) -> bool:
+        """是否有未过期的条目（不计入命中统计，也不刷新LRU位置）"""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] >= time.time())
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        ttl = self.ttl if ttl is None else ttl
+        self.set_until(key, value, time.time() + ttl if ttl else None)
+
+    def set_until(self, key: str, value: Any, expires_at: Optional[float]):
+        """写入缓存并指定绝对过期时间（None为不过期），用于从共享缓存回填剩余寿命"""
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+class SqliteCache:
+    """基于SQLite（WAL模式）的跨进程共享缓存，值以JSON存储
+
+    多个工作进程打开同一个数据库文件即可共享缓存条目。
+    容量按写入顺序近似淘汰：每写入一定次数检查一次条目数，删除最早写入的部分。
+    """
+
+    def __init__(self, path: str, namespace: str, max_size: int = 10000,
+                 ttl: Optional[float] = None, trim_interval: int = 100):
+        self.path = path
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.trim_interval = trim_interval
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        # 每个线程独立连接；fork后的子进程不能复用父进程的连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._ensure_schema(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_schema(self, conn: sqlite3.Connection):
+        # 首次打开连接时建表，创建缓存对象本身不访问数据库
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        """读取未过期的条目，返回(值, 绝对过期时间)"""
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def contains(self, key: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM cache_entries WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (self.namespace, key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None, now)
+        )
+        self._writes += 1
+        if self._writes % self.trim_interval == 0:
+            self._trim(conn, now)
+
+    def _trim(self, conn: sqlite3.Connection, now: float):
+        """删除过期条目，并把条目数控制在max_size以内"""
+        conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND expires_at < ?", (self.namespace, now))
+        conn.execute('''
+            DELETE FROM cache_entries WHERE namespace = ? AND key IN (
+                SELECT key FROM cache_entries WHERE namespace = ?
+                ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.namespace, self.namespace, self.max_size))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+class TieredCache:
+    """两级缓存：进程内LRU在前，共享缓存在后
+
+    本地命中无需访问共享存储；本地未命中时查询共享缓存并回填本地，
+    因此一个工作进程写入的结果其他进程也能复用。回填沿用共享条目的过期时间，
+    不会让快过期的条目在本地重新获得完整的TTL。
+    """
+
+    def __init__(self, local: LRUCache, shared: SqliteCache):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        entry = self.shared.get_entry(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        self.local.set_until(key, value, expires_at)
+        return value
+
+    def contains(self, key: str) -> bool:
+        return self.local.contains(key) or self.shared.contains(key)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl)
+        self.shared.set(key, value, ttl)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def __len__(self) -> int:
+        return len(self.shared)
+
+    def stats(self) -> Dict[str, Any]:
+        local = self.local.stats()
+        shared = self.shared.stats()
+        hits = local["hits"] + shared["hits"]
+        total = local["hits"] + local["misses"]
+        return {
+            "size": local["size"],
+            "max_size": local["max_size"],
+            "shared_size": shared["size"],
+            "hits": hits,
+            "misses": shared["misses"],
+            "local_hits": local["hits"],
+            "shared_hits": shared["hits"],
+            "hit_ratio": hits / total if total else 0.0
+        }
+
+
+def make_cache(namespace: str, max_size: int, ttl: Optional[float] = None,
+               shared_path: Optional[str] = None):
+    """创建缓存：配置了共享路径时返回两级缓存，否则返回进程内LRU缓存"""
+    local = LRUCache(max_size=max_size, ttl=ttl)
+    if not shared_path:
+        return local
+    return TieredCache(local, SqliteCache(shared_path, namespace, max_size=max_size * 4, ttl=ttl))
@@ -0,0 +1,127 @@
+# AI建设助手聊天回复索引
+# 玩家反复说同几句话（"帮我建个基地"、"现在情况怎么样"）：按归一化后的消息和粗粒度状态分档
+# 保存最近几条上游回复，攒够几种说法后随机挑一条在本地回复，既省掉上游调用又不会句句相同
+
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# 去掉标点、空白和句尾语气词后再比较："现在情况怎么样？" 与 "现在情况怎么样呀" 视为同一句
+_PUNCTUATION = re.compile(r"[\s\W_]+", re.UNICODE)
+_TRAILING_PARTICLES = re.compile(r"[吗呢吧啊呀哦嘛啦]+$")
+
+
+def normalize_message(message: str) -> str:
+    """消息归一化：全角转半角、转小写、去标点空白和句尾语气词"""
+    text = unicodedata.normalize("NFKC", message).lower()
+    text = _PUNCTUATION.sub("", text)
+    return _TRAILING_PARTICLES.sub("", text)
+
+
+class _Entry:
+    __slots__ = ("answers", "last_served")
+
+    def __init__(self):
+        self.answers: List[List[Any]] = []  # [[回复, 写入时间], ...]，新的在后
+        self.last_served: Optional[str] = None
+
+
+class ChatResponseIndex:
+    """聊天回复索引
+
+    - 键为 归一化消息 + 状态分档，超过max_message_chars的消息不进入索引（长句很少重复）
+    - 每个键最多保留pool_size条不同的上游回复，超过ttl秒的回复失效
+    - 攒够min_variants条后本地回复：随机挑选，尽量不与上次相同；
+      仍有refresh_rate的概率回源，用新回复替换最旧的一条，让说法慢慢更新
+    - 键数不超过max_keys（最近使用淘汰）
+    """
+
+    def __init__(self, max_keys: int = 1024, pool_size: int = 4, min_variants: int = 3, ttl: float = 1800.0,
+                 refresh_rate: float = 0.1, max_message_chars: int = 40, rng: Optional[random.Random] = None):
+        self.max_keys = max_keys
+        self.pool_size = pool_size
+        self.min_variants = min_variants
+        self.ttl = ttl
+        self.refresh_rate = refresh_rate
+        self.max_message_chars = max_message_chars
+        self._rng = rng or random.Random()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, message: str, bucket: str) -> Optional[str]:
+        """索引键，消息为空或过长时返回None"""
+        normalized = normalize_message(message)
+        if not normalized or len(normalized) > self.max_message_chars:
+            return None
+        return f"{bucket}|{normalized}"
+
+    def _live_answers(self, entry: _Entry, now: float) -> List[List[Any]]:
+        entry.answers = [answer for answer in entry.answers if now - answer[1] < self.ttl]
+        return entry.answers
+
+    def lookup(self, key: str, min_variants: Optional[int] = None) -> Optional[str]:
+        """本地回复：说法不足min_variants种或抽中回源时返回None（计为未命中）"""
+        min_variants = self.min_variants if min_variants is None else min_variants
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            answers = self._live_answers(entry, now) if entry is not None else []
+            if len(answers) < max(1, min_variants) or self._rng.random() < self.refresh_rate:
+                self.misses += 1
+                return None
+            choices = [text for text, _ in answers if text != entry.last_served] or [answers[0][0]]
+            text = self._rng.choice(choices)
+            entry.last_served = text
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def any_answer(self, key: str) -> Optional[str]:
+        """上游失败时使用：只要有未过期的回复就返回一条（不计入命中统计）"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            answers = self._live_answers(entry, now)
+            return self._rng.choice(answers)[0] if answers else None
+
+    def add(self, key: str, text: str):
+        """记录一条上游回复：相同回复只刷新时间，超过pool_size时丢弃最旧的"""
+        text = text.strip()
+        if not text:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+                while len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            entry.answers = [answer for answer in entry.answers if answer[0] != text]
+            entry.answers.append([text, now])
+            del entry.answers[:-self.pool_size]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        with self._lock:
+            answers = sum(len(entry.answers) for entry in self._entries.values())
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_keys,
+            "answers": answers,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
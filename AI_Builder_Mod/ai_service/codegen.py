@@ -0,0 +1,191 @@
+# AI建设助手代码生成流水线
+# 上游生成的代码如果在客户端安全检查失败，要再走一整个来回：
+# 服务端先验证，未通过时把错误交给上游修复（有次数上限）；
+# 可选同时以不同temperature生成K个候选，第一个通过验证的胜出，其余结果丢弃
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+import tracing
+from scheduler import LoadShed
+
+
+class CodegenFailed(Exception):
+    """所有候选和修复都未得到通过验证的代码"""
+
+    def __init__(self, attempts: int, errors: List[str]):
+        self.attempts = attempts
+        self.errors = errors
+        super().__init__(f"{attempts}轮生成均未通过验证: {'; '.join(errors[:3])}")
+
+
+class _Cancelled(Exception):
+    """已有候选胜出，未开始的候选不再请求上游"""
+
+
+def parse_temperatures(spec: str) -> List[float]:
+    """解析 "0.3,0.5,0.7" 格式的候选temperature列表"""
+    return [float(part) for part in spec.split(",") if part.strip()] or [0.3]
+
+
+class CodegenPipeline:
+    """生成 → 验证 → 修复
+
+    - 第1轮同时生成candidates个候选（temperature依次取temperatures），第一个通过安全检查的候选胜出；
+      尚未发出的候选取消，已发出的上游请求无法中断，其结果被丢弃
+    - 没有候选通过时，取第一个未通过的候选连同错误交给上游修复，最多max_repairs轮
+    - 记录每轮的通过率和得到有效代码的端到端耗时
+    """
+
+    def __init__(self, service, candidates: int = 1, temperatures: Optional[List[float]] = None,
+                 max_repairs: int = 1):
+        self.service = service
+        self.candidates = max(1, candidates)
+        self.temperatures = temperatures or [0.3]
+        self.max_repairs = max_repairs
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._rounds: Dict[int, Dict[str, int]] = {}
+        self._valid = 0
+        self._failed = 0
+        self._time_to_valid = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.candidates * 4,
+                                                        thread_name_prefix="codegen")
+        return self._executor
+
+    def run(self, instruction: str, context, task_type: str, match=None,
+            traffic_class: Optional[str] = None, wait_slot: bool = True) -> Tuple[str, str]:
+        """返回通过验证的 (代码, 说明)，全部失败时抛出CodegenFailed（或上游异常）"""
+        start = time.perf_counter()
+        valid, invalid, errors = self._race(instruction, context, task_type, match, traffic_class, wait_slot)
+        attempt = 1
+        while valid is None and invalid is not None and attempt <= self.max_repairs:
+            attempt += 1
+            lua_code, reasoning, problems = invalid
+            try:
+                repaired = self.service._request_lua_repair(instruction, lua_code, problems,
+                                                            traffic_class=traffic_class, wait=wait_slot)
+            except LoadShed:
+                raise
+            except Exception as e:
+                self._count(attempt, "error")
+                errors.append(str(e))
+                break
+            result = self.service.validate_lua_code_safety(repaired[0])
+            if result["is_safe"]:
+                self._count(attempt, "valid")
+                valid = (repaired[0], repaired[1] or reasoning)
+            else:
+                self._count(attempt, "invalid")
+                invalid = (repaired[0], repaired[1] or reasoning, result["errors"])
+                errors.extend(result["errors"])
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if valid is not None:
+                self._valid += 1
+                self._time_to_valid += elapsed
+            else:
+                self._failed += 1
+        metrics.CODEGEN_TIME_TO_VALID.observe("valid" if valid is not None else "failed", value=elapsed)
+        if valid is None:
+            raise CodegenFailed(attempt, errors)
+        return valid
+
+    def _race(self, instruction, context, task_type, match, traffic_class, wait_slot):
+        """第1轮：返回 (第一个有效候选, 第一个无效候选及错误, 错误列表)"""
+        if self.candidates == 1:
+            outcomes = [self._candidate(instruction, context, task_type, match, self.temperatures[0],
+                                        traffic_class, wait_slot, None)]
+            return self._collect(outcomes)
+
+        cancel = threading.Event()
+        executor = self._get_executor()
+        trace = tracing.current_trace()  # 候选在线程池中执行，带上当前请求的追踪
+        pending = {executor.submit(tracing.run_in_trace, trace, self._candidate,
+                                   instruction, context, task_type, match,
+                                   self.temperatures[index % len(self.temperatures)],
+                                   traffic_class, wait_slot, cancel)
+                   for index in range(self.candidates)}
+        outcomes = []
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    outcomes.append(future.result())
+                if any(outcome[0] == "valid" for outcome in outcomes):
+                    break
+        finally:
+            cancel.set()
+            for future in pending:
+                future.cancel()
+        return self._collect(outcomes)
+
+    def _candidate(self, instruction, context, task_type, match, temperature, traffic_class, wait_slot,
+                   cancel: Optional[threading.Event]):
+        if cancel is not None and cancel.is_set():
+            return "cancelled", None
+        try:
+            lua_code, reasoning = self.service._request_lua_code(instruction, context, task_type,
+                                                                 traffic_class=traffic_class, wait=wait_slot,
+                                                                 match=match, temperature=temperature)
+        except Exception as e:
+            self._count(1, "error")
+            return "error", e
+        result = self.service.validate_lua_code_safety(lua_code)
+        if result["is_safe"]:
+            self._count(1, "valid")
+            return "valid", (lua_code, reasoning)
+        self._count(1, "invalid")
+        return "invalid", (lua_code, reasoning, result["errors"])
+
+    @staticmethod
+    def _collect(outcomes) -> Tuple[Optional[Tuple[str, str]], Optional[Tuple[str, str, List[str]]], List[str]]:
+        valid = invalid = None
+        errors: List[str] = []
+        failures: List[Exception] = []
+        for kind, value in outcomes:
+            if kind == "valid" and valid is None:
+                valid = value
+            elif kind == "invalid":
+                invalid = invalid or value
+                errors.extend(value[2])
+            elif kind == "error":
+                failures.append(value)
+                errors.append(str(value))
+        if valid is None and invalid is None and failures:
+            # 没有任何候选拿到上游回复：按原异常处理（准入控制拒绝、排队超时等）
+            shed = [failure for failure in failures if isinstance(failure, LoadShed)]
+            raise shed[0] if len(shed) == len(failures) else failures[0]
+        return valid, invalid, errors
+
+    def _count(self, attempt: int, outcome: str):
+        metrics.CODEGEN_ATTEMPTS.inc(str(attempt), outcome)
+        with self._lock:
+            counts = self._rounds.setdefault(attempt, {"valid": 0, "invalid": 0, "error": 0})
+            counts[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rounds = {}
+            for attempt, counts in sorted(self._rounds.items()):
+                total = sum(counts.values())
+                rounds[str(attempt)] = dict(counts, success_rate=counts["valid"] / total if total else 0.0)
+            return {
+                "candidates": self.candidates,
+                "temperatures": self.temperatures,
+                "max_repairs": self.max_repairs,
+                "valid": self._valid,
+                "failed": self._failed,
+                "avg_time_to_valid": round(self._time_to_valid / self._valid, 4) if self._valid else 0.0,
+                "attempts": rounds
+            }
@@ -0,0 +1,225 @@
+# AI建设助手游戏上下文解析
+# 按字段定义生成专用的解析函数：类型转换、范围裁剪、默认值，集中报告所有无效字段
+
+import dataclasses
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class ContextValidationError(ValueError):
+    """上下文数据无效"""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("; ".join(errors))
+
+
+@dataclass(frozen=True)
+class ContextField:
+    """上下文字段定义"""
+    name: str
+    kind: str                      # float / int / bool / str / dict / resource_needs
+    default: Any = None            # 缺失或为null时的取值
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    choices: Tuple[str, ...] = ()
+
+
+GAME_CONTEXT_FIELDS = (
+    ContextField("health", "float", 100.0, 0.0, 100.0),
+    ContextField("hunger", "float", 100.0, 0.0, 100.0),
+    ContextField("sanity", "float", 100.0, 0.0, 100.0),
+    ContextField("day", "int", 1, 1, 1000000),
+    ContextField("season", "str", "autumn", choices=("autumn", "winter", "spring", "summer")),
+    ContextField("time_phase", "str", "day", choices=("day", "dusk", "night")),
+    ContextField("is_night", "bool", False),
+    ContextField("is_dusk", "bool", False),
+    ContextField("inventory_full", "bool", False),
+    ContextField("wood_count", "int", 0, 0, 100000),
+    ContextField("stone_count", "int", 0, 0, 100000),
+    ContextField("food_count", "int", 0, 0, 100000),
+    ContextField("has_campfire", "bool", False),
+    ContextField("has_chest", "bool", False),
+    ContextField("base_center", "dict"),
+    ContextField("planning_progress", "float", None, 0.0, 1.0),
+    ContextField("total_planned", "int", None, 0, 100000),
+    ContextField("resource_needs", "resource_needs"),
+    ContextField("collection_targets", "int", None, 0, 100000),
+)
+
+MAX_RESOURCE_NEEDS = 50
+
+# === 慢路径：非标准类型的转换，出错时记录错误并返回None ===
+
+def _coerce_float(name: str, value: Any, errors: List[str]) -> Optional[float]:
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            errors.append(f"{name}必须是数字，收到字符串{value!r}")
+            return None
+    elif not isinstance(value, (int, float)):
+        errors.append(f"{name}必须是数字，收到{type(value).__name__}")
+        return None
+    value = float(value)
+    if math.isnan(value):
+        errors.append(f"{name}不能是NaN")
+        return None
+    return value
+
+
+def _coerce_int(name: str, value: Any, errors: List[str]) -> Optional[int]:
+    number = _coerce_float(name, value, errors)
+    if number is None:
+        return None
+    if math.isinf(number):
+        return int(math.copysign(1e18, number))
+    return int(number)
+
+
+def _coerce_bool(name: str, value: Any, errors: List[str]) -> Optional[bool]:
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str) and value.lower() in ("true", "false", "1", "0"):
+        return value.lower() in ("true", "1")
+    errors.append(f"{name}必须是布尔值，收到{type(value).__name__}")
+    return None
+
+
+def _coerce_resource_needs(name: str, value: Any, errors: List[str]) -> Optional[list]:
+    # Lua的空表会被编码成{}，按空列表处理
+    if isinstance(value, dict) and not value:
+        return []
+    if not isinstance(value, list):
+        errors.append(f"{name}必须是列表，收到{type(value).__name__}")
+        return None
+    needs = []
+    for index, need in enumerate(value[:MAX_RESOURCE_NEEDS]):
+        if not isinstance(need, dict) or not isinstance(need.get("resource"), str):
+            errors.append(f"{name}[{index}]必须包含字符串resource")
+            continue
+        shortage = _coerce_float(f"{name}[{index}].shortage", need.get("shortage", 0), errors)
+        if shortage is None:
+            continue
+        need = dict(need)
+        need["shortage"] = int(shortage) if shortage.is_integer() else shortage
+        needs.append(need)
+    return needs
+
+
+def _coerce_number(name: str, value: Any, errors: List[str], kind: type,
+                   minimum: Optional[float], maximum: Optional[float]) -> Optional[float]:
+    """数字字段的慢路径：类型转换后裁剪到取值范围"""
+    value = _coerce_int(name, value, errors) if kind is int else _coerce_float(name, value, errors)
+    if value is None:
+        return None
+    if minimum is not None and value < minimum:
+        value = kind(minimum)
+    if maximum is not None and value > maximum:
+        value = kind(maximum)
+    return value
+
+
+def _field_lines(field: ContextField) -> List[str]:
+    """生成单个字段的解析代码：类型和范围都正确时只做一次判断，其余交给转换函数"""
+    name, var = field.name, f"v_{field.name}"
+    lines = [
+        f"    {var} = get({name!r})",
+        f"    if {var} is None:",
+        f"        {var} = {field.default!r}",
+    ]
+    if field.kind in ("float", "int"):
+        check = f"{var}.__class__ is {field.kind}"
+        if field.minimum is not None:
+            check += f" and {field.minimum!r} <= {var}"
+        if field.maximum is not None:
+            check += f" and {var} <= {field.maximum!r}"
+        lines += [
+            f"    elif not ({check}):",
+            f"        {var} = _coerce_number({name!r}, {var}, errors, {field.kind}, {field.minimum!r}, {field.maximum!r})",
+        ]
+    elif field.kind == "bool":
+        lines += [
+            f"    elif {var} is not True and {var} is not False:",
+            f"        {var} = _coerce_bool({name!r}, {var}, errors)",
+        ]
+    elif field.kind == "str":
+        choices = f"_choices_{name}"
+        lines += [
+            f"    elif {var}.__class__ is not str or {var} not in {choices}:",
+            f"        errors.append({name!r} + '必须是' + '/'.join(sorted({choices})) + '之一，收到' + repr({var})[:40])",
+        ]
+    elif field.kind == "dict":
+        lines += [
+            f"    elif {var}.__class__ is not dict:",
+            f"        errors.append({name!r} + '必须是对象，收到' + type({var}).__name__)",
+        ]
+    elif field.kind == "resource_needs":
+        # 条目格式全部正确时直接沿用原列表，否则交给转换函数逐条处理
+        lines += [
+            f"    elif {var}.__class__ is list and len({var}) <= {MAX_RESOURCE_NEEDS}:",
+            f"        try:",
+            f"            for _need in {var}:",
+            f"                if _need['resource'].__class__ is not str or _need['shortage'].__class__ is not int:",
+            f"                    raise TypeError",
+            f"        except (TypeError, KeyError):",
+            f"            {var} = _coerce_resource_needs({name!r}, {var}, errors)",
+            f"    else:",
+            f"        {var} = _coerce_resource_needs({name!r}, {var}, errors)",
+        ]
+    else:
+        raise ValueError(f"未知的字段类型: {field.kind}")
+    return lines
+
+
+def compile_context_parser(cls: type, fields=GAME_CONTEXT_FIELDS) -> Callable[[Dict], Any]:
+    """根据字段定义生成解析函数 parse(data) -> cls 实例
+
+    生成的函数没有逐字段的循环和分派，常见输入（类型正确）只做类型判断和范围比较。
+    无效数据会收集全部错误后抛出ContextValidationError。
+    """
+    # 生成的函数绕过__init__直接赋值，字段必须与数据类完全一致
+    if dataclasses.is_dataclass(cls):
+        expected = [field.name for field in dataclasses.fields(cls)]
+        if expected != [field.name for field in fields]:
+            raise ValueError(f"字段定义与{cls.__name__}不一致: {expected}")
+    if hasattr(cls, "__post_init__"):
+        raise ValueError(f"{cls.__name__}定义了__post_init__，不能绕过__init__构建")
+
+    lines = [
+        "def parse_game_context(data):",
+        "    if data is None:",
+        "        data = {}",
+        "    elif data.__class__ is not dict:",
+        "        raise ContextValidationError(['context必须是对象，收到' + type(data).__name__])",
+        "    errors = []",
+        "    get = data.get",
+    ]
+    namespace = {
+        "ContextValidationError": ContextValidationError,
+        "_coerce_number": _coerce_number,
+        "_coerce_bool": _coerce_bool,
+        "_coerce_resource_needs": _coerce_resource_needs,
+        "_cls": cls,
+        "_new": object.__new__,
+    }
+    for field in fields:
+        if field.choices:
+            namespace[f"_choices_{field.name}"] = frozenset(field.choices)
+        lines += _field_lines(field)
+    lines += [
+        "    if errors:",
+        "        raise ContextValidationError(errors)",
+        # 直接创建实例并写入属性，省去一次19个参数的__init__调用
+        "    context = _new(_cls)",
+    ] + [f"    context.{field.name} = v_{field.name}" for field in fields] + [
+        "    return context",
+    ]
+    source = "\n".join(lines)
+    exec(compile(source, f"<context_parser {cls.__name__}>", "exec"), namespace)
+    parser = namespace["parse_game_context"]
+    parser.__source__ = source
+    return parser
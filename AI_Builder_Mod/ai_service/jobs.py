@@ -0,0 +1,321 @@
+# AI建设助手异步任务
+# 代码生成可能要几十秒，同步接口会一直占着游戏的HTTP请求：
+# 提交后立即返回任务ID，由有界的工作线程执行，客户端轮询或长轮询任务状态取结果。
+# 多进程部署时任务状态写入共享的SQLite文件，轮询落到任何一个工作进程都能查到
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+import tracing
+from scheduler import LoadShed
+
+JOB_STATES = ("queued", "running", "done", "failed")
+
+
+class Job:
+    """一个异步任务"""
+
+    __slots__ = ("job_id", "key", "state", "created", "started", "finished", "result", "error",
+                 "reusable", "done")
+
+    def __init__(self, job_id: str, key: str):
+        self.job_id = job_id
+        self.key = key
+        self.state = "queued"
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.reusable = False         # 完成且结果可供相同请求复用（降级/后备结果为False）
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"job_id": self.job_id, "status": self.state}
+        if self.started is not None:
+            data["queue_time"] = round(self.started - self.created, 3)
+        if self.finished is not None:
+            data["run_time"] = round(self.finished - self.started, 3)
+        if self.state == "done":
+            data["result"] = self.result
+        elif self.state == "failed":
+            data["error"] = self.error
+        return data
+
+    def can_share(self) -> bool:
+        """相同key的新提交能否直接复用该任务：排队/执行中，或已完成且结果可复用"""
+        return self.state in ("queued", "running") or (self.state == "done" and self.reusable)
+
+
+class SqliteJobStore:
+    """基于SQLite（WAL模式）的跨进程任务表
+
+    执行任务的工作进程在每次状态变化时写入，其他进程按任务ID或key读取快照。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # 每个线程独立连接；fork后的子进程不能复用父进程的连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL,
+                    result TEXT,
+                    error TEXT,
+                    reusable INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, created)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def save(self, job: Job, conn: Optional[sqlite3.Connection] = None):
+        (conn or self._conn()).execute(
+            "INSERT OR REPLACE INTO jobs (job_id, key, state, created, started, finished, result, error, reusable) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job.job_id, job.key, job.state, job.created, job.started, job.finished,
+             json.dumps(job.result, ensure_ascii=False) if job.result is not None else None,
+             job.error, int(job.reusable))
+        )
+
+    @staticmethod
+    def _from_row(row) -> Job:
+        job = Job(row[0], row[1])
+        job.state, job.created, job.started, job.finished = row[2], row[3], row[4], row[5]
+        job.result = json.loads(row[6]) if row[6] is not None else None
+        job.error = row[7]
+        job.reusable = bool(row[8])
+        if job.finished is not None:
+            job.done.set()
+        return job
+
+    def load(self, job_id: str) -> Optional[Job]:
+        row = self._conn().execute(
+            "SELECT job_id, key, state, created, started, finished, result, error, reusable FROM jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+        return self._from_row(row) if row is not None else None
+
+    def claim(self, key: str, job: Optional[Job], finished_after: float) -> Optional[Job]:
+        """在同一个写事务中查找可复用（且未过期）的同key任务；没有时写入job（可为None，只查找）
+
+        返回可复用的已有任务，写入了新任务时返回None。
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT job_id, key, state, created, started, finished, result, error, reusable FROM jobs "
+                "WHERE key = ? AND (finished IS NULL OR finished >= ?) ORDER BY created DESC", (key, finished_after)
+            ).fetchall()
+            for row in rows:
+                existing = self._from_row(row)
+                if existing.can_share():
+                    conn.execute("COMMIT")
+                    return existing
+            if job is not None:
+                self.save(job, conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return None
+
+    def prune(self, finished_before: float, created_before: float):
+        """删除过期的已结束任务，以及长时间未结束的任务（执行它的工作进程已退出）"""
+        self._conn().execute("DELETE FROM jobs WHERE finished < ? OR (finished IS NULL AND created < ?)",
+                             (finished_before, created_before))
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        states = {state: 0 for state in JOB_STATES}
+        states.update(dict(rows))
+        return states
+
+
+class JobQueue:
+    """有界工作线程池上的异步任务表
+
+    - 相同key（如代码缓存键）的任务排队中、执行中，或已完成且结果可复用（reusable判断，
+      过载降级和后备结果不复用）时直接返回已有任务，不重复执行
+    - 排队中的任务达到max_queued时拒绝提交（抛出LoadShed，给出预计等待秒数）
+    - 完成/失败的任务保留ttl秒供客户端取结果；任务总数超过max_jobs时先淘汰最早完成的
+    - 配置shared_path时任务状态写入共享SQLite，其他工作进程提交的任务也能查询、长轮询和复用；
+      任务仍由提交它的进程执行，超过stale_after秒仍未结束的共享记录视为执行进程已退出而删除
+    - 记录每个任务的排队耗时和执行耗时
+    """
+
+    def __init__(self, workers: int = 4, max_queued: int = 64, ttl: float = 300.0, max_jobs: int = 1024,
+                 reusable: Optional[Callable[[Any], bool]] = None, shared_path: Optional[str] = None,
+                 stale_after: float = 600.0, poll_interval: float = 0.2):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.reusable = reusable
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self._store = SqliteJobStore(shared_path) if shared_path else None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._by_key: Dict[str, str] = {}
+        self._queued = 0
+        self._run_ewma = 0.0
+        self._executor = None
+        self._last_store_prune = 0.0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # 调用方持有锁
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        return self._executor
+
+    def submit(self, key: str, fn: Callable[[], Any]) -> Tuple[Job, bool]:
+        """提交任务，返回 (任务, 是否复用了已有任务)"""
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            existing = self._jobs.get(self._by_key.get(key, ""))
+            if existing is not None and not existing.can_share():
+                existing = None
+            full = self._queued >= self.max_queued
+            job = None if full else Job(uuid.uuid4().hex[:16], key)
+            if existing is None and self._store is not None:
+                existing = self._store.claim(key, job, now - self.ttl)
+            if existing is not None:
+                metrics.JOB_EVENTS.inc("deduplicated")
+                return existing, True
+            if job is None:
+                metrics.JOB_EVENTS.inc("rejected")
+                retry_after = max(1, min(60, math.ceil(self._queued * (self._run_ewma or 1.0) / self.workers)))
+                raise LoadShed("jobs", f"排队任务已达{self._queued}个", retry_after)
+            self._jobs[job.job_id] = job
+            self._by_key[key] = job.job_id
+            self._queued += 1
+            # 任务在请求返回后执行，单独记一条追踪（与提交请求同一关联ID）
+            self._get_executor().submit(self._run, job, fn, tracing.background_trace("job"))
+        metrics.JOB_EVENTS.inc("submitted")
+        return job, False
+
+    def _run(self, job: Job, fn: Callable[[], Any], trace: Optional[tracing.Trace] = None):
+        with self._lock:
+            self._queued -= 1
+            job.state = "running"
+            job.started = time.time()
+        self._save(job)
+        metrics.JOB_DURATION.observe("queue", value=job.started - job.created)
+        try:
+            result = tracing.run_in_trace(trace, fn)
+        except Exception as e:
+            job.error = str(e)
+            state = "failed"
+        else:
+            job.result = result
+            job.reusable = self.reusable is None or self.reusable(result)
+            state = "done"
+        tracing.finish_background_trace(trace, 200 if state == "done" else 500)
+        with self._lock:
+            job.finished = time.time()
+            job.state = state
+            run_time = job.finished - job.started
+            self._run_ewma = run_time if not self._run_ewma else 0.8 * self._run_ewma + 0.2 * run_time
+        self._save(job)
+        metrics.JOB_DURATION.observe("run", value=run_time)
+        metrics.JOB_EVENTS.inc(state)
+        job.done.set()
+
+    def _save(self, job: Job):
+        if self._store is None:
+            return
+        try:
+            self._store.save(job)
+        except sqlite3.Error:
+            # 共享表写入失败不影响本进程内的任务，其他进程暂时查不到最新状态
+            metrics.JOB_EVENTS.inc("store_error")
+
+    def _prune(self, now: float):
+        # 调用方持有锁
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished is not None and now - job.finished > self.ttl]
+        overflow = len(self._jobs) - len(expired) - self.max_jobs
+        if overflow > 0:
+            finished = sorted((job for job in self._jobs.values()
+                               if job.finished is not None and job.job_id not in expired),
+                              key=lambda job: job.finished)
+            expired.extend(job.job_id for job in finished[:overflow])
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job.key) == job_id:
+                del self._by_key[job.key]
+            metrics.JOB_EVENTS.inc("expired")
+        # 共享表的清理是一次写事务，每隔几秒做一次即可
+        if self._store is not None and now - self._last_store_prune > 5:
+            self._last_store_prune = now
+            self._store.prune(now - self.ttl, now - self.stale_after)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """本进程的任务直接返回；其他进程的任务返回共享表中的快照"""
+        with self._lock:
+            self._prune(time.time())
+            job = self._jobs.get(job_id)
+        if job is None and self._store is not None:
+            job = self._store.load(job_id)
+        return job
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """长轮询：等待任务结束或超时，返回任务（不存在或已过期时为None）"""
+        job = self.get(job_id)
+        if job is None or timeout <= 0:
+            return job
+        with self._lock:
+            local = self._jobs.get(job_id) is job
+        if local:
+            job.done.wait(timeout)
+            return job
+        # 其他进程执行的任务：定期读取共享表
+        deadline = time.time() + timeout
+        while not job.done.is_set() and time.time() < deadline:
+            time.sleep(min(self.poll_interval, max(0.0, deadline - time.time())))
+            latest = self._store.load(job_id)
+            if latest is None:
+                break
+            job = latest
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            states = {state: 0 for state in JOB_STATES}
+            for job in self._jobs.values():
+                states[job.state] += 1
+            stats = {
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "ttl": self.ttl,
+                "jobs": states,
+                "avg_run_time": round(self._run_ewma, 3)
+            }
+        if self._store is not None:
+            stats["shared_jobs"] = self._store.counts()
+        return stats
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+AI建设助手服务压测工具
+启动本地DeepSeek模拟服务和AI服务，按目标并发驱动各接口，
+统计RPS和p50/p95/p99延迟，并将结果写入JSON文件便于跨提交对比
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import requests
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from independent_test import MockDeepSeekAPI
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BASE_CONTEXT = {
+    "health": 75.0, "hunger": 60.0, "sanity": 85.0,
+    "day": 5, "season": "autumn", "time_phase": "day",
+    "is_night": False, "is_dusk": False, "inventory_full": False,
+    "wood_count": 8, "stone_count": 3, "food_count": 5,
+    "has_campfire": True, "has_chest": False,
+    "base_center": {"x": 100, "z": 200}
+}
+
+CHAT_MESSAGES = ["帮我建个基地", "现在情况怎么样", "木材够吗？", "晚上要注意什么"]
+
+
+def _random_context() -> Dict:
+    context = dict(BASE_CONTEXT)
+    context["health"] = round(random.uniform(20, 100), 1)
+    context["hunger"] = round(random.uniform(10, 100), 1)
+    context["wood_count"] = random.randint(0, 30)
+    context["time_phase"] = random.choice(["day", "dusk", "night"])
+    context["is_night"] = context["time_phase"] == "night"
+    context["is_dusk"] = context["time_phase"] == "dusk"
+    return context
+
+
+# 各接口的请求构造器
+ROUTES = {
+    "decision": lambda: ("/decision", {"context": _random_context()}),
+    "chat": lambda: ("/chat", {"player_message": random.choice(CHAT_MESSAGES), "context": _random_context()}),
+    # 指令不命中任务代码库，经调度器走上游生成
+    "generate_lua_code": lambda: ("/generate_lua_code", {
+        "instruction": "在基地周围种一圈浆果丛", "task_type": "building", "context": _random_context()
+    }),
+    # 指令完全匹配任务代码库模板，不调用上游
+    "generate_lua_code_library": lambda: ("/generate_lua_code", {
+        "instruction": "木材不够了，请去砍一些树木", "task_type": "collecting", "context": _random_context()
+    }),
+    "validate_lua_code": lambda: ("/validate_lua_code", {"lua_code": MockDeepSeekAPI.generate_chopping_code()}),
+    # 每次附加随机注释使验证缓存无法命中，用于测量纯CPU路径
+    "validate_lua_code_uncached": lambda: ("/validate_lua_code", {
+        "lua_code": MockDeepSeekAPI.generate_chopping_code() + f"\n-- {random.getrandbits(64):x}"
+    }),
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """按最近秩计算百分位（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float, status_counts: Dict,
+              shed: int = 0, attempts: int = 0) -> Dict:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "shed": shed,
+        "attempts": attempts or count,
+        "rps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        # 有效吞吐：既未出错也未被准入控制降级的请求
+        "goodput_rps": round((count - errors - shed) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(latencies) / count * 1000, 2) if count else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if count else 0.0,
+        "status_counts": status_counts
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"服务未在{timeout}秒内就绪: {url}")
+
+
+class ManagedProcesses:
+    """管理压测期间启动的模拟服务和AI服务子进程"""
+
+    def __init__(self):
+        self.processes: List[subprocess.Popen] = []
+        self.tmpdir = tempfile.mkdtemp(prefix="ai_builder_load_")
+
+    def start_mock(self, args, latency_mean: Optional[float] = None, error_rate: Optional[float] = None) -> str:
+        port = _free_port()
+        command = [
+            sys.executable, os.path.join(SERVICE_DIR, "mock_deepseek.py"),
+            "--port", str(port),
+            "--latency-dist", args.mock_latency_dist,
+            "--latency-mean", str(args.mock_latency_mean if latency_mean is None else latency_mean),
+            "--latency-std", str(args.mock_latency_std),
+            "--error-rate", str(args.mock_error_rate if error_rate is None else error_rate),
+        ]
+        self.processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL))
+        base_url = f"http://127.0.0.1:{port}/v1"
+        _wait_ready(f"{base_url}/stats")
+        return base_url
+
+    def start_service(self, deepseek_base_url: str, extra_env: Optional[Dict] = None,
+                      workers: int = 0) -> str:
+        """启动AI服务；workers>0时使用serve.py多进程模式"""
+        port = _free_port()
+        env = dict(os.environ)
+        env.update({
+            "DEEPSEEK_BASE_URL": deepseek_base_url,
+            "DEEPSEEK_API_KEY": env.get("DEEPSEEK_API_KEY", "load-test-key"),
+            "DATABASE_PATH": os.path.join(self.tmpdir, "load_test.db"),
+        })
+        env.update(extra_env or {})
+        if workers > 0:
+            command = [sys.executable, os.path.join(SERVICE_DIR, "serve.py"),
+                       "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+                       "--shared-cache", os.path.join(self.tmpdir, f"shared_cache_{port}.db")]
+        else:
+            command = [sys.executable, "-c",
+                       f"import app, logging; logging.disable(logging.ERROR); "
+                       f"app.create_app().run(host='127.0.0.1', port={port}, threaded=True)"]
+        process = subprocess.Popen(command, cwd=SERVICE_DIR, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.processes.append(process)
+        service_url = f"http://127.0.0.1:{port}"
+        _wait_ready(f"{service_url}/ping")
+        return service_url
+
+    def stop_process(self, process: subprocess.Popen):
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        if process in self.processes:
+            self.processes.remove(process)
+
+    def stop(self):
+        for process in list(self.processes):
+            self.stop_process(process)
+
+
+def _new_bucket() -> Dict:
+    return {"latencies": [], "errors": 0, "shed": 0, "attempts": 0, "status": {}}
+
+
+def _collect_samples(service_url: str, route_names: List[str], concurrency: int, duration: float,
+                     timeout: float = 60.0, retries: int = 0) -> Dict:
+    """以固定并发（闭环）驱动指定接口，返回原始样本
+
+    模拟Lua客户端：超时或5xx时最多重试retries次；被准入控制降级时按Retry-After暂停后再发下一个请求。
+    """
+    lock = threading.Lock()
+    samples = {name: _new_bucket() for name in route_names}
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            name = random.choice(route_names)
+            path, payload = ROUTES[name]()
+            start_time = time.perf_counter()
+            retry_after = None
+            for attempt in range(retries + 1):
+                try:
+                    response = session.post(service_url + path, json=payload, timeout=timeout)
+                    status = str(response.status_code)
+                    failed = response.status_code >= 500
+                    retry_after = response.headers.get("Retry-After")
+                except requests.RequestException:
+                    status, failed = "exception", True
+                if not failed:
+                    break
+            latency = time.perf_counter() - start_time
+            with lock:
+                bucket = samples[name]
+                bucket["latencies"].append(latency)
+                bucket["attempts"] += attempt + 1
+                bucket["status"][status] = bucket["status"].get(status, 0) + 1
+                if failed:
+                    bucket["errors"] += 1
+                elif retry_after:
+                    bucket["shed"] += 1
+            if retry_after:
+                time.sleep(min(float(retry_after), max(0.0, deadline - time.perf_counter())))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def _collect_samples_star(args):
+    return _collect_samples(*args)
+
+
+def run_load(service_url: str, route_names: List[str], concurrency: int, duration: float,
+             client_processes: int = 1, timeout: float = 60.0, retries: int = 0) -> Dict:
+    """驱动压测并汇总统计
+
+    压测客户端本身也受GIL限制，测量多进程服务时可用client_processes把并发分摊到多个进程。
+    """
+    started = time.perf_counter()
+    if client_processes > 1:
+        per_process = max(1, concurrency // client_processes)
+        with multiprocessing.Pool(client_processes) as pool:
+            parts = pool.map(_collect_samples_star,
+                             [(service_url, route_names, per_process, duration, timeout, retries)] * client_processes)
+    else:
+        parts = [_collect_samples(service_url, route_names, concurrency, duration, timeout, retries)]
+    elapsed = time.perf_counter() - started
+
+    samples = {name: _new_bucket() for name in route_names}
+    for part in parts:
+        for name, bucket in part.items():
+            merged = samples[name]
+            merged["latencies"].extend(bucket["latencies"])
+            for field in ("errors", "shed", "attempts"):
+                merged[field] += bucket[field]
+            for status, count in bucket["status"].items():
+                merged["status"][status] = merged["status"].get(status, 0) + count
+
+    results = {name: summarize(bucket["latencies"], bucket["errors"], elapsed, bucket["status"],
+                               bucket["shed"], bucket["attempts"])
+               for name, bucket in samples.items()}
+    all_latencies = [latency for bucket in samples.values() for latency in bucket["latencies"]]
+    all_status: Dict[str, int] = {}
+    for bucket in samples.values():
+        for status, count in bucket["status"].items():
+            all_status[status] = all_status.get(status, 0) + count
+    results["total"] = summarize(all_latencies, sum(b["errors"] for b in samples.values()), elapsed, all_status,
+                                 sum(b["shed"] for b in samples.values()), sum(b["attempts"] for b in samples.values()))
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: Dict, baseline: Optional[Dict] = None):
+    print(f"{'接口':<20}{'请求数':>8}{'错误':>6}{'降级':>6}{'RPS':>10}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}")
+    for name, stats in results.items():
+        line = (f"{name:<20}{stats['requests']:>8}{stats['errors']:>6}{stats.get('shed', 0):>6}{stats['rps']:>10.1f}"
+                f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+        if baseline and name in baseline:
+            old = baseline[name]
+            if old["rps"]:
+                line += f"   RPS {(stats['rps'] - old['rps']) / old['rps'] * 100:+.1f}%"
+            if old["p95_ms"]:
+                line += f"  p95 {(stats['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100:+.1f}%"
+        print(line)
+
+
+def run_scaling(args, processes: ManagedProcesses, route_names: List[str]):
+    """依次以不同工作进程数启动服务压测，报告RPS随核数的扩展效率"""
+    worker_counts = [int(count) for count in args.scaling.split(",")]
+    print(f"📈 扩展性测试: 工作进程 {worker_counts}，接口 {route_names}，CPU核数 {os.cpu_count()}")
+    mock_url = processes.start_mock(args)
+
+    scaling, results = [], {}
+    for workers in worker_counts:
+        service_url = processes.start_service(mock_url, workers=workers)
+        service_process = processes.processes[-1]
+        run_load(service_url, route_names, args.concurrency, min(2.0, args.duration))  # 预热
+        results = run_load(service_url, route_names, args.concurrency, args.duration, args.client_processes)
+        processes.stop_process(service_process)
+
+        rps = results["total"]["rps"]
+        base_rps = scaling[0]["rps"] / scaling[0]["workers"] if scaling else rps / workers
+        efficiency = rps / (base_rps * workers) if base_rps else 0.0
+        scaling.append({"workers": workers, "rps": rps, "p95_ms": results["total"]["p95_ms"],
+                        "efficiency": round(efficiency, 3)})
+        print(f"  工作进程{workers:>3}: {rps:>10.1f} RPS  p95 {results['total']['p95_ms']:.1f}ms  "
+              f"线性扩展效率 {efficiency * 100:.0f}%")
+    return results, scaling
+
+
+# 关闭准入控制时使用的配置（积压和预计排队都不设上限）
+NO_ADMISSION_ENV = {"UPSTREAM_MAX_PENDING": "1000000", "UPSTREAM_MAX_QUEUE_WAIT": "inf"}
+
+
+def start_mock_backends(args, processes: ManagedProcesses) -> Dict[str, str]:
+    """按 --mock-backends 启动多个模拟上游（"延迟均值[:错误率]"，逗号分隔），返回服务的LLM_BACKENDS环境变量"""
+    backends = []
+    for index, item in enumerate(filter(None, (part.strip() for part in args.mock_backends.split(",")))):
+        latency, _, error_rate = item.partition(":")
+        base_url = processes.start_mock(args, float(latency), float(error_rate) if error_rate else None)
+        backends.append({"name": f"mock{index}", "base_url": base_url, "api_key": "load-test-key"})
+        print(f"🧪 模拟上游 mock{index}: {base_url}  延迟{latency}s  错误率{error_rate or args.mock_error_rate}")
+    return {"LLM_BACKENDS": json.dumps(backends), "LLM_ROUTING_POLICY": args.routing_policy}
+
+
+def fetch_backend_stats(service_url: str) -> Optional[Dict]:
+    """读取服务 /status 中的上游后端状态"""
+    import requests
+    try:
+        return requests.get(f"{service_url}/status", timeout=5).json().get("upstream_backends")
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def run_overload(args, processes: ManagedProcesses, route_names: List[str]):
+    """逐级提高并发，分别在开启/关闭准入控制时压测，对比有效吞吐是否在过载后保持稳定"""
+    levels = [int(level) for level in args.overload.split(",")]
+    print(f"🔥 过载测试: 并发 {levels}，上游并发{args.upstream_concurrency}，"
+          f"客户端超时{args.client_timeout}s 重试{args.client_retries}次")
+    mock_url = processes.start_mock(args)
+
+    overload, results = {}, {}
+    admission_env = {"UPSTREAM_MAX_QUEUE_WAIT": str(args.max_queue_wait)}
+    for mode, extra_env in (("admission", admission_env), ("no_admission", NO_ADMISSION_ENV)):
+        env = dict(extra_env, UPSTREAM_CONCURRENCY=str(args.upstream_concurrency))
+        service_url = processes.start_service(mock_url, extra_env=env)
+        service_process = processes.processes[-1]
+        overload[mode] = []
+        print(f"\n{'准入控制' if mode == 'admission' else '无准入控制'}")
+        print(f"{'并发':>6}{'RPS':>10}{'有效RPS':>10}{'降级':>8}{'错误':>8}{'尝试/请求':>10}{'p95ms':>10}")
+        for level in levels:
+            results = run_load(service_url, route_names, level, args.duration, args.client_processes,
+                               args.client_timeout, args.client_retries)
+            total = results["total"]
+            amplification = total["attempts"] / total["requests"] if total["requests"] else 0.0
+            overload[mode].append({"concurrency": level, "rps": total["rps"], "goodput_rps": total["goodput_rps"],
+                                   "shed": total["shed"], "errors": total["errors"],
+                                   "amplification": round(amplification, 2), "p95_ms": total["p95_ms"]})
+            print(f"{level:>6}{total['rps']:>10.1f}{total['goodput_rps']:>10.1f}{total['shed']:>8}"
+                  f"{total['errors']:>8}{amplification:>10.2f}{total['p95_ms']:>10.1f}")
+        processes.stop_process(service_process)
+    return results, overload
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="AI建设助手服务压测")
+    parser.add_argument("--service-url", help="压测已运行的服务（不指定则自动启动本地服务和模拟上游）")
+    parser.add_argument("--routes", default="decision,chat,generate_lua_code,validate_lua_code",
+                        help="逗号分隔的接口列表")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发客户端数")
+    parser.add_argument("--duration", type=float, default=20.0, help="压测时长（秒）")
+    parser.add_argument("--client-processes", type=int, default=1, help="压测客户端进程数")
+    parser.add_argument("--serve-workers", type=int, default=0, help="使用serve.py启动N个工作进程（0为单进程）")
+    parser.add_argument("--scaling", help="逗号分隔的工作进程数列表，依次压测并报告扩展效率，如 1,2,4")
+    parser.add_argument("--overload", help="逗号分隔的并发级别，开启/关闭准入控制各压测一遍，如 8,32,128")
+    parser.add_argument("--upstream-concurrency", type=int, default=8, help="过载测试时服务的上游并发上限")
+    parser.add_argument("--max-queue-wait", type=float, default=1.0,
+                        help="过载测试时准入控制的预计排队上限（秒），应小于客户端超时")
+    parser.add_argument("--client-timeout", type=float, default=60.0, help="客户端请求超时（秒）")
+    parser.add_argument("--client-retries", type=int, default=0, help="超时或5xx时的重试次数（Lua客户端为3）")
+    parser.add_argument("--output", default="load_test_results.json", help="结果JSON文件")
+    parser.add_argument("--compare", help="与之前的结果JSON对比")
+    parser.add_argument("--mock-latency-dist", default="lognormal")
+    parser.add_argument("--mock-latency-mean", type=float, default=0.2)
+    parser.add_argument("--mock-latency-std", type=float, default=0.1)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-backends",
+                        help="启动多个模拟上游并配置为服务的多后端，逗号分隔的\"延迟均值[:错误率]\"，如 0.05,0.3,0.1:1")
+    parser.add_argument("--routing-policy", default="ewma", choices=["ewma", "least_outstanding"],
+                        help="多后端时服务的路由策略")
+    return parser
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    route_names = [name.strip() for name in args.routes.split(",") if name.strip()]
+    unknown = [name for name in route_names if name not in ROUTES]
+    if unknown:
+        print(f"❌ 未知接口: {unknown}")
+        return 1
+
+    processes = ManagedProcesses()
+    scaling = overload = backend_stats = None
+    try:
+        if args.scaling:
+            results, scaling = run_scaling(args, processes, route_names)
+        elif args.overload:
+            results, overload = run_overload(args, processes, route_names)
+        else:
+            service_url = args.service_url
+            if not service_url and args.mock_backends:
+                env = start_mock_backends(args, processes)
+                service_url = processes.start_service(json.loads(env["LLM_BACKENDS"])[0]["base_url"],
+                                                      extra_env=env, workers=args.serve_workers)
+            elif not service_url:
+                mock_url = processes.start_mock(args)
+                service_url = processes.start_service(mock_url, workers=args.serve_workers)
+                print(f"🧪 模拟上游: {mock_url}")
+            print(f"🚀 压测 {service_url}  并发{args.concurrency}  时长{args.duration}s  接口{route_names}")
+
+            results = run_load(service_url, route_names, args.concurrency, args.duration, args.client_processes,
+                               args.client_timeout, args.client_retries)
+            backend_stats = fetch_backend_stats(service_url)
+            if backend_stats and len(backend_stats["backends"]) > 1:
+                print(f"\n上游后端（{backend_stats['policy']}）:")
+                for backend in backend_stats["backends"]:
+                    print(f"  {backend['name']:<10} 调用{backend['requests']:>6}  失败{backend['errors']:>5}  "
+                          f"延迟EWMA {backend['latency_ewma'] * 1000:>7.1f}ms  "
+                          f"{'可用' if backend['healthy'] else '摘除中'}")
+    finally:
+        processes.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f).get("results")
+
+    print_report(results, baseline)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": _git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results
+    }
+    if scaling:
+        report["scaling"] = scaling
+    if overload:
+        report["overload"] = overload
+    if backend_stats:
+        report["upstream_backends"] = backend_stats
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
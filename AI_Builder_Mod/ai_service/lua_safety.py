@@ -0,0 +1,66 @@
+# Lua代码安全检查
+# 独立于Flask的纯函数实现，可在进程池中并行执行
+
+import re
+from typing import Dict, List
+
+from cache import content_hash
+
+# 危险函数检查（预编译）
+DANGEROUS_PATTERNS = [
+    r'\bio\.',           # io操作
+    r'\bos\.',           # 系统操作
+    r'\brequire\b',      # 模块加载
+    r'\bdofile\b',       # 文件执行
+    r'\bloadfile\b',     # 文件加载
+    r'\bloadstring\b',   # 字符串执行
+    r'\bdebug\.',        # 调试接口
+    r'\bgetfenv\b',      # 环境获取
+    r'\bsetfenv\b',      # 环境设置
+    r'\b_G\b',           # 全局环境
+]
+_DANGEROUS_REGEXES = [(pattern, re.compile(pattern)) for pattern in DANGEROUS_PATTERNS]
+_INFINITE_LOOP_REGEX = re.compile(r'\bwhile\s+true\b')
+_TRAILING_SPACE_REGEX = re.compile(r'[ \t]+$', re.MULTILINE)
+
+
+def normalize_lua_code(lua_code: str) -> str:
+    """规范化Lua代码：统一换行符并去除行尾空白"""
+    code = lua_code.replace('\r\n', '\n').replace('\r', '\n')
+    return _TRAILING_SPACE_REGEX.sub('', code).strip()
+
+
+def lua_code_key(lua_code: str) -> str:
+    """规范化代码的内容哈希，用作验证缓存键"""
+    return content_hash(normalize_lua_code(lua_code))
+
+
+def check_lua_code_safety(lua_code: str) -> Dict:
+    """验证Lua代码的安全性（不使用缓存），code_length为提交代码的原始长度"""
+    code_length = len(lua_code)
+    lua_code = normalize_lua_code(lua_code)
+    errors: List[str] = []
+    warnings: List[str] = []
+
+    for pattern, regex in _DANGEROUS_REGEXES:
+        if regex.search(lua_code):
+            errors.append(f"检测到危险函数调用: {pattern}")
+
+    # 必需函数检查
+    if 'function ExecuteAITask' not in lua_code:
+        errors.append("缺少必需的ExecuteAITask函数")
+
+    # 返回值检查
+    if 'return {' not in lua_code and 'return{' not in lua_code:
+        warnings.append("函数可能没有正确的返回值格式")
+
+    # 无限循环检查
+    if _INFINITE_LOOP_REGEX.search(lua_code) and 'break' not in lua_code:
+        errors.append("检测到可能的无限循环")
+
+    return {
+        "is_safe": len(errors) == 0,
+        "errors": errors,
+        "warnings": warnings,
+        "code_length": code_length
+    }
@@ -0,0 +1,448 @@
+# AI建设助手指标采集
+# Prometheus文本格式的计数器、直方图和仪表，写入路径按线程分片加锁以降低争用
+# 多进程部署时各工作进程把计数器、仪表和直方图的快照写入共享SQLite，抓取时合并所有存活进程的快照
+
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 分片数量：不同线程落在不同分片上，各分片独立加锁
+_STRIPES = 8
+
+# 默认延迟分桶（秒），覆盖本地规则到上游长调用
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _stripe_index() -> int:
+    return threading.get_native_id() % _STRIPES
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类"""
+
+    kind = "untyped"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._locks = [threading.Lock() for _ in range(_STRIPES)]
+        self._shards: List[Dict] = [{} for _ in range(_STRIPES)]
+
+    def render(self, values: Optional[Dict] = None) -> List[str]:
+        """values为合并后的多进程取值，未提供时使用本进程的取值"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples(self.collect() if values is None else values))
+        return lines
+
+    def collect(self) -> Dict:
+        raise NotImplementedError
+
+    def _render_samples(self, values: Dict) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in sorted(values.items())]
+
+    # 多进程快照：取值转为可JSON序列化的列表，合并时按标签相加
+    def dump(self) -> List:
+        return [[list(labels), value] for labels, value in self.collect().items()]
+
+    def merge_into(self, merged: Dict, dumped: List):
+        for labels, value in dumped:
+            labels = tuple(labels)
+            merged[labels] = merged.get(labels, 0.0) + value
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        if not self.registry.enabled:
+            return
+        index = _stripe_index()
+        shard = self._shards[index]
+        with self._locks[index]:
+            shard[labelvalues] = shard.get(labelvalues, 0.0) + amount
+
+    def collect(self) -> Dict[Tuple, float]:
+        totals: Dict[Tuple, float] = {}
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                items = list(shard.items())
+            for labels, value in items:
+                totals[labels] = totals.get(labels, 0.0) + value
+        return totals
+
+
+class Gauge(Counter):
+    """可增可减的仪表（如进行中的请求数）"""
+
+    kind = "gauge"
+
+    def dec(self, *labelvalues, amount: float = 1.0):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class CallbackGauge(_Metric):
+    """在抓取时由回调函数计算取值的仪表（只反映响应抓取的进程，不参与多进程合并）"""
+
+    kind = "gauge"
+
+    def __init__(self, registry, name, help_text, labelnames, callback: Callable[[], Dict[Tuple, float]]):
+        super().__init__(registry, name, help_text, labelnames)
+        self.callback = callback
+
+    def collect(self) -> Dict[Tuple, float]:
+        return self.callback()
+
+
+class Histogram(_Metric):
+    """累积分桶直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labelvalues, value: float):
+        if not self.registry.enabled:
+            return
+        bucket = bisect.bisect_left(self.buckets, value)
+        index = _stripe_index()
+        shard = self._shards[index]
+        with self._locks[index]:
+            entry = shard.get(labelvalues)
+            if entry is None:
+                entry = shard[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bucket] += 1
+            entry[1] += value
+
+    def collect(self) -> Dict[Tuple, Tuple[List[int], float]]:
+        totals: Dict[Tuple, Tuple[List[int], float]] = {}
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                items = [(labels, (list(entry[0]), entry[1])) for labels, entry in shard.items()]
+            for labels, (counts, total) in items:
+                if labels in totals:
+                    merged_counts, merged_total = totals[labels]
+                    totals[labels] = ([a + b for a, b in zip(merged_counts, counts)], merged_total + total)
+                else:
+                    totals[labels] = (counts, total)
+        return totals
+
+    def dump(self) -> List:
+        return [[list(labels), counts, total] for labels, (counts, total) in self.collect().items()]
+
+    def merge_into(self, merged: Dict, dumped: List):
+        for labels, counts, total in dumped:
+            if len(counts) != len(self.buckets) + 1:
+                continue  # 重载前分桶不同的旧进程快照
+            labels = tuple(labels)
+            if labels in merged:
+                merged_counts, merged_total = merged[labels]
+                merged[labels] = ([a + b for a, b in zip(merged_counts, counts)], merged_total + total)
+            else:
+                merged[labels] = (list(counts), total)
+
+    def _render_samples(self, values: Dict) -> List[str]:
+        lines = []
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for upper, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(upper) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class SqliteMetricsStore:
+    """基于SQLite（WAL模式）的指标快照表，每个工作进程一行"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # 每个线程独立连接；fork后的子进程不能复用父进程的连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS metric_snapshots (
+                    pid INTEGER PRIMARY KEY,
+                    updated REAL NOT NULL,
+                    data TEXT NOT NULL
+                )
+            ''')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def publish(self, pid: int, data: Dict[str, List]):
+        self._conn().execute("INSERT OR REPLACE INTO metric_snapshots (pid, updated, data) VALUES (?, ?, ?)",
+                             (pid, time.time(), json.dumps(data, ensure_ascii=False)))
+
+    def load(self) -> List[Tuple[int, Dict[str, List]]]:
+        rows = self._conn().execute("SELECT pid, data FROM metric_snapshots").fetchall()
+        return [(pid, json.loads(data)) for pid, data in rows]
+
+    def delete(self, pids: Iterable[int]):
+        self._conn().executemany("DELETE FROM metric_snapshots WHERE pid = ?", [(pid,) for pid in pids])
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsRegistry:
+    """指标注册表
+
+    启用共享快照（enable_sharing）后，后台线程每隔interval秒写入本进程的计数器、仪表和直方图；
+    抓取时先写入最新快照，再按标签合并所有存活工作进程的快照。已退出进程的快照会被删除，
+    其计数从合计中消失（Prometheus按计数器重置处理）。回调仪表只反映响应抓取的进程。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: List[_Metric] = []
+        self._shared: Optional[SqliteMetricsStore] = None
+        self._publisher: Optional[threading.Thread] = None
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, help_text, labelnames))
+
+    def callback_gauge(self, name: str, help_text: str, labelnames: Iterable[str],
+                       callback: Callable[[], Dict[Tuple, float]]) -> CallbackGauge:
+        return self._register(CallbackGauge(self, name, help_text, labelnames, callback))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                  buckets: Optional[Iterable[float]] = None) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labelnames, buckets or DEFAULT_BUCKETS))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def enable_sharing(self, path: str, interval: float = 5.0):
+        """多进程部署时在每个工作进程中（fork之后）调用，定期写入本进程的指标快照"""
+        self._shared = SqliteMetricsStore(path)
+        self.publish()
+        if self._publisher is None:
+            def publish_loop():
+                while True:
+                    time.sleep(interval)
+                    self.publish()
+
+            self._publisher = threading.Thread(target=publish_loop, name="metrics-publish", daemon=True)
+            self._publisher.start()
+
+    def publish(self) -> bool:
+        """写入本进程的快照，未启用共享或写入失败时返回False"""
+        if self._shared is None or not self.enabled:
+            return False
+        snapshot = {metric.name: metric.dump() for metric in self._metrics if not isinstance(metric, CallbackGauge)}
+        try:
+            self._shared.publish(os.getpid(), snapshot)
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _merge_workers(self) -> Optional[Tuple[Dict[str, Dict], int]]:
+        """合并所有存活工作进程的快照，返回 (各指标的合并取值, 进程数)；共享表不可用时返回None"""
+        if not self.publish():
+            return None
+        try:
+            snapshots = self._shared.load()
+            dead = [pid for pid, _ in snapshots if not _pid_alive(pid)]
+            if dead:
+                self._shared.delete(dead)
+        except (sqlite3.Error, ValueError):
+            return None
+        by_name = {metric.name: metric for metric in self._metrics}
+        merged: Dict[str, Dict] = {name: {} for name in by_name}
+        live = [data for pid, data in snapshots if pid not in dead]
+        for data in live:
+            for name, dumped in data.items():
+                if name in by_name:
+                    by_name[name].merge_into(merged[name], dumped)
+        return merged, len(live)
+
+    def render(self) -> str:
+        """生成Prometheus文本格式"""
+        workers = self._merge_workers()
+        lines = []
+        for metric in self._metrics:
+            if workers is None or isinstance(metric, CallbackGauge):
+                lines.extend(metric.render())
+            else:
+                lines.extend(metric.render(workers[0][metric.name]))
+        if workers is not None:
+            lines.extend(["# HELP ai_builder_metrics_workers 合并了指标快照的工作进程数",
+                          "# TYPE ai_builder_metrics_workers gauge",
+                          f"ai_builder_metrics_workers {workers[1]}"])
+        return "\n".join(lines) + "\n"
+
+
+# 全局注册表
+REGISTRY = MetricsRegistry(enabled=os.getenv("METRICS_ENABLED", "1") != "0")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTP路由指标
+HTTP_REQUESTS = REGISTRY.counter(
+    "ai_builder_http_requests_total", "HTTP请求总数", ("route", "method", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "ai_builder_http_request_duration_seconds", "HTTP请求处理耗时", ("route",))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "ai_builder_http_requests_in_flight", "正在处理的HTTP请求数", ("route",))
+
+# 上游DeepSeek调用指标
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "ai_builder_upstream_request_duration_seconds", "上游API调用耗时", ("endpoint", "outcome"))
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    "ai_builder_upstream_requests_in_flight", "正在进行的上游API调用数", ("endpoint",))
+UPSTREAM_QUEUE_WAIT = REGISTRY.histogram(
+    "ai_builder_upstream_queue_wait_seconds", "上游调度器排队耗时", ("traffic_class",))
+UPSTREAM_SHED = REGISTRY.counter(
+    "ai_builder_upstream_shed_total", "准入控制拒绝的上游调用数", ("traffic_class", "cause"))
+UPSTREAM_BACKEND_REQUESTS = REGISTRY.counter(
+    "ai_builder_upstream_backend_requests_total", "各上游后端的调用数", ("backend", "outcome"))
+
+# 响应来源分布（deepseek / fallback / error 等）
+RESPONSE_SOURCE = REGISTRY.counter(
+    "ai_builder_response_source_total", "按来源统计的响应数", ("route", "source"))
+
+# 代码生成流水线指标（attempt为轮次：1为首轮候选，之后为修复轮；outcome为valid/invalid/error）
+CODEGEN_ATTEMPTS = REGISTRY.counter(
+    "ai_builder_codegen_attempts_total", "代码生成各轮候选的验证结果", ("attempt", "outcome"))
+CODEGEN_TIME_TO_VALID = REGISTRY.histogram(
+    "ai_builder_codegen_time_to_valid_seconds", "得到通过验证代码的端到端耗时", ("outcome",))
+
+# 异步任务指标（phase为queue/run；event为submitted/deduplicated/rejected/done/failed/expired）
+JOB_DURATION = REGISTRY.histogram(
+    "ai_builder_job_duration_seconds", "异步任务排队/执行耗时", ("phase",))
+JOB_EVENTS = REGISTRY.counter(
+    "ai_builder_job_events_total", "异步任务事件数", ("event",))
+
+# 数据库写入指标
+DB_WRITE_LATENCY = REGISTRY.histogram(
+    "ai_builder_db_write_duration_seconds", "数据库写入耗时", ("table",))
+
+# 传输编码指标（请求/响应体在线路上的字节数）
+WIRE_BYTES = REGISTRY.counter(
+    "ai_builder_wire_bytes_total", "按编码统计的请求/响应体字节数", ("direction", "encoding"))
+
+# 决策预计算指标（precomputed/hit/cached/busy/failed）
+SPECULATION_EVENTS = REGISTRY.counter(
+    "ai_builder_speculation_events_total", "决策预计算事件数", ("event",))
+
+# 决策间隔建议（按原因计数：urgent/dusk/stable等）
+DECISION_PACING = REGISTRY.counter(
+    "ai_builder_decision_pacing_total", "决策间隔建议次数", ("reason",))
+
+# 会话指标（full/delta/resync/evicted）
+SESSION_EVENTS = REGISTRY.counter(
+    "ai_builder_session_events_total", "会话事件数", ("event",))
+
+
+def register_cache(name: str, cache) -> None:
+    """注册缓存命中率指标（cache需提供stats()方法）"""
+    _caches[name] = cache
+
+
+_caches: Dict[str, object] = {}
+
+
+def _cache_stat(field: str) -> Callable[[], Dict[Tuple, float]]:
+    return lambda: {(name,): cache.stats()[field] for name, cache in _caches.items()}
+
+
+REGISTRY.callback_gauge("ai_builder_cache_hits", "缓存命中次数", ("cache",), _cache_stat("hits"))
+REGISTRY.callback_gauge("ai_builder_cache_misses", "缓存未命中次数", ("cache",), _cache_stat("misses"))
+REGISTRY.callback_gauge("ai_builder_cache_hit_ratio", "缓存命中率", ("cache",), _cache_stat("hit_ratio"))
+REGISTRY.callback_gauge("ai_builder_cache_size", "缓存条目数", ("cache",), _cache_stat("size"))
+
+
+def register_session_store(name: str, store) -> None:
+    """注册会话数指标（store需支持len()）"""
+    _session_stores[name] = store
+
+
+_session_stores: Dict[str, object] = {}
+
+REGISTRY.callback_gauge("ai_builder_sessions", "当前会话数", ("store",),
+                        lambda: {(name,): len(store) for name, store in _session_stores.items()})
+
+
+def register_scheduler(name: str, scheduler) -> None:
+    """注册上游调度器排队深度指标（scheduler需提供queue_depths()方法）"""
+    _schedulers[name] = scheduler
+
+
+_schedulers: Dict[str, object] = {}
+
+REGISTRY.callback_gauge("ai_builder_upstream_queue_depth", "上游调度器各类别排队数", ("scheduler", "traffic_class"),
+                        lambda: {(name, traffic_class): depth
+                                 for name, scheduler in _schedulers.items()
+                                 for traffic_class, depth in scheduler.queue_depths().items()})
+
+
+def register_backends(name: str, router) -> None:
+    """注册上游后端状态指标（router需提供backend_values(field)方法）"""
+    _backend_routers[name] = router
+
+
+_backend_routers: Dict[str, object] = {}
+
+
+def _backend_stat(field: str) -> Callable[[], Dict[Tuple, float]]:
+    return lambda: {(name,): value for router in _backend_routers.values()
+                    for name, value in router.backend_values(field).items()}
+
+
+REGISTRY.callback_gauge("ai_builder_upstream_backend_outstanding", "各上游后端进行中的调用数", ("backend",),
+                        _backend_stat("outstanding"))
+REGISTRY.callback_gauge("ai_builder_upstream_backend_latency_ewma_seconds", "各上游后端调用耗时EWMA", ("backend",),
+                        _backend_stat("latency_ewma"))
+REGISTRY.callback_gauge("ai_builder_upstream_backend_healthy", "上游后端是否可用（1可用，0摘除中）", ("backend",),
+                        _backend_stat("healthy"))
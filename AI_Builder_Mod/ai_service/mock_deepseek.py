@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+本地DeepSeek模拟服务
+实现兼容OpenAI的 /chat/completions 接口，可配置延迟分布、错误率和流式输出，
+用于压测和基准测试，避免调用真实API
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from independent_test import MockDeepSeekAPI
+
+DECISION_REPLY = """{
+    "action": "collect_wood",
+    "reasoning": "木材储备不足，优先收集木材以满足后续建设需求",
+    "priority": 0.7,
+    "message": "我去收集一些木材，咱们的建设需要更多材料。"
+}"""
+
+CHAT_REPLY = "好的，我先把木材备足，再按规划建造箱子和火堆。"
+
+# 聊天回复有多种说法，模拟真实模型在较高temperature下的变化
+CHAT_REPLIES = [
+    CHAT_REPLY,
+    "没问题，先去砍些木头，材料够了就开始建箱子和火堆。",
+    "收到！我会先收集木材，然后按计划搭建营地设施。",
+    "交给我吧，备齐木材后马上动工。",
+]
+
+CODE_REPLY = f"""{MockDeepSeekAPI.generate_reasoning()}
+
+```lua
+{MockDeepSeekAPI.generate_chopping_code()}
+```"""
+
+# 默认脚本：按提示词内容匹配回复
+DEFAULT_SCRIPT = [
+    {"match": "ExecuteAITask", "content": CODE_REPLY},
+    {"match": "玩家对你说", "content": CHAT_REPLIES},
+    {"match": ".*", "content": DECISION_REPLY},
+]
+
+
+class LatencyModel:
+    """上游延迟分布（秒）"""
+
+    def __init__(self, dist: str = "fixed", mean: float = 0.2, std: float = 0.05):
+        self.dist = dist
+        self.mean = mean
+        self.std = std
+
+    def sample(self) -> float:
+        if self.dist == "uniform":
+            value = random.uniform(self.mean - self.std, self.mean + self.std)
+        elif self.dist == "normal":
+            value = random.gauss(self.mean, self.std)
+        elif self.dist == "lognormal":
+            # 以均值和标准差换算对数正态参数，模拟上游的长尾延迟
+            variance = self.std ** 2
+            sigma2 = max(1e-9, math.log(1 + variance / (self.mean ** 2)))
+            mu = math.log(self.mean) - sigma2 / 2
+            value = random.lognormvariate(mu, sigma2 ** 0.5)
+        else:
+            value = self.mean
+        return max(0.0, value)
+
+
+class MockConfig:
+    """模拟服务的运行配置"""
+
+    def __init__(self, latency: LatencyModel, error_rate: float = 0.0, error_status: int = 500,
+                 stream_chunk_delay: float = 0.01, script: Optional[List[Dict]] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_chunk_delay = stream_chunk_delay
+        self.script = [(re.compile(rule["match"], re.DOTALL), rule["content"]) for rule in (script or DEFAULT_SCRIPT)]
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "streamed": 0}
+
+    def pick_reply(self, prompt: str) -> str:
+        for pattern, content in self.script:
+            if pattern.search(prompt):
+                # content为列表时随机挑选一条
+                return random.choice(content) if isinstance(content, list) else content
+        return DECISION_REPLY
+
+    def count(self, field: str):
+        with self.lock:
+            self.stats[field] += 1
+
+
+class MockDeepSeekHandler(BaseHTTPRequestHandler):
+    """处理 /chat/completions 请求"""
+
+    protocol_version = "HTTP/1.1"
+    config: MockConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, dict(self.config.stats))
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b"{}"
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        config = self.config
+        config.count("requests")
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+
+        time.sleep(config.latency.sample())
+
+        if random.random() < config.error_rate:
+            config.count("errors")
+            self._send_json(config.error_status, {"error": {"message": "mock upstream error"}})
+            return
+
+        prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+        content = config.pick_reply(prompt)
+
+        if body.get("stream"):
+            config.count("streamed")
+            self._stream(body, content)
+        else:
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "deepseek-chat"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": len(prompt) // 2, "completion_tokens": len(content) // 2}
+            })
+
+    def _stream(self, body: Dict, content: str, chunk_size: int = 16):
+        """以SSE格式分块输出"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_event(payload: str):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for start in range(0, len(content), chunk_size):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": body.get("model", "deepseek-chat"),
+                "choices": [{"index": 0, "delta": {"content": content[start:start + chunk_size]}, "finish_reason": None}]
+            }
+            write_event(json.dumps(chunk, ensure_ascii=False))
+            time.sleep(self.config.stream_chunk_delay)
+        write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class MockDeepSeekServer:
+    """可在测试代码中直接启动的模拟服务"""
+
+    def __init__(self, config: MockConfig, host: str = "127.0.0.1", port: int = 0):
+        handler = type("ConfiguredHandler", (MockDeepSeekHandler,), {"config": config})
+        self.config = config
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockDeepSeekServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="本地DeepSeek模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "normal", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-mean", type=float, default=0.2, help="平均延迟（秒）")
+    parser.add_argument("--latency-std", type=float, default=0.1, help="延迟标准差（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的概率 0-1")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.01, help="流式输出每块间隔（秒）")
+    parser.add_argument("--script", help="回复脚本JSON文件：[{\"match\": 正则, \"content\": 回复或回复列表}]")
+    return parser
+
+
+def config_from_args(args) -> MockConfig:
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+    return MockConfig(
+        latency=LatencyModel(args.latency_dist, args.latency_mean, args.latency_std),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stream_chunk_delay=args.stream_chunk_delay,
+        script=script
+    )
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    server = MockDeepSeekServer(config_from_args(args), args.host, args.port)
+    print(f"🧪 模拟DeepSeek服务运行于 {server.base_url}")
+    print(f"   延迟: {args.latency_dist} 均值{args.latency_mean}s 标准差{args.latency_std}s, 错误率: {args.error_rate}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
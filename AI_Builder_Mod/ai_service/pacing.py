@@ -0,0 +1,88 @@
+# AI建设助手决策间隔建议
+# 客户端按固定间隔请求决策，局势平稳时大多数请求得到的是同一个决策，紧急时又反应太慢：
+# 服务端按上下文的变化可能性给出下次决策的建议时间，随决策返回，客户端据此安排下一次请求
+
+import random
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+
+
+@dataclass(frozen=True)
+class PacingRule:
+    """命中条件时下次决策最迟在interval秒后（取所有命中规则中最短的）"""
+    reason: str
+    interval: float
+    condition: Callable[[Any], bool]
+
+
+def _pending_build(context) -> bool:
+    if context.resource_needs:
+        return True
+    return bool(context.total_planned) and (context.planning_progress or 0.0) < 1.0
+
+
+# 阈值与后备规则一致
+DEFAULT_RULES = (
+    PacingRule("night_unlit", 8, lambda c: c.is_night and not c.has_campfire),
+    PacingRule("dusk_unlit", 10, lambda c: c.time_phase == "dusk" and not c.has_campfire),
+    PacingRule("low_stats", 15, lambda c: c.health < 50 or c.hunger < 40 or c.sanity < 40),
+    PacingRule("inventory_full", 20, lambda c: c.inventory_full),
+    PacingRule("pending_build", 30, _pending_build),
+    PacingRule("low_resources", 30, lambda c: c.wood_count < 10 or c.stone_count < 5),
+)
+
+
+class DecisionPacer:
+    """按上下文给出下次决策的建议秒数
+
+    - 生存紧急（is_urgent）时为min_interval
+    - 否则取命中的规则中最短的间隔，都不命中时为max_interval（局势平稳）
+    - 结果限制在[min_interval, max_interval]，再加±jitter比例的随机抖动（不低于min_interval），
+      避免大量建造者在阶段切换后同一时刻再次请求
+    """
+
+    def __init__(self, min_interval: float = 5.0, max_interval: float = 60.0, jitter: float = 0.1,
+                 rules=DEFAULT_RULES, is_urgent: Optional[Callable[[Any], bool]] = None,
+                 rng: Optional[random.Random] = None):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.jitter = jitter
+        self.rules = rules
+        self.is_urgent = is_urgent
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._reasons: Dict[str, int] = {}
+        self._total_interval = 0.0
+        self._count = 0
+
+    def recommend(self, context) -> Tuple[float, str]:
+        """返回 (建议秒数, 原因)"""
+        if self.is_urgent is not None and self.is_urgent(context):
+            interval, reason = self.min_interval, "urgent"
+        else:
+            interval, reason = self.max_interval, "stable"
+            for rule in self.rules:
+                if rule.interval < interval and rule.condition(context):
+                    interval, reason = rule.interval, rule.reason
+        interval = min(self.max_interval, max(self.min_interval, interval))
+        if self.jitter > 0:
+            interval = max(self.min_interval, interval * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+        interval = round(interval, 1)
+        metrics.DECISION_PACING.inc(reason)
+        with self._lock:
+            self._reasons[reason] = self._reasons.get(reason, 0) + 1
+            self._total_interval += interval
+            self._count += 1
+        return interval, reason
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "min_interval": self.min_interval,
+                "max_interval": self.max_interval,
+                "avg_interval": round(self._total_interval / self._count, 2) if self._count else 0.0,
+                "reasons": dict(self._reasons)
+            }
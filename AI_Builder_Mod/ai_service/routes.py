@@ -0,0 +1,444 @@
+# AI建设助手HTTP接口
+# 路由、请求指标和追踪钩子，由 app.create_app() 注册到Flask应用
+
+import logging
+import time
+from dataclasses import asdict
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, request
+
+import metrics
+import tracing
+from app import (JOB_MAX_WAIT, MAX_BATCH_SIZE, AIService, ContextValidationError, LoadShed,
+                 SessionResyncRequired, parse_game_context)
+from bucketing import BUCKET_SPEC_VERSION
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint("ai_builder", __name__)
+
+SESSION_VERSION_HEADER = "X-Session-Version"  # 服务端已确认的会话版本
+
+def _service() -> AIService:
+    """当前应用绑定的AI服务实例"""
+    return current_app.extensions["ai_service"]
+
+def _context_error(e: ContextValidationError):
+    """上下文校验失败的响应"""
+    logger.warning(f"上下文数据无效: {e}")
+    return jsonify({"error": "上下文数据无效", "details": e.errors}), 400
+
+def _resync_required(e: SessionResyncRequired):
+    """增量上下文无法应用，要求客户端重新发送完整上下文"""
+    logger.info(f"会话需要重新同步: {e}")
+    return jsonify({
+        "error": "需要重新同步上下文",
+        "resync": True,
+        "reason": e.reason,
+        "expected_version": e.expected_version
+    }), 409
+
+def _shed_response(route: str, payload: dict, e: LoadShed):
+    """准入控制拒绝时的降级响应：立即返回本地后备结果，并提示客户端多久后再请求
+
+    Retry-After同时放在响应体里，供读不到响应头的客户端使用。
+    """
+    logger.info(f"请求被准入控制拒绝: {e}")
+    metrics.RESPONSE_SOURCE.inc(route, "shed")
+    payload["source"] = "shed"
+    payload["retry_after"] = e.retry_after
+    response = jsonify(payload)
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+def _request_body() -> dict:
+    """读取JSON请求体：无法解析或不是对象时按上下文无效处理（400），不落入通用的500分支"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ContextValidationError(["请求体必须是JSON对象"])
+    return data
+
+def _request_str(data: dict, name: str, default: str) -> str:
+    """读取字符串字段，类型不对时按上下文无效处理（400）"""
+    value = data.get(name, default)
+    if not isinstance(value, str):
+        raise ContextValidationError([f"{name}必须是字符串"])
+    return value
+
+def _request_context(data: dict):
+    """从请求构建游戏上下文
+
+    带session字段时使用增量协议：context为完整上下文（注册/重新同步），
+    否则context_delta只包含变化的字段，context_removed列出变为空的字段。
+    """
+    session = data.get('session')
+    if session is None:
+        return parse_game_context(data.get('context'))
+    
+    entity_id = session.get('entity_id') if isinstance(session, dict) else None
+    version = session.get('version') if isinstance(session, dict) else None
+    if not isinstance(entity_id, str) or not entity_id or isinstance(version, bool) or not isinstance(version, int):
+        raise ContextValidationError(["session必须包含字符串entity_id和整数version"])
+    
+    full_context = data.get('context')
+    delta = data.get('context_delta')
+    removed = data.get('context_removed')
+    if delta is None:
+        delta = {}
+    if removed is None:
+        removed = []
+    if full_context is not None and not isinstance(full_context, dict):
+        raise ContextValidationError(["context必须是对象"])
+    if not isinstance(delta, dict):
+        raise ContextValidationError(["context_delta必须是对象"])
+    if not isinstance(removed, list) or not all(isinstance(name, str) for name in removed):
+        raise ContextValidationError(["context_removed必须是字符串列表"])
+    
+    context, version = _service().sessions.apply(entity_id, version, context=full_context,
+                                                 delta=delta, removed=removed)
+    request.environ["ai_builder.session_version"] = version
+    request.environ["ai_builder.entity_id"] = entity_id
+    return context
+
+def _entity_id():
+    """当前请求的会话实体ID（未使用会话时为None）"""
+    return request.environ.get("ai_builder.entity_id")
+
+def _route_label() -> str:
+    """获取用于指标的路由标签（未匹配的路径统一归类，避免标签爆炸）"""
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+@bp.before_app_request
+def _start_request_metrics():
+    """记录请求开始时间和进行中请求数，并按采样开始追踪"""
+    # 每个请求都会经过这三个钩子：只取一次environ，路由标签算一次存起来，请求头直接从environ读
+    environ = request.environ
+    environ["ai_builder.start_time"] = time.perf_counter()
+    route = environ["ai_builder.route"] = _route_label()
+    metrics.HTTP_IN_FLIGHT.inc(route)
+    
+    # 沿用Lua客户端传来的关联ID，没有则生成新的
+    correlation_id = environ.get(tracing.CORRELATION_ENVIRON) or tracing.new_correlation_id()
+    environ["ai_builder.correlation_id"] = correlation_id
+    force = environ.get(tracing.FORCE_TRACE_ENVIRON) == "1"
+    tracing.start_trace(route, environ["REQUEST_METHOD"], correlation_id, force=force)
+
+@bp.after_app_request
+def _record_request_metrics(response):
+    """记录请求计数和耗时"""
+    environ = request.environ
+    start_time = environ.get("ai_builder.start_time")
+    if start_time is not None:
+        route = environ["ai_builder.route"]
+        metrics.HTTP_REQUESTS.inc(route, environ["REQUEST_METHOD"], str(response.status_code))
+        metrics.HTTP_LATENCY.observe(route, value=time.perf_counter() - start_time)
+    
+    correlation_id = environ.get("ai_builder.correlation_id")
+    if correlation_id:
+        response.headers[tracing.CORRELATION_HEADER] = correlation_id
+    session_version = environ.get("ai_builder.session_version")
+    if session_version is not None:
+        response.headers[SESSION_VERSION_HEADER] = str(session_version)
+    tracing.finish_trace(response.status_code)
+    return response
+
+@bp.teardown_app_request
+def _finish_request_metrics(exc=None):
+    """无论请求是否异常都减少进行中请求数"""
+    route = request.environ.get("ai_builder.route")
+    if route is not None:
+        metrics.HTTP_IN_FLIGHT.dec(route)
+
+@bp.route('/ping', methods=['GET', 'POST'])
+def ping():
+    """健康检查接口"""
+    return jsonify({
+        "status": "ok",
+        "message": "AI建设助手服务运行正常",
+        "timestamp": datetime.now().isoformat()
+    })
+
+@bp.route('/decision', methods=['POST'])
+def get_decision():
+    """获取AI决策"""
+    try:
+        data = _request_body()
+        
+        # 构建游戏上下文
+        with tracing.span("game_context"):
+            context = _request_context(data)
+        
+        # 获取AI决策
+        with tracing.span("get_decision"):
+            decision = _service().get_deepseek_decision(context, _entity_id())
+        metrics.RESPONSE_SOURCE.inc("decision", decision.source)
+        
+        # 附带规范缓存键，客户端据此确认本地分档规则与服务端一致
+        payload = asdict(decision)
+        payload["cache_key"] = _service()._decision_cache_key(context)
+        payload["bucket_version"] = BUCKET_SPEC_VERSION
+        # 下次决策的建议秒数，客户端据此安排下一次请求
+        payload["next_decision_in"], payload["pacing_reason"] = _service().pacer.recommend(context)
+        return jsonify(payload)
+        
+    except ContextValidationError as e:
+        metrics.RESPONSE_SOURCE.inc("decision", "invalid")
+        return _context_error(e)
+    except SessionResyncRequired as e:
+        metrics.RESPONSE_SOURCE.inc("decision", "resync")
+        return _resync_required(e)
+    except LoadShed as e:
+        return _shed_response("decision", asdict(_service()._get_fallback_decision(context)), e)
+    except Exception as e:
+        logger.error(f"决策请求处理失败: {e}")
+        metrics.RESPONSE_SOURCE.inc("decision", "error")
+        return jsonify({
+            "action": "idle",
+            "reasoning": "服务器处理错误",
+            "priority": 0.1,
+            "message": "遇到了一些技术问题，稍后再试。",
+            "source": "error"
+        }), 500
+
+@bp.route('/chat', methods=['POST'])
+def chat():
+    """聊天接口"""
+    try:
+        data = _request_body()
+        player_message = _request_str(data, 'player_message', '')
+        
+        # 构建游戏上下文
+        with tracing.span("game_context"):
+            context = _request_context(data)
+        
+        # 获取聊天响应
+        response_message = _service().get_chat_response(player_message, context, _entity_id())
+        
+        return jsonify({
+            "message": response_message,
+            "tone": "professional"
+        })
+        
+    except ContextValidationError as e:
+        return _context_error(e)
+    except SessionResyncRequired as e:
+        return _resync_required(e)
+    except LoadShed as e:
+        return _shed_response("chat", {
+            "message": _service().fallback_chat_response(player_message, context),
+            "tone": "professional"
+        }, e)
+    except Exception as e:
+        logger.error(f"聊天请求处理失败: {e}")
+        return jsonify({
+            "message": "抱歉，我现在有点忙，稍后再聊。",
+            "tone": "apologetic"
+        }), 500
+
+def _lua_code_payload(lua_code: str, reasoning: str, task_type: str) -> dict:
+    """代码生成接口的响应内容（同步接口和异步任务结果相同）"""
+    return {
+        "success": True,
+        "lua_code": lua_code,
+        "reasoning": reasoning,
+        "task_type": task_type,
+        "timestamp": datetime.now().isoformat()
+    }
+
+def _shed_lua_code_payload(service: AIService, task_type: str) -> dict:
+    return _lua_code_payload(service.get_fallback_lua_code(task_type), "服务繁忙，使用本地预设代码", task_type)
+
+@bp.route('/generate_lua_code', methods=['POST'])
+def generate_lua_code():
+    """生成Lua执行代码"""
+    try:
+        data = _request_body()
+        player_instruction = _request_str(data, 'instruction', '')
+        task_type = _request_str(data, 'task_type', 'general')
+        
+        # 构建游戏上下文
+        with tracing.span("game_context"):
+            context = _request_context(data)
+        
+        # 生成Lua代码
+        lua_code, reasoning = _service().generate_lua_code(player_instruction, context, task_type)
+        
+        return jsonify(_lua_code_payload(lua_code, reasoning, task_type))
+        
+    except ContextValidationError as e:
+        return _context_error(e)
+    except SessionResyncRequired as e:
+        return _resync_required(e)
+    except LoadShed as e:
+        return _shed_response("generate_lua_code", _shed_lua_code_payload(_service(), task_type), e)
+    except Exception as e:
+        logger.error(f"Lua代码生成失败: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "fallback_code": _service().get_fallback_lua_code(task_type)
+        }), 500
+
+def _run_codegen_job(service: AIService, instruction: str, context, task_type: str) -> dict:
+    """在任务工作线程中生成代码，结果与同步接口的响应内容相同，另带来源（决定结果能否被相同请求复用）"""
+    try:
+        lua_code, reasoning, source = service.generate_lua_code_with_source(instruction, context, task_type)
+        return dict(_lua_code_payload(lua_code, reasoning, task_type), source=source)
+    except LoadShed as e:
+        metrics.RESPONSE_SOURCE.inc("generate_lua_code", "shed")
+        return dict(_shed_lua_code_payload(service, task_type), source="shed", retry_after=e.retry_after)
+
+@bp.route('/generate_lua_code/jobs', methods=['POST'])
+def submit_lua_code_job():
+    """提交异步代码生成任务，立即返回任务ID；相同的指令、任务类型和状态分档复用已有任务"""
+    try:
+        data = _request_body()
+        player_instruction = _request_str(data, 'instruction', '')
+        task_type = _request_str(data, 'task_type', 'general')
+        
+        with tracing.span("game_context"):
+            context = _request_context(data)
+        
+        service = _service()
+        job_key = service._code_cache_key(player_instruction, context, task_type)
+        job, deduplicated = service.jobs.submit(
+            job_key, lambda: _run_codegen_job(service, player_instruction, context, task_type))
+        
+        payload = job.to_dict()
+        payload["deduplicated"] = deduplicated
+        payload["poll_after"] = 1
+        response = jsonify(payload)
+        response.status_code = 202
+        response.headers["Location"] = f"/jobs/{job.job_id}"
+        return response
+        
+    except ContextValidationError as e:
+        return _context_error(e)
+    except SessionResyncRequired as e:
+        return _resync_required(e)
+    except LoadShed as e:
+        # 任务排队已满：直接返回后备代码作为已完成的结果
+        return _shed_response("generate_lua_code", {
+            "status": "done",
+            "result": _shed_lua_code_payload(_service(), task_type)
+        }, e)
+    except Exception as e:
+        logger.error(f"提交代码生成任务失败: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/jobs/<job_id>', methods=['GET', 'POST'])
+def get_job(job_id):
+    """查询异步任务状态；wait参数为长轮询秒数（不超过JOB_MAX_WAIT），任务结束或超时后返回
+
+    Lua客户端的传输函数不区分请求方法（统一POST），与 /ping 一样同时接受GET和POST，请求体被忽略
+    """
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0.0), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait必须是数字"}), 400
+    
+    job = _service().jobs.wait(job_id, wait)
+    if job is None:
+        return jsonify({"error": "任务不存在或已过期", "job_id": job_id}), 404
+    
+    payload = job.to_dict()
+    if job.state in ("queued", "running"):
+        payload["poll_after"] = 1
+    return jsonify(payload)
+
+@bp.route('/validate_lua_code', methods=['POST'])
+def validate_lua_code():
+    """验证Lua代码安全性"""
+    try:
+        data = _request_body()
+        lua_code = data.get('lua_code', '')
+        if not isinstance(lua_code, str):
+            return jsonify({"is_safe": False, "errors": ["lua_code必须是字符串"], "warnings": []}), 400
+        
+        with tracing.span("validate"):
+            validation_result = _service().validate_lua_code_safety(lua_code)
+        
+        return jsonify(validation_result)
+        
+    except ContextValidationError as e:
+        return jsonify({"is_safe": False, "errors": e.errors, "warnings": []}), 400
+    except Exception as e:
+        logger.error(f"Lua代码验证失败: {e}")
+        return jsonify({
+            "is_safe": False,
+            "errors": [str(e)],
+            "warnings": []
+        }), 500
+
+@bp.route('/validate_lua_code_batch', methods=['POST'])
+def validate_lua_code_batch():
+    """批量验证Lua代码安全性"""
+    try:
+        data = _request_body()
+        lua_codes = data.get('lua_codes', [])
+        
+        if not isinstance(lua_codes, list) or not all(isinstance(code, str) for code in lua_codes):
+            return jsonify({"error": "lua_codes必须是字符串列表"}), 400
+        if len(lua_codes) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"批量大小超过上限{MAX_BATCH_SIZE}"}), 400
+        
+        with tracing.span("validate_batch"):
+            results = _service().validate_lua_code_batch(lua_codes)
+        
+        return jsonify({
+            "results": results,
+            "count": len(results),
+            "all_safe": all(result["is_safe"] for result in results)
+        })
+        
+    except ContextValidationError as e:
+        return jsonify({"results": [], "error": "; ".join(e.errors)}), 400
+    except Exception as e:
+        logger.error(f"批量Lua代码验证失败: {e}")
+        return jsonify({
+            "results": [],
+            "error": str(e)
+        }), 500
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus指标接口"""
+    return metrics.REGISTRY.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+@bp.route('/debug/trace', methods=['GET'])
+def debug_trace():
+    """查看最近的请求追踪记录"""
+    # limit限制在1到缓冲区大小之间（负数会变成切片边界）
+    limit = min(max(request.args.get('limit', 50, type=int), 1), tracing.TRACE_BUFFER_SIZE)
+    route = request.args.get('route')
+    correlation_id = request.args.get('correlation_id')
+    
+    return jsonify({
+        "sample_rate": tracing.sampler.rate,
+        "max_sample_rate": tracing.sampler.max_rate,
+        "overhead_budget": tracing.sampler.budget,
+        "traces": tracing.recent_traces(limit, route, correlation_id)
+    })
+
+@bp.route('/status', methods=['GET'])
+def get_status():
+    """获取服务状态"""
+    return jsonify({
+        "service": "AI Builder Assistant",
+        "status": "running",
+        "api_available": _service().backends.available(),
+        "code_generation": True,
+        "validation_cache": _service().validation_cache.stats(),
+        "chat_index": _service().chat_index.stats(),
+        "task_library": _service().task_library.stats(),
+        "codegen": _service().codegen.stats(),
+        "jobs": _service().jobs.stats(),
+        "sessions": _service().sessions.stats(),
+        "upstream_scheduler": _service().scheduler.stats(),
+        "upstream_backends": _service().backends.stats(),
+        "speculation": _service().speculation.stats(),
+        "decision_pacing": _service().pacer.stats(),
+        "cache_warmup": _service().warmer.stats(),
+        "timestamp": datetime.now().isoformat()
+    })
@@ -0,0 +1,195 @@
+# AI建设助手上游调度器
+# 决策、聊天和代码生成共用同一个DeepSeek上游：各流量类别单独排队，
+# 在上游并发上限内按权重轮流放行，生存紧急的决策优先于所有排队中的请求；
+# 积压过多或预计排队过久时直接拒绝（准入控制），由调用方立即返回本地后备结果
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import metrics
+
+# 紧急类别：严格优先，不参与加权轮转
+URGENT = "urgent"
+
+DEFAULT_WEIGHTS = {"decision": 4, "chat": 2, "generate_lua_code": 1}
+
+
+class SchedulerTimeout(Exception):
+    """排队超时，调用方应改用本地后备结果"""
+
+    def __init__(self, traffic_class: str, waited: float):
+        self.traffic_class = traffic_class
+        self.waited = waited
+        super().__init__(f"{traffic_class} 排队 {waited:.2f}s 后超时")
+
+
+class LoadShed(Exception):
+    """准入控制拒绝：上游积压过多，调用方应立即返回本地后备结果并提示客户端稍后重试"""
+
+    def __init__(self, traffic_class: str, reason: str, retry_after: int):
+        self.traffic_class = traffic_class
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{traffic_class} 被拒绝: {reason}")
+
+
+def parse_weights(spec: str) -> Dict[str, int]:
+    """解析 "decision=4,chat=2" 格式的权重配置，未列出的类别使用默认权重"""
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        weights[name.strip()] = max(1, int(value))
+    return weights
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class UpstreamScheduler:
+    """上游调用调度器
+
+    - 正在进行的上游调用不超过max_concurrency，空闲且无人排队时直接放行
+    - 紧急类别有排队请求时总是先放行紧急请求
+    - 其他类别按平滑加权轮转放行：权重4:2:1的类别在都有积压时获得约4:2:1的上游份额，
+      空闲类别不积累额度
+    - 排队超过queue_timeout秒抛出SchedulerTimeout
+    - 准入控制：进行中+排队的调用达到max_pending，或按平均调用耗时估算的排队时间超过max_queue_wait时，
+      非紧急请求在排队前即抛出LoadShed（紧急请求总是排队）
+    """
+
+    def __init__(self, max_concurrency: int = 8, weights: Optional[Dict[str, int]] = None,
+                 queue_timeout: float = 10.0, max_pending: int = 64, max_queue_wait: float = 5.0):
+        self.max_concurrency = max_concurrency
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.queue_timeout = queue_timeout
+        self.max_pending = max_pending
+        self.max_queue_wait = max_queue_wait
+        self._hold_ewma = 0.0  # 上游调用平均占用名额的秒数
+        self._queued = 0
+        self._queues: Dict[str, deque] = {name: deque() for name in (URGENT, *self.weights)}
+        self._current: Dict[str, int] = {name: 0 for name in self.weights}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, traffic_class: str, timeout: Optional[float] = None) -> float:
+        """等待上游调用名额，返回排队耗时（秒）"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        with self._lock:
+            queue = self._queues.get(traffic_class)
+            if queue is None:
+                queue = self._queues[traffic_class] = deque()
+                self.weights[traffic_class] = 1
+                self._current[traffic_class] = 0
+            if self._in_flight < self.max_concurrency and not self._queued:
+                self._in_flight += 1
+                metrics.UPSTREAM_QUEUE_WAIT.observe(traffic_class, value=0.0)
+                return 0.0
+            if traffic_class != URGENT:
+                self._admit(traffic_class)
+            waiter = _Waiter()
+            queue.append(waiter)
+            self._queued += 1
+
+        waiter.event.wait(timeout)
+        waited = time.perf_counter() - start
+        with self._lock:
+            if not waiter.granted:
+                # 超时：放行与出队都在锁内，确认未被放行后再移除
+                queue.remove(waiter)
+                self._queued -= 1
+                metrics.UPSTREAM_QUEUE_WAIT.observe(traffic_class, value=waited)
+                raise SchedulerTimeout(traffic_class, waited)
+        metrics.UPSTREAM_QUEUE_WAIT.observe(traffic_class, value=waited)
+        return waited
+
+    def try_acquire(self, traffic_class: str) -> bool:
+        """不排队地尝试获取名额：只有上游有空闲名额且无人排队时才成功（用于后台预计算）"""
+        with self._lock:
+            if self._in_flight >= self.max_concurrency or self._queued:
+                return False
+            self._in_flight += 1
+        metrics.UPSTREAM_QUEUE_WAIT.observe(traffic_class, value=0.0)
+        return True
+
+    def is_idle(self, max_in_flight: int = 0) -> bool:
+        """上游是否空闲：没有排队，且进行中的调用不超过max_in_flight"""
+        with self._lock:
+            return not self._queued and self._in_flight <= max_in_flight
+
+    def _admit(self, traffic_class: str):
+        # 调用方持有锁
+        pending = self._in_flight + self._queued
+        if pending >= self.max_pending:
+            self._shed(traffic_class, "pending", f"上游积压{pending}个请求")
+        estimated = self.estimated_wait()
+        if estimated > self.max_queue_wait:
+            self._shed(traffic_class, "queue_wait", f"预计排队{estimated:.1f}s")
+
+    def _shed(self, traffic_class: str, cause: str, reason: str):
+        metrics.UPSTREAM_SHED.inc(traffic_class, cause)
+        retry_after = max(1, min(60, math.ceil(self.estimated_wait() or self._hold_ewma or 1.0)))
+        raise LoadShed(traffic_class, reason, retry_after)
+
+    def estimated_wait(self) -> float:
+        """新请求的预计排队秒数：排在前面的请求数 × 平均调用耗时 / 并发上限"""
+        return self._queued * self._hold_ewma / self.max_concurrency
+
+    def release(self, held: Optional[float] = None):
+        """归还名额，held为本次调用占用名额的秒数（用于估算排队时间）"""
+        with self._lock:
+            self._in_flight -= 1
+            if held is not None:
+                self._hold_ewma = held if not self._hold_ewma else 0.8 * self._hold_ewma + 0.2 * held
+            self._dispatch()
+
+    def _dispatch(self):
+        # 调用方持有锁
+        while self._in_flight < self.max_concurrency:
+            queue = self._queues[URGENT] if self._queues[URGENT] else self._next_weighted_queue()
+            if queue is None:
+                return
+            waiter = queue.popleft()
+            self._queued -= 1
+            waiter.granted = True
+            self._in_flight += 1
+            waiter.event.set()
+
+    def _next_weighted_queue(self) -> Optional[deque]:
+        """平滑加权轮转：只在有积压的类别之间分配"""
+        backlogged = [name for name in self.weights if self._queues[name]]
+        if not backlogged:
+            return None
+        total = 0
+        for name in backlogged:
+            self._current[name] += self.weights[name]
+            total += self.weights[name]
+        chosen = max(backlogged, key=self._current.__getitem__)
+        self._current[chosen] -= total
+        for name in self.weights:
+            if name not in backlogged:
+                self._current[name] = 0
+        return self._queues[chosen]
+
+    def queue_depths(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: len(queue) for name, queue in self._queues.items()}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "max_pending": self.max_pending,
+                "estimated_wait": round(self.estimated_wait(), 3),
+                "queued": {name: len(queue) for name, queue in self._queues.items()},
+                "weights": dict(self.weights),
+            }
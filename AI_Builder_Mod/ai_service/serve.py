@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+AI建设助手生产环境启动入口
+主进程监听端口后预先fork多个工作进程，每个工作进程拥有独立的AIService，
+决策、代码生成和验证缓存通过SQLite共享。
+
+信号:
+  SIGHUP          平滑重载：启动新一代工作进程（重新导入代码），再让旧进程处理完请求后退出
+  SIGTERM/SIGINT  平滑停止
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Dict
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _worker_main(sock: socket.socket, host: str, threaded: bool):
+    """工作进程：导入应用并在继承的监听套接字上提供服务"""
+    # 在fork之后才导入应用，这样SIGHUP重载时新进程会加载新代码
+    sys.path.insert(0, SERVICE_DIR)
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    server = make_server(host, 0, app_module.create_app(), threaded=threaded, fd=sock.fileno())
+    # 关闭时等待正在处理的请求完成
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    def handle_term(signum, frame):
+        # serve_forever运行在主线程，shutdown必须从其他线程调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_term)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+    os._exit(0)
+
+
+class PreforkMaster:
+    """预fork主进程：管理工作进程的启动、重启和平滑重载"""
+
+    def __init__(self, sock: socket.socket, host: str, workers: int, threaded: bool, graceful_timeout: float):
+        self.sock = sock
+        self.host = host
+        self.num_workers = workers
+        self.threaded = threaded
+        self.graceful_timeout = graceful_timeout
+        self.workers: Dict[int, int] = {}  # pid -> 代数
+        self.generation = 0
+        self.running = True
+        self.reload_requested = False
+
+    def spawn_worker(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _worker_main(self.sock, self.host, self.threaded)
+            finally:
+                os._exit(1)
+        self.workers[pid] = self.generation
+        return pid
+
+    def spawn_generation(self):
+        self.generation += 1
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+        print(f"[serve] 第{self.generation}代工作进程已启动: {self.num_workers}个")
+
+    def stop_workers(self, generation_below: int):
+        """向旧代工作进程发送SIGTERM，让其处理完请求后退出"""
+        for pid, generation in list(self.workers.items()):
+            if generation < generation_below:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    self.workers.pop(pid, None)
+
+    def reap(self):
+        """回收已退出的工作进程，当前代的异常退出会被补齐"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation = self.workers.pop(pid, None)
+            if self.running and generation == self.generation:
+                print(f"[serve] 工作进程{pid}意外退出(状态{status})，重新启动")
+                self.spawn_worker()
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, "reload_requested", True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "running", False))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "running", False))
+
+        self.spawn_generation()
+        while self.running:
+            if self.reload_requested:
+                self.reload_requested = False
+                print("[serve] 收到SIGHUP，平滑重载")
+                self.spawn_generation()
+                self.stop_workers(self.generation)
+            self.reap()
+            time.sleep(0.2)
+
+        print("[serve] 正在停止工作进程...")
+        self.stop_workers(self.generation + 1)
+        deadline = time.time() + self.graceful_timeout
+        while self.workers and time.time() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.reap()
+        print("[serve] 已停止")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI建设助手多进程服务")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--no-threads", action="store_true", help="每个工作进程单线程处理请求")
+    parser.add_argument("--shared-cache", default=os.getenv("SHARED_CACHE_PATH", "ai_builder_cache.db"),
+                        help="跨进程共享缓存的SQLite文件")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0, help="停止时等待请求完成的秒数")
+    args = parser.parse_args()
+
+    # 工作进程在fork后导入应用，通过环境变量拿到共享缓存路径
+    os.environ["SHARED_CACHE_PATH"] = args.shared_cache
+
+    if not hasattr(os, "fork"):
+        # Windows不支持fork，退化为单进程多线程服务
+        print("[serve] 当前平台不支持fork，使用单进程模式")
+        sys.path.insert(0, SERVICE_DIR)
+        import app as app_module
+        app_module.create_app().run(host=args.host, port=args.port, threaded=True)
+        return
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+
+    print(f"[serve] AI建设助手服务监听 {args.host}:{args.port}，工作进程{args.workers}个，共享缓存 {args.shared_cache}")
+    PreforkMaster(sock, args.host, args.workers, not args.no_threads, args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    main()
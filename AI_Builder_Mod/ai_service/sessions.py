@@ -0,0 +1,427 @@
+# AI建设助手会话状态
+# 每个建造者（实体ID）在服务端保存最近一次的完整上下文（客户端之后只发送变化的字段），
+# 以及有界的对话/决策历史：超出预算的旧记录折叠进摘要（决策按动作汇总次数，对话保留截断的节选），
+# 会话数和单会话字节数都有上限。
+# 多进程部署时会话保存在共享的SQLite文件中，增量落到任何一个工作进程都能应用
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from context_schema import ContextValidationError
+
+
+class SessionResyncRequired(Exception):
+    """会话不存在或增量版本不连续，客户端需要重新发送完整上下文"""
+
+    def __init__(self, entity_id: str, reason: str, expected_version: Optional[int] = None):
+        self.entity_id = entity_id
+        self.reason = reason
+        self.expected_version = expected_version
+        super().__init__(f"{entity_id}: {reason}")
+
+
+ROLE_LABELS = {"player": "玩家", "assistant": "艾德", "decision": "决策"}
+
+SUMMARY_MAX_TOPICS = 12       # 摘要中分别计数的决策动作数，更多的归入"其他"
+EXCERPT_CHARS = 40            # 折叠进摘要的对话每条保留的字数
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文约每字1个，ASCII约每4个字符1个"""
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def _json_size(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+class Turn:
+    """一条对话或决策记录"""
+
+    __slots__ = ("role", "text", "topic", "tokens", "size")
+
+    def __init__(self, role: str, text: str, topic: Optional[str] = None):
+        self.role = role
+        self.text = text
+        self.topic = topic        # 决策记录的动作，折叠时按动作计数
+        self.tokens = estimate_tokens(text)
+        self.size = len(text.encode("utf-8"))
+
+
+class Session:
+    """单个实体的会话状态"""
+
+    __slots__ = ("entity_id", "context", "context_bytes", "version", "last_seen",
+                 "turns", "topics", "excerpts", "summary", "history_tokens", "history_bytes")
+
+    def __init__(self, entity_id: str, context: Dict[str, Any], version: int, now: float,
+                 context_bytes: Optional[int] = None):
+        self.entity_id = entity_id
+        self.context = context
+        self.context_bytes = _json_size(context) if context_bytes is None else context_bytes
+        self.version = version
+        self.last_seen = now
+        self.turns: "deque[Turn]" = deque()
+        self.topics: Dict[str, int] = {}       # 已折叠的决策：动作 -> 次数
+        self.excerpts: "deque[str]" = deque()  # 已折叠的对话节选
+        self.summary = ""                      # 由topics和excerpts生成的摘要文本
+        self.history_tokens = 0
+        self.history_bytes = 0
+
+    def set_context(self, context: Dict[str, Any], context_bytes: int):
+        self.context = context
+        self.context_bytes = context_bytes
+
+    def add_turn(self, turn: Turn):
+        self.turns.append(turn)
+        self.history_tokens += turn.tokens
+        self.history_bytes += turn.size
+
+    def total_bytes(self) -> int:
+        """计入单会话上限的字节数：上下文 + 历史 + 摘要"""
+        return self.context_bytes + self.history_bytes + len(self.summary.encode("utf-8"))
+
+    def history_json(self) -> str:
+        return json.dumps({
+            "turns": [[turn.role, turn.text, turn.topic] for turn in self.turns],
+            "topics": self.topics,
+            "excerpts": list(self.excerpts),
+            "summary": self.summary
+        }, ensure_ascii=False)
+
+    def load_history(self, raw: str):
+        history = json.loads(raw)
+        for role, text, topic in history["turns"]:
+            self.add_turn(Turn(role, text, topic))
+        self.topics = history["topics"]
+        self.excerpts = deque(history["excerpts"])
+        self.summary = history["summary"]
+
+
+class MemorySessionBackend:
+    """进程内会话表（单进程部署），按最近使用排序"""
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            yield
+
+    reading = transaction
+
+    def load(self, entity_id: str) -> Optional[Session]:
+        return self._sessions.get(entity_id)
+
+    def save(self, session: Session):
+        self._sessions[session.entity_id] = session
+        self._sessions.move_to_end(session.entity_id)
+
+    def evict(self, idle_deadline: float, max_sessions: int) -> int:
+        # 会话按最近使用排序，只需从最旧的一端检查
+        evicted = 0
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_seen >= idle_deadline and len(self._sessions) <= max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def recent(self, limit: int, deadline: float) -> List[Tuple[str, Dict[str, Any]]]:
+        result = []
+        with self._lock:
+            for session in reversed(self._sessions.values()):
+                if session.last_seen < deadline or len(result) >= limit:
+                    break
+                result.append((session.entity_id, dict(session.context)))
+        return result
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(session.total_bytes() for session in self._sessions.values())
+
+
+class SqliteSessionBackend:
+    """基于SQLite（WAL模式）的跨进程会话表
+
+    每次应用上下文或追加记录在一个写事务中读出、修改并写回整个会话，
+    各工作进程看到的版本号和历史一致。空闲和超出容量的会话每隔几秒批量删除。
+    """
+
+    def __init__(self, path: str, evict_interval: float = 5.0):
+        self.path = path
+        self.evict_interval = evict_interval
+        self._local = threading.local()
+        self._last_evict = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        # 每个线程独立连接；fork后的子进程不能复用父进程的连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    entity_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    context TEXT NOT NULL,
+                    history TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_seen REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def reading(self):
+        # 单条SELECT本身是一致的快照，只读时不占用写锁
+        yield
+
+    def load(self, entity_id: str) -> Optional[Session]:
+        row = self._conn().execute(
+            "SELECT version, context, history, last_seen FROM sessions WHERE entity_id = ?", (entity_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        session = Session(entity_id, json.loads(row[1]), row[0], row[3], len(row[1].encode("utf-8")))
+        session.load_history(row[2])
+        return session
+
+    def save(self, session: Session):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (entity_id, version, context, history, size, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (session.entity_id, session.version,
+             json.dumps(session.context, ensure_ascii=False, separators=(",", ":")),
+             session.history_json(), session.total_bytes(), session.last_seen)
+        )
+
+    def evict(self, idle_deadline: float, max_sessions: int) -> int:
+        now = time.time()
+        if now - self._last_evict < self.evict_interval:
+            return 0
+        self._last_evict = now
+        conn = self._conn()
+        evicted = conn.execute("DELETE FROM sessions WHERE last_seen < ?", (idle_deadline,)).rowcount
+        evicted += conn.execute('''
+            DELETE FROM sessions WHERE entity_id IN (
+                SELECT entity_id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?
+            )
+        ''', (max_sessions,)).rowcount
+        return evicted
+
+    def recent(self, limit: int, deadline: float) -> List[Tuple[str, Dict[str, Any]]]:
+        rows = self._conn().execute(
+            "SELECT entity_id, context FROM sessions WHERE last_seen >= ? ORDER BY last_seen DESC LIMIT ?",
+            (deadline, limit)
+        ).fetchall()
+        return [(entity_id, json.loads(context)) for entity_id, context in rows]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def total_bytes(self) -> int:
+        return self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM sessions").fetchone()[0]
+
+
+class SessionStore:
+    """按实体ID保存上下文和对话历史的会话表
+
+    - 完整上下文（注册或重新同步）直接替换会话内容并记录客户端给出的版本号
+    - 增量只包含变化的字段，版本号必须是上一版本+1（与当前版本相同视为重试，重复应用无副作用）
+    - 保存的是解析后（类型转换、范围裁剪后）的上下文；上下文本身超过max_session_bytes时拒绝
+    - 历史最多保留history_turns条且不超过token预算，更早的记录折叠进不超过summary_chars字的摘要：
+      决策按动作汇总次数，对话只保留每条前EXCERPT_CHARS字的节选（最早的节选先丢弃）；
+      单会话上下文+历史+摘要的字节数不超过max_session_bytes
+    - 会话按最近使用排序，超过容量或空闲超时的会话被淘汰
+    - 配置shared_path时会话保存在共享SQLite中，否则保存在进程内
+    """
+
+    def __init__(self, parser: Callable[[Dict], Any], fields: Iterable[str],
+                 max_sessions: int = 4096, idle_timeout: float = 600.0,
+                 history_turns: int = 12, history_tokens: int = 600,
+                 summary_chars: int = 400, max_session_bytes: int = 8192, max_turn_chars: int = 300,
+                 shared_path: Optional[str] = None):
+        self.parser = parser
+        self.fields = frozenset(fields)  # 只保存已知字段，避免增量携带任意数据
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.history_turns = history_turns
+        self.history_tokens = history_tokens
+        self.summary_chars = summary_chars
+        self.max_session_bytes = max_session_bytes
+        self.max_turn_chars = max_turn_chars
+        self.shared = bool(shared_path)
+        self._backend = SqliteSessionBackend(shared_path) if shared_path else MemorySessionBackend()
+
+    def _load_active(self, entity_id: str, now: float) -> Optional[Session]:
+        # 调用方在事务内；共享表的批量淘汰有间隔，读取时也要检查空闲超时
+        session = self._backend.load(entity_id)
+        if session is not None and session.last_seen < now - self.idle_timeout:
+            return None
+        return session
+
+    def apply(self, entity_id: str, version: int, context: Optional[Dict] = None,
+              delta: Optional[Dict] = None, removed: Iterable[str] = ()) -> Tuple[Any, int]:
+        """应用完整上下文或增量，返回 (解析后的上下文, 当前版本)
+
+        解析失败或上下文超过大小上限时抛出ContextValidationError，会话保持不变；
+        需要重新同步时抛出SessionResyncRequired。
+        """
+        now = time.time()
+        with self._backend.transaction():
+            session = self._load_active(entity_id, now)
+
+            if context is not None:
+                merged = {key: value for key, value in context.items() if key in self.fields}
+                event = "full"
+            else:
+                if session is None:
+                    metrics.SESSION_EVENTS.inc("resync")
+                    raise SessionResyncRequired(entity_id, "会话不存在")
+                if version not in (session.version, session.version + 1):
+                    metrics.SESSION_EVENTS.inc("resync")
+                    raise SessionResyncRequired(entity_id, f"版本不连续（当前{session.version}，收到{version}）",
+                                                session.version + 1)
+                merged = dict(session.context)
+                for key, value in (delta or {}).items():
+                    if key in self.fields:
+                        merged[key] = value
+                for key in removed:
+                    merged.pop(key, None)
+                event = "delta"
+
+            # 先解析再提交，无效的增量不会污染会话；保存解析后的值，而不是客户端发来的原始数据
+            parsed = self.parser(merged)
+            stored = {name: getattr(parsed, name) for name in self.fields}
+            stored_bytes = _json_size(stored)
+            if stored_bytes > self.max_session_bytes:
+                raise ContextValidationError([f"上下文{stored_bytes}字节，超过会话上限{self.max_session_bytes}字节"])
+
+            if session is None:
+                session = Session(entity_id, stored, version, now, stored_bytes)
+            else:
+                session.set_context(stored, stored_bytes)
+                session.version = version
+                session.last_seen = now
+            self._trim_history(session)
+            self._backend.save(session)
+            evicted = self._backend.evict(now - self.idle_timeout, self.max_sessions)
+
+        for _ in range(evicted):
+            metrics.SESSION_EVENTS.inc("evicted")
+        metrics.SESSION_EVENTS.inc(event)
+        return parsed, version
+
+    def record_turn(self, entity_id: str, role: str, text: str, topic: Optional[str] = None) -> bool:
+        """向会话追加一条对话/决策记录（决策记录的topic为动作），会话不存在时忽略"""
+        text = text.strip()[:self.max_turn_chars]
+        if not text:
+            return False
+        now = time.time()
+        with self._backend.transaction():
+            session = self._load_active(entity_id, now)
+            if session is None:
+                return False
+            session.add_turn(Turn(role, text, topic))
+            self._trim_history(session)
+            session.last_seen = now
+            self._backend.save(session)
+        return True
+
+    def _trim_history(self, session: Session):
+        """历史超出条数、token或单会话字节预算时折叠最旧的记录"""
+        while session.turns and (len(session.turns) > self.history_turns
+                                 or session.history_tokens > self.history_tokens
+                                 or session.total_bytes() > self.max_session_bytes):
+            self._fold_oldest(session)
+
+    def _fold_oldest(self, session: Session):
+        """把最旧的一条记录并入摘要：决策计入动作次数，对话截断成一行节选"""
+        turn = session.turns.popleft()
+        session.history_tokens -= turn.tokens
+        session.history_bytes -= turn.size
+        if turn.topic:
+            topic = turn.topic
+            if topic not in session.topics and len(session.topics) >= SUMMARY_MAX_TOPICS:
+                topic = "其他"
+            session.topics[topic] = session.topics.get(topic, 0) + 1
+        else:
+            text = turn.text if len(turn.text) <= EXCERPT_CHARS else turn.text[:EXCERPT_CHARS] + "…"
+            session.excerpts.append(f"{ROLE_LABELS.get(turn.role, turn.role)}: {text}")
+        summary = self._render_summary(session)
+        # 超长时丢弃最早的对话节选，决策计数行长度有限
+        while len(summary) > self.summary_chars and session.excerpts:
+            session.excerpts.popleft()
+            summary = self._render_summary(session)
+        session.summary = summary[:self.summary_chars]
+        metrics.SESSION_EVENTS.inc("history_folded")
+
+    @staticmethod
+    def _render_summary(session: Session) -> str:
+        lines = []
+        if session.topics:
+            total = sum(session.topics.values())
+            counts = "、".join(f"{topic}×{count}" for topic, count in
+                              sorted(session.topics.items(), key=lambda item: -item[1]))
+            lines.append(f"此前的{total}次决策：{counts}")
+        if session.excerpts:
+            lines.append(f"此前的对话节选（每条最多{EXCERPT_CHARS}字）：")
+            lines.extend(session.excerpts)
+        return "\n".join(lines)
+
+    def conversation(self, entity_id: Optional[str]) -> Tuple[str, List[Tuple[str, str]]]:
+        """返回 (摘要, [(角色, 内容), ...])，会话不存在时为空"""
+        if not entity_id:
+            return "", []
+        with self._backend.reading():
+            session = self._load_active(entity_id, time.time())
+            if session is None:
+                return "", []
+            return session.summary, [(turn.role, turn.text) for turn in session.turns]
+
+    def recent_contexts(self, limit: int, max_age: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """最近max_age秒内活跃的会话（最近使用的在前），返回 [(实体ID, 上下文副本), ...]"""
+        return self._backend.recent(limit, time.time() - max_age)
+
+    def __len__(self) -> int:
+        return self._backend.count()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self),
+            "shared": self.shared,
+            "max_sessions": self.max_sessions,
+            "idle_timeout": self.idle_timeout,
+            "session_bytes": self._backend.total_bytes(),
+            "max_session_bytes": self.max_session_bytes
+        }
@@ -0,0 +1,142 @@
+# AI建设助手决策预计算
+# 黄昏/夜晚切换和换季可以从time_phase、day推算出来：后台线程为活跃会话预测下一个可能的上下文
+# （阶段推进、饥饿/木材下降一档），在上游空闲时预先请求决策写入决策缓存，
+# 真实请求到来时直接命中缓存
+
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Any, Dict, List
+
+import metrics
+from bucketing import band_width
+
+logger = logging.getLogger(__name__)
+
+SEASON_ORDER = ("autumn", "winter", "spring", "summer")
+
+
+def predict_contexts(context, season_length: int = 20) -> List[Any]:
+    """预测下一个可能的上下文，按可能性排序
+
+    - 阶段推进：白天→黄昏→夜晚→次日白天，跨过季节长度时进入下一季节
+    - 资源消耗：饥饿、木材各下降到决策缓存的下一档
+    """
+    predictions = []
+    if context.time_phase == "day":
+        predictions.append(replace(context, time_phase="dusk", is_dusk=True, is_night=False))
+    elif context.time_phase == "dusk":
+        predictions.append(replace(context, time_phase="night", is_dusk=False, is_night=True))
+    else:
+        season = context.season
+        if season_length > 0 and context.day % season_length == 0 and season in SEASON_ORDER:
+            season = SEASON_ORDER[(SEASON_ORDER.index(season) + 1) % len(SEASON_ORDER)]
+        predictions.append(replace(context, time_phase="day", is_dusk=False, is_night=False,
+                                   day=context.day + 1, season=season))
+
+    # 档宽取自决策缓存键的分档规则
+    hunger_width = band_width("hunger")
+    if context.hunger >= hunger_width:
+        predictions.append(replace(context, hunger=float(context.hunger // hunger_width * hunger_width - 1)))
+    wood_width = int(band_width("wood_count"))
+    if context.wood_count >= wood_width:
+        predictions.append(replace(context, wood_count=context.wood_count // wood_width * wood_width - 1))
+    return predictions
+
+
+class SpeculativeEngine:
+    """后台决策预计算
+
+    每隔interval秒取最近active_window秒内活跃的会话，预测其下一个上下文并预计算决策：
+    - 只在上游空闲（无排队、进行中不超过idle_in_flight）时调用，且不排队，不与真实请求竞争
+    - 每轮最多max_per_cycle次上游调用
+    - 记录预计算写入的缓存键，真实请求命中这些键时计为预计算命中
+    """
+
+    def __init__(self, service, interval: float = 5.0, max_per_cycle: int = 8, active_window: float = 120.0,
+                 idle_in_flight: int = 0, season_length: int = 20, max_tracked: int = 4096):
+        self.service = service
+        self.interval = interval
+        self.max_per_cycle = max_per_cycle
+        self.active_window = active_window
+        self.idle_in_flight = idle_in_flight
+        self.season_length = season_length
+        self.max_tracked = max_tracked
+        self._speculated: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.precomputed = 0
+        self.hits = 0
+
+    def start(self):
+        """启动后台线程（重复调用无副作用）"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="speculation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning(f"决策预计算失败: {e}")
+
+    def run_once(self) -> int:
+        """执行一轮预计算，返回新写入缓存的决策数"""
+        written = 0
+        sessions = self.service.sessions
+        for _, raw_context in sessions.recent_contexts(self.max_per_cycle, self.active_window):
+            context = sessions.parser(raw_context)
+            for predicted in predict_contexts(context, self.season_length):
+                if written >= self.max_per_cycle or self._stop.is_set():
+                    return written
+                if not self.service.scheduler.is_idle(self.idle_in_flight):
+                    metrics.SPECULATION_EVENTS.inc("busy")
+                    return written
+                try:
+                    cache_key = self.service.precompute_decision(predicted)
+                except Exception as e:
+                    # 上游失败或名额被真实请求占用：本轮结束，下一轮再试
+                    metrics.SPECULATION_EVENTS.inc("failed")
+                    logger.debug(f"决策预计算失败: {e}")
+                    return written
+                if cache_key is None:
+                    metrics.SPECULATION_EVENTS.inc("cached")
+                    continue
+                written += 1
+                self._track(cache_key)
+        return written
+
+    def _track(self, cache_key: str):
+        metrics.SPECULATION_EVENTS.inc("precomputed")
+        with self._lock:
+            self.precomputed += 1
+            self._speculated[cache_key] = None
+            self._speculated.move_to_end(cache_key)
+            while len(self._speculated) > self.max_tracked:
+                self._speculated.popitem(last=False)
+
+    def note_hit(self, cache_key: str):
+        """决策缓存命中时调用：命中预计算写入的键则计为预计算命中（每个键只计一次）"""
+        with self._lock:
+            if cache_key not in self._speculated:
+                return
+            del self._speculated[cache_key]
+            self.hits += 1
+        metrics.SPECULATION_EVENTS.inc("hit")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self._thread is not None and not self._stop.is_set(),
+                "precomputed": self.precomputed,
+                "hits": self.hits,
+                "hit_ratio": self.hits / self.precomputed if self.precomputed else 0.0,
+                "pending": len(self._speculated)
+            }
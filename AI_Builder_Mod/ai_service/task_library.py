@@ -0,0 +1,361 @@
+# AI建设助手任务代码库
+# 砍树、挖石头、把物品存进标记的箱子这类指令已经有验证过的实现（independent_test.py、storage_task_test.py），
+# 不必每次让上游从头写ExecuteAITask：按指令关键词和任务类型检索参数化的Lua模板，
+# 完全匹配时直接填参返回，部分匹配时作为few-shot示例放进提示词
+
+import re
+import threading
+from dataclasses import dataclass, field
+from string import Template
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lua_safety import check_lua_code_safety
+
+WORK_TARGET_TEMPLATE = """function ExecuteAITask(inst)
+    -- 任务库模板：用工具采集附近的目标
+    print("[AI助手] 开始执行${task_label}任务")
+
+    local inventory = inst.components.inventory
+    if not inventory then
+        return {action="error", status="failed", message="无法访问库存"}
+    end
+
+    local tool = inventory:FindItem(function(item)
+        return item:HasTag("${tool_tag}")
+    end)
+
+    if not tool then
+        return {
+            action="need_${tool_tag}",
+            status="preparing",
+            message="需要先获得${tool_label}才能${task_label}",
+            data={required_tool="${tool_tag}"}
+        }
+    end
+
+    -- 装备工具
+    if inventory:GetEquippedItem(EQUIPSLOTS.HANDS) ~= tool then
+        inventory:Equip(tool)
+        return {
+            action="equip_${tool_tag}",
+            status="preparing",
+            message="正在装备${tool_label}",
+            data={tool=tool.prefab, durability=tool.components.finiteuses and tool.components.finiteuses:GetPercent() or 1}
+        }
+    end
+
+    -- 寻找附近的目标
+    local x, y, z = inst.Transform:GetWorldPosition()
+    local targets = TheSim:FindEntities(x, y, z, ${search_radius}, {"${target_tag}"}, {"INLIMBO", "fire"})
+
+    if #targets == 0 then
+        return {
+            action="search_${target_tag}",
+            status="searching",
+            message="附近没有${target_label}，需要扩大搜索范围",
+            data={search_radius=${search_radius}, targets_found=0}
+        }
+    end
+
+    -- 选择最近的目标
+    local target = nil
+    local min_distance = math.huge
+    for _, candidate in ipairs(targets) do
+        local distance = inst:GetDistanceSqToInst(candidate)
+        if distance < min_distance then
+            min_distance = distance
+            target = candidate
+        end
+    end
+
+    local target_x, target_y, target_z = target.Transform:GetWorldPosition()
+    if min_distance > 4 then
+        inst.components.locomotor:GoToPoint(target_x, target_y, target_z)
+        return {
+            action="move_to_${target_tag}",
+            status="moving",
+            message="正在前往目标${target_label}: " .. (target.prefab or "unknown"),
+            data={target_type=target.prefab, distance=math.sqrt(min_distance),
+                  position={x=target_x, y=target_y, z=target_z}}
+        }
+    end
+
+    if target.components.workable then
+        return {
+            action="${work_action}",
+            status="working",
+            message="开始${task_label}，目标: " .. (target.prefab or "unknown"),
+            data={
+                target_type=target.prefab,
+                work_required=target.components.workable.workleft,
+                tool_efficiency=tool.components.tool and tool.components.tool.efficiency or 1
+            }
+        }
+    end
+
+    return {
+        action="invalid_target",
+        status="error",
+        message="选中的${target_label}无法${task_label}",
+        data={target_prefab=target.prefab}
+    }
+end"""
+
+STORE_ITEMS_TEMPLATE = """function ExecuteAITask(inst)
+    -- 任务库模板：把库存中的物品存进标记的箱子
+    print("[AI助手] 开始执行${item_label}存储任务")
+
+    local inventory = inst.components.inventory
+    if not inventory then
+        return {action="error", status="failed", message="无法访问库存系统"}
+    end
+
+    local target_prefabs = {${item_prefabs}}
+    local item_count = 0
+    local items = {}
+    for i = 1, inventory.maxslots do
+        local item = inventory:GetItemInSlot(i)
+        if item and target_prefabs[item.prefab] then
+            local count = item.components.stackable and item.components.stackable.stacksize or 1
+            item_count = item_count + count
+            table.insert(items, {slot=i, item=item, count=count})
+        end
+    end
+
+    if item_count == 0 then
+        return {
+            action="no_items_found",
+            status="completed",
+            message="库存中没有找到${item_label}",
+            data={inventory_scanned=true, item_count=0}
+        }
+    end
+
+    -- 优先寻找标记为${chest_tag}的箱子，没有时使用其他有空位的箱子
+    local x, y, z = inst.Transform:GetWorldPosition()
+    local nearby_chests = TheSim:FindEntities(x, y, z, ${search_radius}, {"chest"}, {"INLIMBO"})
+    local target_chest = nil
+    local min_distance = math.huge
+    for _, chest in ipairs(nearby_chests) do
+        if chest.components.container and chest:HasTag("${chest_tag}") then
+            local distance = inst:GetDistanceSqToInst(chest)
+            if distance < min_distance then
+                min_distance = distance
+                target_chest = chest
+            end
+        end
+    end
+    if not target_chest then
+        for _, chest in ipairs(nearby_chests) do
+            if chest.components.container and not chest.components.container:IsFull() then
+                local distance = inst:GetDistanceSqToInst(chest)
+                if distance < min_distance then
+                    min_distance = distance
+                    target_chest = chest
+                end
+            end
+        end
+    end
+
+    if not target_chest then
+        return {
+            action="no_chest_found",
+            status="failed",
+            message="附近没有找到可用的存储箱子",
+            data={search_radius=${search_radius}, chests_found=#nearby_chests}
+        }
+    end
+
+    local marked = target_chest:HasTag("${chest_tag}")
+    local distance_to_chest = math.sqrt(min_distance)
+    if distance_to_chest > 3 then
+        local chest_x, chest_y, chest_z = target_chest.Transform:GetWorldPosition()
+        inst.components.locomotor:GoToPoint(chest_x, chest_y, chest_z)
+        return {
+            action="move_to_chest",
+            status="moving",
+            message="正在前往存储箱子: " .. (marked and "${item_label}专用箱" or "通用存储箱"),
+            data={chest_type=marked and "${chest_tag}" or "general", distance=distance_to_chest, items_to_store=item_count}
+        }
+    end
+
+    local container = target_chest.components.container
+    local stored_count = 0
+    for _, entry in ipairs(items) do
+        if container:IsFull() then
+            break
+        end
+        local item_to_store = inventory:RemoveItemBySlot(entry.slot)
+        if item_to_store then
+            local remaining_item = container:GiveItem(item_to_store)
+            if remaining_item then
+                inventory:GiveItem(remaining_item)
+                break
+            end
+            stored_count = stored_count + entry.count
+        end
+    end
+
+    if stored_count > 0 then
+        return {
+            action="storage_completed",
+            status="success",
+            message=string.format("成功将 %d 个${item_label}存入%s", stored_count, marked and "${item_label}专用箱" or "存储箱"),
+            data={stored_count=stored_count, remaining=item_count - stored_count,
+                  chest_type=marked and "${chest_tag}" or "general"}
+        }
+    end
+    return {
+        action="storage_failed",
+        status="failed",
+        message="无法存储${item_label}，箱子可能已满",
+        data={item_count=item_count, chest_full=container:IsFull(), chest_capacity=container.numslots}
+    }
+end"""
+
+# 指令中的物品词 → (prefab列表, 名称, 箱子标签)
+ITEM_ALIASES = [
+    (("木材", "木头", "原木", "log", "wood"), (("log", "logs"), "木材", "wood_storage")),
+    (("石头", "岩石", "石块", "rock", "stone"), (("rocks",), "石头", "stone_storage")),
+    (("树枝", "twig"), (("twigs",), "树枝", "twigs_storage")),
+    (("草", "grass"), (("cutgrass",), "草", "grass_storage")),
+]
+
+_RADIUS_PATTERNS = [re.compile(r"半径\s*(\d+)"), re.compile(r"(\d+)\s*(?:格|米|码)"),
+                    re.compile(r"radius\s*(\d+)", re.IGNORECASE)]
+
+
+def extract_radius(instruction: str, default: int, low: int = 5, high: int = 40) -> int:
+    """从指令中提取搜索半径（"半径20"、"15格内"），裁剪到[low, high]"""
+    for pattern in _RADIUS_PATTERNS:
+        match = pattern.search(instruction)
+        if match:
+            return max(low, min(high, int(match.group(1))))
+    return default
+
+
+def _storage_params(instruction: str) -> Dict[str, Any]:
+    lowered = instruction.lower()
+    for aliases, (prefabs, label, chest_tag) in ITEM_ALIASES:
+        if any(alias in lowered for alias in aliases):
+            break
+    else:
+        prefabs, label, chest_tag = ITEM_ALIASES[0][1]
+    return {
+        "item_prefabs": ", ".join(f"{prefab}=true" for prefab in prefabs),
+        "item_label": label,
+        "chest_tag": chest_tag,
+        "search_radius": extract_radius(instruction, 20),
+    }
+
+
+@dataclass
+class TaskTemplate:
+    """参数化的Lua任务模板
+
+    verbs/objects为指令关键词（小写），两组都命中且任务类型相符时视为完全匹配；
+    params为固定参数，param_extractor从指令中提取其余参数。
+    """
+    name: str
+    task_types: Tuple[str, ...]
+    verbs: Tuple[str, ...]
+    objects: Tuple[str, ...]
+    template: str
+    reasoning: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    param_extractor: Optional[Callable[[str], Dict[str, Any]]] = None
+
+    def render(self, instruction: str) -> Tuple[str, str]:
+        """填入参数，返回 (代码, 说明)"""
+        params = dict(self.params)
+        if self.param_extractor is not None:
+            params.update(self.param_extractor(instruction))
+        return Template(self.template).substitute(params), Template(self.reasoning).substitute(params)
+
+
+DEFAULT_TEMPLATES = [
+    TaskTemplate(
+        name="chop_trees",
+        task_types=("collecting", "general"),
+        verbs=("砍", "伐", "收集", "采集", "chop", "cut", "collect", "gather"),
+        objects=("树", "tree", "木"),
+        template=WORK_TARGET_TEMPLATE,
+        reasoning="使用任务库中的砍树模板：检查并装备斧头，在${search_radius}格内寻找最近的树木，靠近后开始砍伐。",
+        params={"task_label": "砍树", "tool_tag": "axe", "tool_label": "斧头", "target_tag": "tree",
+                "target_label": "树木", "work_action": "chop_tree"},
+        param_extractor=lambda instruction: {"search_radius": extract_radius(instruction, 15)},
+    ),
+    TaskTemplate(
+        name="mine_rocks",
+        task_types=("collecting", "general"),
+        verbs=("挖", "采", "敲", "收集", "mine", "collect", "gather"),
+        objects=("石", "矿", "rock", "boulder"),
+        template=WORK_TARGET_TEMPLATE,
+        reasoning="使用任务库中的采矿模板：检查并装备镐子，在${search_radius}格内寻找最近的岩石，靠近后开始开采。",
+        params={"task_label": "采矿", "tool_tag": "pickaxe", "tool_label": "镐子", "target_tag": "boulder",
+                "target_label": "岩石", "work_action": "mine_rock"},
+        param_extractor=lambda instruction: {"search_radius": extract_radius(instruction, 15)},
+    ),
+    TaskTemplate(
+        name="store_items",
+        task_types=("collecting", "building", "general"),
+        verbs=("存", "放", "收纳", "store", "put"),
+        objects=("箱", "chest"),
+        template=STORE_ITEMS_TEMPLATE,
+        reasoning="使用任务库中的存储模板：统计库存中的${item_label}，优先前往标记为${chest_tag}的箱子，"
+                  "没有时使用${search_radius}格内有空位的箱子，逐格存入。",
+        param_extractor=_storage_params,
+    ),
+]
+
+
+@dataclass
+class TaskMatch:
+    template: TaskTemplate
+    score: float
+    full: bool
+
+
+class TaskLibrary:
+    """任务代码库检索
+
+    - search：按关键词和任务类型为所有模板打分，返回最佳匹配
+    - 完全匹配（动词和对象都命中、任务类型相符）由调用方直接返回渲染后的代码
+    - 部分匹配（至少命中一组关键词）作为few-shot示例
+    模板在加载时用默认参数渲染并通过安全检查，未通过的模板拒绝加载。
+    """
+
+    def __init__(self, templates: Optional[List[TaskTemplate]] = None):
+        self.templates = list(DEFAULT_TEMPLATES if templates is None else templates)
+        for template in self.templates:
+            code, _ = template.render("")
+            result = check_lua_code_safety(code)
+            if not result["is_safe"]:
+                raise ValueError(f"任务模板 {template.name} 未通过安全检查: {result['errors']}")
+        self._lock = threading.Lock()
+        self._stats = {"full": 0, "partial": 0, "miss": 0}
+
+    def search(self, instruction: str, task_type: str) -> Optional[TaskMatch]:
+        lowered = instruction.lower()
+        best = None
+        for template in self.templates:
+            verb = any(word in lowered for word in template.verbs)
+            obj = any(word in lowered for word in template.objects)
+            if not (verb or obj):
+                continue
+            type_ok = task_type in template.task_types
+            score = verb + obj + 0.5 * type_ok
+            if best is None or score > best.score:
+                best = TaskMatch(template, score, verb and obj and type_ok)
+        with self._lock:
+            self._stats["miss" if best is None else "full" if best.full else "partial"] += 1
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self._stats.values())
+            return {
+                "templates": [template.name for template in self.templates],
+                **self._stats,
+                "full_ratio": self._stats["full"] / total if total else 0.0
+            }
@@ -0,0 +1,693 @@
+#!/usr/bin/env python3
+"""
+AI建设助手服务模块测试
+不依赖运行中的服务和上游API，直接测试缓存、调度、会话、任务、上下文解析等模块
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify, request
+
+import tracing
+import wire
+from backends import Backend, BackendRouter, NoBackendAvailable, parse_backends
+from bucketing import DECISION_BUCKETS, compile_bucket_key, decision_bucket_key, lua_source
+from cache import LRUCache, SqliteCache, TieredCache, make_cache
+from codegen import CodegenFailed, CodegenPipeline
+from context_schema import GAME_CONTEXT_FIELDS, ContextValidationError, compile_context_parser
+from jobs import JobQueue
+from lua_safety import check_lua_code_safety, lua_code_key
+from pacing import DecisionPacer
+from scheduler import URGENT, LoadShed, UpstreamScheduler
+from sessions import SessionResyncRequired, SessionStore
+from task_library import TaskLibrary, extract_radius
+
+LUA_BUCKETING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts", "ai_bucketing.lua")
+
+SAFE_CODE = 'function ExecuteAITask(inst)\n    return {action="idle", status="success"}\nend'
+UNSAFE_CODE = 'function ExecuteAITask(inst)\n    os.execute("rm")\n    return {}\nend'
+
+
+class _Context:
+    """测试用上下文类型（与GameContext字段相同，由解析函数直接写入属性）"""
+
+
+parse_context = compile_context_parser(_Context)
+CONTEXT_FIELDS = [field.name for field in GAME_CONTEXT_FIELDS]
+
+
+def _wait_until(condition, timeout: float = 2.0):
+    """等待条件成立（用于等待后台线程进入某个状态）"""
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.005)
+
+
+# ---------------------------------------------------------------- 缓存
+
+def test_lru_eviction():
+    """LRU缓存：超出容量时淘汰最久未使用的条目"""
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1      # a变为最近使用
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["size"] == 2 and stats["hits"] == 3 and stats["misses"] == 1
+    print("✅ LRU淘汰正确")
+
+
+def test_lru_ttl():
+    """LRU缓存：过期条目不再命中，单条写入可覆盖默认TTL"""
+    cache = LRUCache(max_size=4, ttl=0.2)
+    cache.set("short", 1)
+    cache.set("forever", 2, ttl=0)
+    cache.set_until("until", 3, time.time() + 0.2)
+    assert cache.contains("short") and cache.get("until") == 3
+    time.sleep(0.3)
+    assert cache.get("short") is None
+    assert cache.get("until") is None
+    assert not cache.contains("short")
+    assert cache.get("forever") == 2
+    print("✅ LRU过期正确")
+
+
+def test_shared_cache():
+    """共享缓存：两个实例（模拟两个工作进程）通过同一个SQLite文件共享条目"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.db")
+        first = make_cache("decision", 8, ttl=60, shared_path=path)
+        second = make_cache("decision", 8, ttl=60, shared_path=path)
+        assert isinstance(first, TieredCache)
+        first.set("key", {"action": "idle"})
+        assert second.get("key") == {"action": "idle"}
+        assert second.stats()["shared_hits"] == 1
+        # 命名空间互不影响
+        assert SqliteCache(path, "chat").get("key") is None
+    print("✅ 共享缓存正确")
+
+
+def test_shared_cache_backfill_ttl():
+    """两级缓存：从共享缓存回填本地时沿用共享条目剩余的寿命，而不是完整TTL"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.db")
+        cache = make_cache("decision", 8, ttl=60, shared_path=path)
+        cache.shared.set("key", "value", ttl=0.2)
+        assert cache.get("key") == "value"
+        remaining = cache.local._data["key"][1] - time.time()
+        assert 0 < remaining <= 0.2
+        time.sleep(0.3)
+        assert cache.get("key") is None
+        # 共享条目不过期时本地副本也不过期
+        cache.shared.set("forever", 1, ttl=0)
+        assert cache.get("forever") == 1 and cache.local._data["forever"][1] is None
+    print("✅ 回填寿命正确")
+
+
+# ---------------------------------------------------------------- 上游调度
+
+def _queue_in_thread(scheduler, traffic_class, order):
+    def run():
+        try:
+            scheduler.acquire(traffic_class)
+        except Exception as e:
+            order.append((traffic_class, type(e).__name__))
+            return
+        order.append(traffic_class)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_scheduler_shedding():
+    """调度器：积压达到max_pending时拒绝非紧急请求，紧急请求仍然排队"""
+    scheduler = UpstreamScheduler(max_concurrency=1, max_pending=2, queue_timeout=2)
+    assert scheduler.acquire("decision") == 0.0
+    order = []
+    waiting = _queue_in_thread(scheduler, "chat", order)
+    _wait_until(lambda: scheduler.queue_depths()["chat"] == 1)
+
+    try:
+        scheduler.acquire("decision")
+    except LoadShed as e:
+        assert e.traffic_class == "decision" and e.retry_after >= 1
+    else:
+        raise AssertionError("积压已满时应拒绝")
+
+    urgent = _queue_in_thread(scheduler, URGENT, order)
+    _wait_until(lambda: scheduler.queue_depths()[URGENT] == 1)
+    scheduler.release(0.01)
+    depths = scheduler.queue_depths()
+    assert depths[URGENT] == 0 and depths["chat"] == 1
+    scheduler.release(0.01)
+    urgent.join(2)
+    waiting.join(2)
+    assert sorted(order) == sorted([URGENT, "chat"])
+    print("✅ 准入控制正确")
+
+
+def test_scheduler_urgent_preemption():
+    """调度器：紧急请求先于更早排队的普通请求获得名额"""
+    scheduler = UpstreamScheduler(max_concurrency=1, max_pending=16, queue_timeout=2)
+    scheduler.acquire("decision")
+    order = []
+    threads = [_queue_in_thread(scheduler, "generate_lua_code", order)]
+    _wait_until(lambda: scheduler.queue_depths()["generate_lua_code"] == 1)
+    threads.append(_queue_in_thread(scheduler, "chat", order))
+    _wait_until(lambda: scheduler.queue_depths()["chat"] == 1)
+    threads.append(_queue_in_thread(scheduler, URGENT, order))
+    _wait_until(lambda: scheduler.queue_depths()[URGENT] == 1)
+
+    # 放行与出队都在锁内完成，按队列深度判断放行顺序
+    scheduler.release(0.01)
+    depths = scheduler.queue_depths()
+    assert depths[URGENT] == 0 and depths["chat"] == 1 and depths["generate_lua_code"] == 1
+    scheduler.release(0.01)
+    scheduler.release(0.01)
+    for thread in threads:
+        thread.join(2)
+    assert sorted(order) == sorted([URGENT, "chat", "generate_lua_code"])
+    scheduler.release()
+    assert scheduler.is_idle()
+    print("✅ 紧急优先正确")
+
+
+def test_scheduler_timeout():
+    """调度器：排队超时抛出异常并移出队列"""
+    scheduler = UpstreamScheduler(max_concurrency=1, queue_timeout=0.1)
+    scheduler.acquire("decision")
+    order = []
+    _queue_in_thread(scheduler, "chat", order).join(2)
+    assert order == [("chat", "SchedulerTimeout")]
+    assert scheduler.queue_depths()["chat"] == 0
+    print("✅ 排队超时正确")
+
+
+# ---------------------------------------------------------------- 会话
+
+def _session_store(**kwargs) -> SessionStore:
+    return SessionStore(parse_context, CONTEXT_FIELDS, **kwargs)
+
+
+def test_session_versions():
+    """会话：完整上下文注册，增量按版本连续应用，重复的版本视为重试"""
+    store = _session_store()
+    context, version = store.apply("npc1", 1, context={"health": 80, "wood_count": 3})
+    assert version == 1 and context.health == 80.0
+
+    context, version = store.apply("npc1", 2, delta={"wood_count": 12})
+    assert version == 2 and context.wood_count == 12 and context.health == 80.0
+
+    # 重试同一版本不产生副作用
+    context, version = store.apply("npc1", 2, delta={"wood_count": 12})
+    assert version == 2 and context.wood_count == 12
+
+    context, _ = store.apply("npc1", 3, removed=["health"])
+    assert context.health == 100.0  # 移除后回到默认值
+    print("✅ 会话版本正确")
+
+
+def test_session_resync():
+    """会话：不存在、版本不连续或空闲超时时要求重新同步"""
+    store = _session_store(idle_timeout=0.2)
+    try:
+        store.apply("ghost", 1, delta={"health": 50})
+    except SessionResyncRequired as e:
+        assert e.entity_id == "ghost" and e.expected_version is None
+    else:
+        raise AssertionError("会话不存在时应要求重新同步")
+
+    store.apply("npc1", 1, context={"health": 80})
+    try:
+        store.apply("npc1", 5, delta={"health": 50})
+    except SessionResyncRequired as e:
+        assert e.expected_version == 2
+    else:
+        raise AssertionError("版本不连续时应要求重新同步")
+
+    time.sleep(0.3)
+    try:
+        store.apply("npc1", 2, delta={"health": 50})
+    except SessionResyncRequired:
+        pass
+    else:
+        raise AssertionError("空闲超时后应要求重新同步")
+    print("✅ 重新同步正确")
+
+
+def test_session_invalid_delta():
+    """会话：无效增量被拒绝，会话内容和版本保持不变"""
+    store = _session_store()
+    store.apply("npc1", 1, context={"health": 80})
+    try:
+        store.apply("npc1", 2, delta={"health": "很多"})
+    except ContextValidationError as e:
+        assert any("health" in error for error in e.errors)
+    else:
+        raise AssertionError("无效增量应被拒绝")
+    context, version = store.apply("npc1", 2, delta={"hunger": 30})
+    assert version == 2 and context.health == 80.0 and context.hunger == 30.0
+    print("✅ 无效增量正确")
+
+
+def test_session_history():
+    """会话：历史超过条数后折叠进摘要"""
+    store = _session_store(history_turns=3)
+    store.apply("npc1", 1, context={})
+    for index in range(5):
+        assert store.record_turn("npc1", "decision", f"第{index}次决策", topic="gather_wood")
+    assert not store.record_turn("ghost", "player", "你好")
+    summary, turns = store.conversation("npc1")
+    assert len(turns) == 3
+    assert "gather_wood×2" in summary
+    print("✅ 会话历史正确")
+
+
+def test_session_shared():
+    """会话：共享SQLite中的会话对另一个实例可见"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.db")
+        first = _session_store(shared_path=path)
+        second = _session_store(shared_path=path)
+        first.apply("npc1", 1, context={"wood_count": 4})
+        context, version = second.apply("npc1", 2, delta={"stone_count": 2})
+        assert version == 2 and context.wood_count == 4 and context.stone_count == 2
+    print("✅ 共享会话正确")
+
+
+# ---------------------------------------------------------------- 异步任务
+
+def _not_degraded(result) -> bool:
+    return result.get("source") not in ("fallback", "shed")
+
+
+def test_job_dedup():
+    """任务：相同key在执行中和完成后（结果可复用）都直接返回已有任务"""
+    queue = JobQueue(workers=2, reusable=_not_degraded)
+    gate = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        gate.wait(2)
+        return {"source": "deepseek", "lua_code": SAFE_CODE}
+
+    job, deduplicated = queue.submit("key", work)
+    assert not deduplicated
+    again, deduplicated = queue.submit("key", work)
+    assert again is job and deduplicated
+
+    gate.set()
+    assert queue.wait(job.job_id, 2).state == "done"
+    again, deduplicated = queue.submit("key", work)
+    assert again is job and deduplicated
+    assert len(calls) == 1
+    assert job.to_dict()["result"]["source"] == "deepseek"
+    print("✅ 任务复用正确")
+
+
+def test_job_degraded_not_reused():
+    """任务：降级/后备结果不被相同请求复用，失败的任务也不复用"""
+    queue = JobQueue(workers=1, reusable=_not_degraded)
+    job, _ = queue.submit("key", lambda: {"source": "fallback"})
+    queue.wait(job.job_id, 2)
+    assert job.state == "done" and not job.reusable
+
+    retry, deduplicated = queue.submit("key", lambda: {"source": "deepseek"})
+    assert retry is not job and not deduplicated
+    queue.wait(retry.job_id, 2)
+    assert retry.reusable
+
+    def fail():
+        raise RuntimeError("上游错误")
+
+    failed, _ = queue.submit("other", fail)
+    queue.wait(failed.job_id, 2)
+    assert failed.state == "failed" and failed.to_dict()["error"] == "上游错误"
+    retry, deduplicated = queue.submit("other", lambda: {"source": "deepseek"})
+    assert retry is not failed and not deduplicated
+    print("✅ 降级结果不复用")
+
+
+def test_job_queue_full():
+    """任务：排队数达到上限时拒绝提交"""
+    queue = JobQueue(workers=1, max_queued=1)
+    gate = threading.Event()
+    running, _ = queue.submit("a", lambda: gate.wait(2))
+    _wait_until(lambda: running.state == "running")
+    queue.submit("b", lambda: None)
+    try:
+        queue.submit("c", lambda: None)
+    except LoadShed as e:
+        assert e.traffic_class == "jobs"
+    else:
+        raise AssertionError("排队已满时应拒绝")
+    finally:
+        gate.set()
+    print("✅ 任务排队上限正确")
+
+
+def test_job_shared_dedup():
+    """任务：另一个实例（模拟另一个工作进程）提交相同key时复用共享表中的任务"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.db")
+        first = JobQueue(workers=1, shared_path=path, reusable=_not_degraded)
+        second = JobQueue(workers=1, shared_path=path, reusable=_not_degraded)
+        gate = threading.Event()
+        job, _ = first.submit("key", lambda: gate.wait(2) and {"source": "deepseek"})
+        remote, deduplicated = second.submit("key", lambda: {"source": "deepseek"})
+        assert deduplicated and remote.job_id == job.job_id
+        gate.set()
+        finished = second.wait(job.job_id, 2)
+        assert finished.state == "done" and finished.result == {"source": "deepseek"}
+    print("✅ 跨进程任务复用正确")
+
+
+# ---------------------------------------------------------------- 上下文解析
+
+def test_context_parsing():
+    """上下文解析：类型转换、范围裁剪和默认值"""
+    context = parse_context({
+        "health": "75", "hunger": 150, "day": 3.0, "is_night": "true",
+        "wood_count": -4, "resource_needs": {}
+    })
+    assert context.health == 75.0 and context.hunger == 100.0
+    assert context.day == 3 and isinstance(context.day, int)
+    assert context.is_night is True
+    assert context.wood_count == 0
+    assert context.resource_needs == []
+    assert context.season == "autumn" and context.base_center is None
+    assert parse_context(None).health == 100.0
+    print("✅ 上下文解析正确")
+
+
+def test_context_errors():
+    """上下文解析：集中报告所有无效字段"""
+    try:
+        parse_context({"health": float("nan"), "season": "monsoon", "base_center": 5, "resource_needs": [1]})
+    except ContextValidationError as e:
+        assert len(e.errors) == 4
+    else:
+        raise AssertionError("无效上下文应被拒绝")
+
+    try:
+        parse_context([1, 2])
+    except ContextValidationError as e:
+        assert "list" in e.errors[0]
+    else:
+        raise AssertionError("非对象上下文应被拒绝")
+    print("✅ 上下文校验正确")
+
+
+# ---------------------------------------------------------------- 决策缓存键分档
+
+def test_bucket_key():
+    """分档：档宽、上限和布尔值"""
+    context = parse_context({"health": 35, "hunger": 99, "sanity": 100, "wood_count": 80,
+                             "stone_count": 7, "food_count": 0, "has_campfire": True})
+    assert decision_bucket_key(context) == "v1|autumn|day|3|9|5|6|1|0|0|1|0"
+    # 同一档内的变化落到同一个键
+    same = parse_context({"health": 39.9, "hunger": 90, "sanity": 100, "wood_count": 30,
+                          "stone_count": 9, "food_count": 4, "has_campfire": 1})
+    assert decision_bucket_key(same) == decision_bucket_key(context)
+    assert compile_bucket_key(DECISION_BUCKETS, version=2)(context).startswith("v2|")
+    print("✅ 分档键正确")
+
+
+def test_bucket_lua_parity():
+    """分档：仓库中的Lua模块与Python规则生成的源码一致"""
+    with open(LUA_BUCKETING_PATH, encoding="utf-8") as f:
+        assert f.read() == lua_source(), "ai_bucketing.lua 与分档规则不一致，请运行 python bucketing.py --lua"
+    print("✅ Lua分档模块一致")
+
+
+# ---------------------------------------------------------------- 决策间隔
+
+def test_pacing():
+    """决策间隔：紧急最短，命中规则取最短间隔，平稳时最长"""
+    pacer = DecisionPacer(min_interval=5, max_interval=60, jitter=0,
+                          is_urgent=lambda context: context.health < 30)
+    assert pacer.recommend(parse_context({"health": 10})) == (5, "urgent")
+    assert pacer.recommend(parse_context({"is_night": True, "health": 40})) == (8, "night_unlit")
+    assert pacer.recommend(parse_context({"wood_count": 2, "stone_count": 10})) == (30, "low_resources")
+    assert pacer.recommend(parse_context({"wood_count": 20, "stone_count": 10})) == (60, "stable")
+
+    jittered = DecisionPacer(min_interval=5, max_interval=60, jitter=0.1)
+    for _ in range(50):
+        interval, _ = jittered.recommend(parse_context({"wood_count": 20, "stone_count": 10}))
+        assert 54 <= interval <= 66
+    assert pacer.stats()["reasons"]["urgent"] == 1
+    print("✅ 决策间隔正确")
+
+
+# ---------------------------------------------------------------- 任务代码库
+
+def test_task_library():
+    """任务代码库：完全匹配、部分匹配、未匹配"""
+    library = TaskLibrary()
+    match = library.search("木材不够了，请去砍一些树木", "collecting")
+    assert match.template.name == "chop_trees" and match.full
+    code, reasoning = match.template.render("去20格内砍树")
+    assert check_lua_code_safety(code)["is_safe"]
+    assert "20格" in reasoning
+
+    partial = library.search("看看附近有没有树", "building")
+    assert partial is not None and not partial.full
+    assert library.search("在基地周围种一圈浆果丛", "building") is None
+
+    stats = library.stats()
+    assert (stats["full"], stats["partial"], stats["miss"]) == (1, 1, 1)
+    print("✅ 任务代码库正确")
+
+
+def test_extract_radius():
+    """任务代码库：从指令提取半径并裁剪"""
+    assert extract_radius("半径 25 内", 15) == 25
+    assert extract_radius("100格内", 15) == 40
+    assert extract_radius("radius 2", 15) == 5
+    assert extract_radius("附近", 15) == 15
+    print("✅ 半径提取正确")
+
+
+# ---------------------------------------------------------------- 生成-验证-修复
+
+class _ScriptedService:
+    """按顺序返回预设代码的服务替身（代码生成流水线只调用这三个方法）"""
+
+    def __init__(self, codes, repairs=()):
+        self.codes = list(codes)
+        self.repairs = list(repairs)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _request_lua_code(self, instruction, context, task_type, traffic_class=None, wait=True,
+                          match=None, temperature=0.3):
+        with tracing.span("upstream"):
+            with self._lock:
+                self.requests += 1
+                return self.codes.pop(0), "生成说明"
+
+    def _request_lua_repair(self, instruction, lua_code, problems, traffic_class=None, wait=True):
+        return self.repairs.pop(0), ""
+
+    def validate_lua_code_safety(self, lua_code):
+        return check_lua_code_safety(lua_code)
+
+
+def test_codegen_repair():
+    """代码生成：未通过验证的候选交给修复，修复后通过"""
+    pipeline = CodegenPipeline(_ScriptedService([UNSAFE_CODE], [SAFE_CODE]), candidates=1, max_repairs=1)
+    code, reasoning = pipeline.run("砍树", None, "collecting")
+    assert code == SAFE_CODE and reasoning == "生成说明"
+    stats = pipeline.stats()
+    assert stats["attempts"]["1"]["invalid"] == 1 and stats["attempts"]["2"]["valid"] == 1
+    print("✅ 代码修复正确")
+
+
+def test_codegen_failed():
+    """代码生成：候选和修复都未通过时抛出CodegenFailed"""
+    pipeline = CodegenPipeline(_ScriptedService([UNSAFE_CODE], [UNSAFE_CODE]), candidates=1, max_repairs=1)
+    try:
+        pipeline.run("砍树", None, "collecting")
+    except CodegenFailed as e:
+        assert e.attempts == 2 and e.errors
+    else:
+        raise AssertionError("全部未通过时应失败")
+    assert pipeline.stats()["failed"] == 1
+    print("✅ 代码生成失败正确")
+
+
+def test_codegen_candidates_traced():
+    """代码生成：多个候选中通过验证的胜出，候选线程的阶段记录在发起请求的追踪中"""
+    service = _ScriptedService([UNSAFE_CODE, SAFE_CODE, UNSAFE_CODE])
+    pipeline = CodegenPipeline(service, candidates=3, temperatures=[0.3, 0.5, 0.7], max_repairs=0)
+    trace = tracing.start_trace("/generate_lua_code", "POST", tracing.new_correlation_id(), force=True)
+    try:
+        code, _ = pipeline.run("砍树", None, "collecting")
+    finally:
+        tracing.finish_trace(200)
+    assert code == SAFE_CODE
+    assert any(span[0] == "upstream" for span in trace.spans)
+    print("✅ 并行候选正确")
+
+
+# ---------------------------------------------------------------- 上游后端
+
+def test_parse_backends():
+    """后端配置：未配置时使用默认后端，JSON数组逐项解析"""
+    default = parse_backends("", "key", "https://api.example.com/v1/")
+    assert len(default) == 1 and default[0].chat_url == "https://api.example.com/v1/chat/completions"
+
+    backends = parse_backends(json.dumps([
+        {"name": "fast", "routes": ["chat"]},
+        {"base_url": "http://other/v1", "api_key": "k2", "timeout": 5}
+    ]), "key", "https://api.example.com/v1")
+    assert backends[0].serves("chat") and not backends[0].serves("decision")
+    assert backends[1].name == "backend1" and backends[1].timeout == 5.0 and backends[1].serves("decision")
+    print("✅ 后端配置正确")
+
+
+def test_backend_routing():
+    """后端选择：按延迟选择，连续失败后摘除，全部摘除时选最早恢复的"""
+    fast, slow = Backend("fast", "http://fast", "k"), Backend("slow", "http://slow", "k")
+    router = BackendRouter([fast, slow], failure_threshold=2, cooldown=30)
+    for backend, latency in ((fast, 0.1), (slow, 1.0)):
+        router.release(router.acquire("decision", exclude=[b for b in (fast, slow) if b is not backend]),
+                       latency, True)
+    assert router.acquire("decision") is fast
+    router.release(fast, 0, False)
+    assert router.acquire("decision") is fast
+    router.release(fast, 0, False)
+    assert not fast.healthy(time.monotonic())
+    chosen = router.acquire("decision")
+    assert chosen is slow
+    router.release(slow, 0, False)
+    router.release(router.acquire("decision"), 0, False)
+    assert router.acquire("decision") is fast  # 都被摘除时选最早恢复的
+
+    try:
+        BackendRouter([Backend("chat_only", "http://x", "k", routes=["chat"])]).acquire("decision")
+    except NoBackendAvailable:
+        pass
+    else:
+        raise AssertionError("没有后端处理该接口时应失败")
+    print("✅ 后端选择正确")
+
+
+def test_backend_least_outstanding():
+    """后端选择：least_outstanding按进行中请求数分配"""
+    first, second = Backend("a", "http://a", "k"), Backend("b", "http://b", "k")
+    router = BackendRouter([first, second], policy="least_outstanding")
+    assert {router.acquire("chat").name, router.acquire("chat").name} == {"a", "b"}
+    assert first.outstanding == second.outstanding == 1
+    print("✅ 最少进行中请求正确")
+
+
+# ---------------------------------------------------------------- 传输格式
+
+def _wire_app() -> Flask:
+    flask_app = Flask(__name__)
+    wire.init_app(flask_app)
+
+    @flask_app.route("/echo", methods=["POST"])
+    def echo():
+        return jsonify(request.get_json())
+
+    return flask_app
+
+
+def test_wire_compression():
+    """传输格式：压缩和解压往返，解压后超过上限时拒绝"""
+    data = json.dumps({"text": "木材" * 200}).encode("utf-8")
+    for encoding in wire.SUPPORTED_ENCODINGS:
+        assert wire.decompress(wire.compress(data, encoding), encoding) == data
+    try:
+        wire.decompress(wire.compress(b"0" * 10000, "gzip"), "gzip", max_bytes=1000)
+    except wire.BodyTooLarge:
+        pass
+    else:
+        raise AssertionError("解压后超过上限时应拒绝")
+    print("✅ 压缩往返正确")
+
+
+def test_wire_requests():
+    """传输格式：压缩请求体、压缩响应和不支持的编码"""
+    client = _wire_app().test_client()
+    payload = {"text": "木材" * 300}
+    body = wire.compress(json.dumps(payload).encode("utf-8"), "gzip")
+    response = client.post("/echo", data=body, headers={
+        "Content-Type": "application/json", "Content-Encoding": "gzip", "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(wire.decompress(response.get_data(), "gzip")) == payload
+
+    response = client.post("/echo", data=b"{}", headers={"Content-Type": "application/json", "Content-Encoding": "br"})
+    assert response.status_code == 415
+    print("✅ 压缩请求正确")
+
+
+def test_wire_msgpack():
+    """传输格式：MessagePack请求和响应（未安装msgpack时跳过）"""
+    if wire.msgpack is None:
+        print("⚠️ 未安装msgpack，跳过")
+        return
+    client = _wire_app().test_client()
+    payload = {"health": 80, "season": "winter"}
+    response = client.post("/echo", data=wire.msgpack.packb(payload), headers={
+        "Content-Type": wire.MSGPACK_MIMETYPE, "Accept": wire.MSGPACK_MIMETYPE})
+    assert response.mimetype == wire.MSGPACK_MIMETYPE
+    assert wire.msgpack.unpackb(response.get_data(), raw=False) == payload
+    print("✅ MessagePack正确")
+
+
+# ---------------------------------------------------------------- 代码安全检查
+
+def test_lua_safety():
+    """安全检查：危险调用、缺少入口函数，code_length为原始长度"""
+    assert check_lua_code_safety(SAFE_CODE)["is_safe"]
+    result = check_lua_code_safety(UNSAFE_CODE)
+    assert not result["is_safe"] and any("os" in error for error in result["errors"])
+    assert not check_lua_code_safety("print(1)")["is_safe"]
+
+    padded = SAFE_CODE.replace("\n", "  \r\n") + "\n\n"
+    assert check_lua_code_safety(padded)["code_length"] == len(padded)
+    assert lua_code_key(padded) == lua_code_key(SAFE_CODE)
+    print("✅ 安全检查正确")
+
+
+def run_all_tests():
+    """运行所有测试"""
+    print("🚀 开始AI建设助手服务模块测试")
+    print("=" * 50)
+
+    tests = [(name, func) for name, func in globals().items() if name.startswith("test_") and callable(func)]
+    failed = []
+    for name, func in tests:
+        try:
+            func()
+        except Exception as e:
+            print(f"❌ {name}: {type(e).__name__}: {e}")
+            failed.append(name)
+
+    print("\n" + "=" * 50)
+    if failed:
+        print(f"⚠️ {len(failed)}/{len(tests)} 项测试失败: {', '.join(failed)}")
+        return False
+    print(f"🎉 全部 {len(tests)} 项测试通过")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_all_tests() else 1)
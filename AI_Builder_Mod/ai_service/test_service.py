@@ -71,6 +71,50 @@ def test_decision():
         print(f"❌ 请求失败: {e}")
         return False
 
+def test_bucket_key():
+    """测试决策缓存键：同一档内的状态共用规范键，Lua分档模块与规则一致"""
+    print("\n🔑 测试决策缓存键...")
+    import os
+    from bucketing import BUCKET_SPEC_VERSION, lua_source
+    try:
+        keys = []
+        for health in (81.0, 88.5):
+            response = requests.post(f"{BASE_URL}/decision",
+                                   json={"context": {"health": health, "hunger": 60.0, "wood_count": 7}})
+            decision = response.json()
+            keys.append(decision.get('cache_key'))
+        print(f"✅ 规范缓存键: {keys[0]}（版本 {decision.get('bucket_version')}）")
+        
+        lua_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts", "ai_bucketing.lua")
+        with open(lua_path, encoding="utf-8") as f:
+            lua_current = f.read() == lua_source()
+        if not lua_current:
+            print("❌ ai_bucketing.lua 与分档规则不一致，请运行 python bucketing.py --lua ../scripts/ai_bucketing.lua")
+        return (lua_current and keys[0] == keys[1] and decision.get('bucket_version') == BUCKET_SPEC_VERSION
+                and keys[0].startswith(f"v{BUCKET_SPEC_VERSION}|autumn|day|8|6|"))
+    except Exception as e:
+        print(f"❌ 决策请求失败: {e}")
+        return False
+
+def test_decision_pacing():
+    """测试决策间隔建议：局势平稳时间隔长，紧急时间隔短"""
+    print("\n⏱️ 测试决策间隔建议...")
+    contexts = {
+        "stable": {"health": 95.0, "hunger": 90.0, "sanity": 90.0, "wood_count": 20, "stone_count": 10},
+        "urgent": {"health": 20.0, "hunger": 90.0, "sanity": 90.0, "wood_count": 20, "stone_count": 10},
+    }
+    try:
+        advice = {}
+        for name, context in contexts.items():
+            decision = requests.post(f"{BASE_URL}/decision", json={"context": context}).json()
+            advice[name] = (decision.get('next_decision_in'), decision.get('pacing_reason'))
+            print(f"   {name}: {advice[name][0]}秒后再决策（{advice[name][1]}）")
+        return (advice["stable"][1] == "stable" and advice["urgent"][1] == "urgent"
+                and advice["urgent"][0] < advice["stable"][0])
+    except Exception as e:
+        print(f"❌ 决策请求失败: {e}")
+        return False
+
 def test_chat():
     """测试聊天接口"""
     print("\n💬 测试聊天功能...")
@@ -118,6 +162,185 @@ def test_chat():
     
     return True
 
+def test_validate_batch():
+    """测试批量代码验证接口"""
+    print("\n🛡️ 测试批量代码验证...")
+    
+    safe_code = """function ExecuteAITask(inst)
+    return {action="idle", status="waiting", message="等待指令"}
+end"""
+    unsafe_code = """function ExecuteAITask(inst)
+    os.execute("rm -rf /")
+    return {action="idle"}
+end"""
+    
+    try:
+        # 同一代码重复出现，第二次应直接命中缓存
+        lua_codes = [safe_code, unsafe_code, safe_code + "   \r\n"]
+        response = requests.post(f"{BASE_URL}/validate_lua_code_batch",
+                               json={"lua_codes": lua_codes},
+                               headers={"Content-Type": "application/json"})
+        
+        if response.status_code == 200:
+            data = response.json()
+            results = data['results']
+            verdicts = [result['is_safe'] for result in results]
+            print(f"✅ 批量验证完成: {data['count']} 段代码, 结果 {verdicts}")
+            return verdicts == [True, False, True]
+        else:
+            print(f"❌ 批量验证失败: HTTP {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ 批量验证请求失败: {e}")
+        return False
+
+def test_metrics():
+    """测试Prometheus指标接口"""
+    print("\n📈 测试指标接口...")
+    try:
+        response = requests.get(f"{BASE_URL}/metrics")
+        if response.status_code == 200:
+            text = response.text
+            required = [
+                "ai_builder_http_requests_total",
+                "ai_builder_http_request_duration_seconds_bucket",
+                "ai_builder_response_source_total",
+                "ai_builder_cache_hit_ratio"
+            ]
+            missing = [name for name in required if name not in text]
+            if missing:
+                print(f"❌ 缺少指标: {missing}")
+                return False
+            print(f"✅ 指标正常: {len(text.splitlines())} 行")
+            return True
+        else:
+            print(f"❌ 指标查询失败: HTTP {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ 指标请求失败: {e}")
+        return False
+
+def test_trace():
+    """测试请求追踪接口"""
+    print("\n🔎 测试请求追踪...")
+    correlation_id = f"test-{int(time.time() * 1000)}"
+    try:
+        # X-Trace: 1 强制采样本次请求
+        response = requests.post(f"{BASE_URL}/decision",
+                               json={"context": {"health": 80.0}},
+                               headers={"X-Correlation-ID": correlation_id, "X-Trace": "1"})
+        if response.headers.get("X-Correlation-ID") != correlation_id:
+            print("❌ 响应未回传关联ID")
+            return False
+        
+        response = requests.get(f"{BASE_URL}/debug/trace", params={"correlation_id": correlation_id})
+        traces = response.json()['traces']
+        if not traces:
+            print("❌ 未找到追踪记录")
+            return False
+        
+        spans = [span['name'] for span in traces[0]['spans']]
+        print(f"✅ 追踪记录: {traces[0]['duration_ms']}ms, 阶段 {spans}")
+        return "game_context" in spans
+    except Exception as e:
+        print(f"❌ 追踪请求失败: {e}")
+        return False
+
+def test_invalid_context():
+    """测试无效上下文被拒绝"""
+    print("\n🚫 测试上下文校验...")
+    try:
+        response = requests.post(f"{BASE_URL}/decision",
+                               json={"context": {"health": "很健康", "season": "monsoon"}})
+        if response.status_code != 400:
+            print(f"❌ 无效上下文未被拒绝: HTTP {response.status_code}")
+            return False
+        
+        details = response.json().get('details', [])
+        print(f"✅ 无效上下文已拒绝: {details}")
+        return len(details) == 2
+    except Exception as e:
+        print(f"❌ 校验请求失败: {e}")
+        return False
+
+def test_context_session():
+    """测试增量上下文协议"""
+    print("\n🔁 测试增量上下文...")
+    session = {"entity_id": f"test-{int(time.time() * 1000)}", "version": 1}
+    try:
+        # 未注册的会话发送增量需要重新同步
+        response = requests.post(f"{BASE_URL}/decision",
+                               json={"session": session, "context_delta": {"wood_count": 3}})
+        if response.status_code != 409 or not response.json().get('resync'):
+            print(f"❌ 未注册会话的增量未被拒绝: HTTP {response.status_code}")
+            return False
+        
+        response = requests.post(f"{BASE_URL}/decision",
+                               json={"session": session, "context": {"health": 80.0, "wood_count": 2}})
+        if response.headers.get("X-Session-Version") != "1":
+            print(f"❌ 完整上下文注册失败: HTTP {response.status_code}")
+            return False
+        
+        response = requests.post(f"{BASE_URL}/decision",
+                               json={"session": dict(session, version=2), "context_delta": {"wood_count": 3}})
+        if response.headers.get("X-Session-Version") != "2":
+            print(f"❌ 增量未被接受: HTTP {response.status_code}")
+            return False
+        
+        # 跳过版本号需要重新同步
+        response = requests.post(f"{BASE_URL}/decision",
+                               json={"session": dict(session, version=5), "context_delta": {"wood_count": 4}})
+        print(f"✅ 增量协议正常，版本缺口返回: HTTP {response.status_code} 期望版本{response.json().get('expected_version')}")
+        return response.status_code == 409 and response.json().get('expected_version') == 3
+    except Exception as e:
+        print(f"❌ 增量上下文请求失败: {e}")
+        return False
+
+def test_task_library():
+    """测试任务代码库：已有模板的指令不经上游直接返回"""
+    print("\n📚 测试任务代码库...")
+    try:
+        response = requests.post(f"{BASE_URL}/generate_lua_code",
+                               json={"instruction": "把木材存进标记的箱子，半径25", "task_type": "collecting",
+                                     "context": {"health": 80.0, "wood_count": 6}})
+        result = response.json()
+        if response.status_code != 200 or not result.get('success'):
+            print(f"❌ 代码生成失败: HTTP {response.status_code}")
+            return False
+        
+        print(f"✅ {result['reasoning']}")
+        return ("function ExecuteAITask" in result['lua_code'] and '"wood_storage"' in result['lua_code']
+                and "25" in result['lua_code'])
+    except Exception as e:
+        print(f"❌ 代码生成请求失败: {e}")
+        return False
+
+def test_generation_job():
+    """测试异步代码生成任务：提交立即返回任务ID，长轮询取结果，相同请求复用任务"""
+    print("\n⏳ 测试异步代码生成...")
+    request_data = {"instruction": "去砍树", "task_type": "collecting",
+                    "context": {"health": 80.0, "wood_count": int(time.time()) % 5}}
+    try:
+        response = requests.post(f"{BASE_URL}/generate_lua_code/jobs", json=request_data)
+        if response.status_code != 202:
+            print(f"❌ 任务提交失败: HTTP {response.status_code}")
+            return False
+        job_id = response.json()['job_id']
+        
+        response = requests.get(f"{BASE_URL}/jobs/{job_id}", params={"wait": 10})
+        job = response.json()
+        if job.get('status') != "done" or not job['result'].get('success'):
+            print(f"❌ 任务未完成: {job}")
+            return False
+        print(f"✅ 任务 {job_id} 完成，排队{job['queue_time']}s，执行{job['run_time']}s")
+        
+        duplicate = requests.post(f"{BASE_URL}/generate_lua_code/jobs", json=request_data).json()
+        missing = requests.get(f"{BASE_URL}/jobs/not-a-job")
+        return duplicate['job_id'] == job_id and duplicate['deduplicated'] and missing.status_code == 404
+    except Exception as e:
+        print(f"❌ 异步任务请求失败: {e}")
+        return False
+
 def test_status():
     """测试状态接口"""
     print("\n📊 测试服务状态...")
@@ -129,8 +352,12 @@ def test_status():
             print(f"   服务: {status['service']}")
             print(f"   状态: {status['status']}")
             print(f"   API可用: {status['api_available']}")
+            backends = status['upstream_backends']
+            print(f"   上游后端: {[backend['name'] for backend in backends['backends']]}（{backends['policy']}）")
+            print(f"   聊天回复索引命中率: {status['chat_index']['hit_ratio']:.2f}")
+            print(f"   代码生成候选数: {status['codegen']['candidates']}，修复轮数: {status['codegen']['max_repairs']}")
             print(f"   时间: {status['timestamp']}")
-            return True
+            return len(backends['backends']) >= 1
         else:
             print(f"❌ 状态查询失败: HTTP {response.status_code}")
             return False
@@ -146,7 +373,16 @@ def run_all_tests():
     tests = [
         ("服务连接", test_ping),
         ("AI决策", test_decision),
+        ("决策缓存键", test_bucket_key),
+        ("决策间隔建议", test_decision_pacing),
         ("聊天功能", test_chat),
+        ("批量验证", test_validate_batch),
+        ("指标接口", test_metrics),
+        ("请求追踪", test_trace),
+        ("上下文校验", test_invalid_context),
+        ("增量上下文", test_context_session),
+        ("任务代码库", test_task_library),
+        ("异步代码生成", test_generation_job),
         ("服务状态", test_status)
     ]
     
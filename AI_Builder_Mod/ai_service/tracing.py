@@ -0,0 +1,248 @@
+# AI建设助手请求追踪
+# 记录每个请求各阶段的耗时，按采样率保留到环形缓冲区供 /debug/trace 查看
+
+import itertools
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+CORRELATION_HEADER = "X-Correlation-ID"
+FORCE_TRACE_HEADER = "X-Trace"
+# 请求钩子直接从WSGI environ读取请求头
+CORRELATION_ENVIRON = "HTTP_X_CORRELATION_ID"
+FORCE_TRACE_ENVIRON = "HTTP_X_TRACE"
+
+# 追踪配置
+TRACE_MAX_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_OVERHEAD_BUDGET = float(os.getenv("TRACE_OVERHEAD_BUDGET", "0.01"))  # 追踪开销占总耗时的上限
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+
+_local = threading.local()
+_buffer: deque = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+class _NullSpan:
+    """未采样时使用的空阶段，进入和退出都不做任何事"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """单个阶段的计时"""
+
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: "Trace", name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        self.trace.spans.append((self.name, self.start - self.trace.start, end - self.start,
+                                 exc_type.__name__ if exc_type else None))
+        return False
+
+
+class Trace:
+    """一次请求的追踪记录"""
+
+    __slots__ = ("correlation_id", "route", "method", "start", "wall_time", "spans", "status", "duration")
+
+    def __init__(self, correlation_id: str, route: str, method: str):
+        self.correlation_id = correlation_id
+        self.route = route
+        self.method = method
+        self.start = time.perf_counter()
+        self.wall_time = time.time()
+        self.spans: List[tuple] = []
+        self.status: Optional[int] = None
+        self.duration = 0.0
+
+    def span(self, name: str) -> _Span:
+        return _Span(self, name)
+
+    def to_dict(self) -> Dict:
+        return {
+            "correlation_id": self.correlation_id,
+            "route": self.route,
+            "method": self.method,
+            "timestamp": self.wall_time,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 3),
+            "spans": [
+                {
+                    "name": name,
+                    "start_ms": round(offset * 1000, 3),
+                    "duration_ms": round(duration * 1000, 3),
+                    "error": error
+                }
+                for name, offset, duration, error in sorted(self.spans, key=lambda item: item[1])
+            ]
+        }
+
+
+class _AdaptiveSampler:
+    """自适应采样：根据追踪自身开销和平均请求耗时调整采样率，使总开销低于预算"""
+
+    def __init__(self, max_rate: float, budget: float):
+        self.max_rate = max_rate
+        self.budget = budget
+        self.rate = max_rate
+        self.avg_overhead = 0.0
+        self.avg_duration = 0.0
+
+    def should_sample(self) -> bool:
+        return random.random() < self.rate
+
+    def update(self, overhead: float, duration: float, alpha: float = 0.1):
+        # 指数加权平均，避免单个慢请求造成采样率剧烈波动
+        self.avg_overhead += alpha * (overhead - self.avg_overhead)
+        self.avg_duration += alpha * (duration - self.avg_duration)
+        if self.avg_overhead > 0:
+            self.rate = min(self.max_rate, self.budget * self.avg_duration / self.avg_overhead)
+
+
+sampler = _AdaptiveSampler(TRACE_MAX_SAMPLE_RATE, TRACE_OVERHEAD_BUDGET)
+
+
+def _calibrate(iterations: int = 500):
+    """测量创建追踪和记录单个阶段的固有开销（秒）"""
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        trace = Trace("calibration", "/", "GET")
+    trace_cost = (time.perf_counter() - start_time) / iterations
+
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        with trace.span("calibration"):
+            pass
+    span_cost = (time.perf_counter() - start_time) / iterations
+    return trace_cost, span_cost
+
+
+# 首次结束追踪时才校准，导入模块（服务启动、工作进程fork）不承担这部分耗时
+_costs: Optional[Tuple[float, float]] = None
+
+
+def _overhead_costs() -> Tuple[float, float]:
+    global _costs
+    if _costs is None:
+        _costs = _calibrate()  # 并发的首次调用可能各校准一次，结果相同
+    return _costs
+
+
+# 关联ID = 进程随机前缀 + 递增序号：每个请求都要生成，比uuid4便宜得多；fork出的子进程重新取前缀
+_id_prefix = uuid.uuid4().hex[:16]
+_id_counter = itertools.count(1)
+
+
+def _reset_correlation_ids():
+    global _id_prefix, _id_counter
+    _id_prefix = uuid.uuid4().hex[:16]
+    _id_counter = itertools.count(1)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_correlation_ids)
+
+
+def new_correlation_id() -> str:
+    return f"{_id_prefix}{next(_id_counter):x}"
+
+
+def start_trace(route: str, method: str, correlation_id: str, force: bool = False) -> Optional[Trace]:
+    """开始追踪当前线程上的请求（未被采样时返回None）"""
+    if not (force or sampler.should_sample()):
+        _local.trace = None
+        return None
+    trace = Trace(correlation_id, route, method)
+    _local.trace = trace
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    """当前线程上的追踪（提交线程池任务前捕获，传给 run_in_trace）"""
+    return getattr(_local, "trace", None)
+
+
+def run_in_trace(trace: Optional[Trace], fn, *args, **kwargs):
+    """在指定追踪上下文中执行函数：追踪是线程局部的，线程池任务需要显式带上提交方的追踪"""
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _local.trace = previous
+
+
+def background_trace(route: str) -> Optional[Trace]:
+    """为请求返回后才执行的后台任务创建追踪，沿用当前请求的关联ID（当前请求未采样时返回None）"""
+    parent = getattr(_local, "trace", None)
+    if parent is None:
+        return None
+    return Trace(parent.correlation_id, route, parent.method)
+
+
+def finish_background_trace(trace: Optional[Trace], status: int) -> None:
+    """结束后台任务的追踪并写入环形缓冲区（不参与采样率调整，后台耗时不代表请求耗时）"""
+    if trace is None:
+        return
+    trace.status = status
+    trace.duration = time.perf_counter() - trace.start
+    _buffer.append(trace)
+
+
+def finish_trace(status: int) -> None:
+    """结束当前请求的追踪并写入环形缓冲区"""
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return
+    _local.trace = None
+    trace_cost, span_cost = _overhead_costs()
+    finish_start = time.perf_counter()
+    trace.status = status
+    trace.duration = finish_start - trace.start
+    _buffer.append(trace)
+    # 固有开销按校准值估算，加上收尾本身的耗时
+    overhead = trace_cost + len(trace.spans) * span_cost + (time.perf_counter() - finish_start)
+    sampler.update(overhead, trace.duration)
+
+
+def span(name: str):
+    """在当前追踪中记录一个阶段；未采样时返回空阶段"""
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return _NULL_SPAN
+    return trace.span(name)
+
+
+def recent_traces(limit: int = 50, route: Optional[str] = None,
+                  correlation_id: Optional[str] = None) -> List[Dict]:
+    """获取最近的追踪记录（最新的在前）"""
+    results = []
+    for trace in reversed(list(_buffer)):
+        if route and trace.route != route:
+            continue
+        if correlation_id and trace.correlation_id != correlation_id:
+            continue
+        results.append(trace.to_dict())
+        if len(results) >= limit:
+            break
+    return results
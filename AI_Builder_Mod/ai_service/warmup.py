@@ -0,0 +1,167 @@
+# AI建设助手启动缓存预热
+# 重启后决策缓存和代码缓存是空的，开局几分钟最常见的状态都要请求上游：
+# 后台线程读取决策/代码生成历史，按缓存分档统计频率，把最常见的K个分档预先写入缓存
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from context_schema import ContextValidationError
+
+logger = logging.getLogger(__name__)
+
+WARMUP_MODES = ("history", "upstream")
+
+
+def top_buckets(rows: List[Tuple[str, Any]], top_k: int) -> List[Tuple[str, Any, int]]:
+    """按分档统计频率，返回最常见的top_k个 (分档键, 该分档最近一条记录, 次数)
+
+    rows需按时间从新到旧排列，每个分档保留第一次出现（即最近）的记录。
+    """
+    counts: Counter = Counter()
+    latest: Dict[str, Any] = {}
+    for key, record in rows:
+        counts[key] += 1
+        latest.setdefault(key, record)
+    return [(key, latest[key], count) for key, count in counts.most_common(top_k)]
+
+
+class CacheWarmer:
+    """启动缓存预热
+
+    - history模式：直接把历史中该分档最近一次的决策/代码写入缓存，不调用上游
+    - upstream模式：为最常见的分档重新请求上游，调用间隔不小于1/rate秒
+    在后台线程运行，不影响 /ping 就绪；数据库文件不存在时（首次启动）直接跳过，不会创建数据库。
+    """
+
+    def __init__(self, service, mode: str = "history", top_k: int = 50, history_rows: int = 5000,
+                 rate: float = 1.0):
+        if mode not in WARMUP_MODES:
+            raise ValueError(f"未知的预热模式: {mode}")
+        self.service = service
+        self.mode = mode
+        self.top_k = top_k
+        self.history_rows = history_rows
+        self.rate = rate
+        self._thread = None
+        self._stats: Dict[str, Any] = {"state": "idle", "mode": mode, "decisions": 0, "code": 0}
+
+    def start(self):
+        """在后台线程中预热（重复调用无副作用）"""
+        if self._thread is not None:
+            return
+        self._stats["state"] = "running"
+        self._thread = threading.Thread(target=self._run, name="cache-warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.run()
+        except Exception as e:
+            self._stats["state"] = "failed"
+            logger.warning(f"缓存预热失败: {e}")
+
+    def run(self) -> Dict[str, Any]:
+        """同步执行预热，返回统计"""
+        start_time = time.perf_counter()
+        if not os.path.exists(self.service.db_path):
+            self._stats.update(state="skipped", reason="没有历史数据库")
+            return self.stats()
+
+        conn = sqlite3.connect(self.service.db_path)
+        try:
+            decisions = self._decision_buckets(conn)
+            code = self._code_buckets(conn)
+        finally:
+            conn.close()
+
+        self._stats["decisions"] = self._warm_decisions(decisions)
+        self._stats["code"] = self._warm_code(code)
+        self._stats.update(state="done", duration=round(time.perf_counter() - start_time, 3))
+        logger.info(f"缓存预热完成: {self._stats}")
+        return self.stats()
+
+    def _read(self, conn: sqlite3.Connection, sql: str) -> List[tuple]:
+        try:
+            return conn.execute(sql, (self.history_rows,)).fetchall()
+        except sqlite3.OperationalError:
+            return []  # 旧数据库没有该表
+
+    def _parse_context(self, raw: str):
+        try:
+            return self.service.sessions.parser(json.loads(raw))
+        except (ValueError, TypeError, ContextValidationError):
+            return None
+
+    def _decision_buckets(self, conn: sqlite3.Connection) -> List[Tuple[str, Any, int]]:
+        rows = []
+        for raw_context, raw_decision in self._read(
+                conn, "SELECT context, decision FROM decision_history ORDER BY id DESC LIMIT ?"):
+            context = self._parse_context(raw_context)
+            if context is None:
+                continue
+            rows.append((self.service._decision_cache_key(context), (context, raw_decision)))
+        return top_buckets(rows, self.top_k)
+
+    def _code_buckets(self, conn: sqlite3.Connection) -> List[Tuple[str, Any, int]]:
+        rows = []
+        for task_type, instruction, raw_context, lua_code, reasoning in self._read(
+                conn, "SELECT task_type, instruction, context, lua_code, reasoning FROM generation_history "
+                      "ORDER BY id DESC LIMIT ?"):
+            context = self._parse_context(raw_context)
+            if context is None:
+                continue
+            key = self.service._code_cache_key(instruction or "", context, task_type)
+            rows.append((key, (task_type, instruction or "", context, lua_code, reasoning)))
+        return top_buckets(rows, self.top_k)
+
+    def _throttle(self):
+        if self.rate > 0:
+            time.sleep(1.0 / self.rate)
+
+    def _warm_decisions(self, buckets) -> int:
+        warmed = 0
+        cache = self.service.decision_cache
+        for key, (context, raw_decision), _ in buckets:
+            if cache.contains(key):
+                continue
+            if self.mode == "history":
+                try:
+                    cache.set(key, json.loads(raw_decision))
+                except ValueError:
+                    continue
+                warmed += 1
+                continue
+            try:
+                if self.service.precompute_decision(context, traffic_class="warmup") is not None:
+                    warmed += 1
+            except Exception as e:
+                logger.debug(f"预热决策失败: {e}")
+            self._throttle()
+        return warmed
+
+    def _warm_code(self, buckets) -> int:
+        warmed = 0
+        cache = self.service.code_cache
+        for key, (task_type, instruction, context, lua_code, reasoning), _ in buckets:
+            if cache.contains(key):
+                continue
+            if self.mode == "history":
+                cache.set(key, [lua_code, reasoning])
+                warmed += 1
+                continue
+            try:
+                if self.service.precompute_lua_code(instruction, context, task_type, traffic_class="warmup"):
+                    warmed += 1
+            except Exception as e:
+                logger.debug(f"预热代码失败: {e}")
+            self._throttle()
+        return warmed
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._stats)
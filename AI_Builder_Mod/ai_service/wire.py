@@ -0,0 +1,195 @@
+# AI建设助手传输格式协商
+# 请求体支持gzip/deflate压缩和MessagePack编码，响应按Accept/Accept-Encoding选择编码；
+# 安装了orjson时用它做JSON编解码，安装了msgpack时启用MessagePack
+
+import io
+import json
+import os
+import zlib
+from typing import Any, Optional
+
+from flask import Request, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import BadRequest
+
+import metrics
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, "application/x-msgpack")
+
+COMPRESS_MIN_BYTES = int(os.getenv("WIRE_COMPRESS_MIN_BYTES", "512"))  # 小于该大小的响应不压缩
+COMPRESS_LEVEL = int(os.getenv("WIRE_COMPRESS_LEVEL", "6"))
+MAX_BODY_BYTES = int(os.getenv("WIRE_MAX_BODY_BYTES", str(2 * 1024 * 1024)))  # 解压后请求体上限
+
+SUPPORTED_ENCODINGS = ("gzip", "deflate")
+
+
+class BodyTooLarge(Exception):
+    """解压后的请求体超过上限"""
+
+
+def compress(data: bytes, encoding: str, level: int = COMPRESS_LEVEL) -> bytes:
+    """按HTTP内容编码压缩（deflate为zlib格式）"""
+    wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data: bytes, encoding: str, max_bytes: int = MAX_BODY_BYTES) -> bytes:
+    """解压请求体，超过max_bytes时抛出BodyTooLarge，避免压缩炸弹"""
+    if encoding == "gzip":
+        wbits_options = (16 + zlib.MAX_WBITS,)
+    else:
+        # 部分客户端的deflate不带zlib头，失败时按原始deflate再试
+        wbits_options = (zlib.MAX_WBITS, -zlib.MAX_WBITS)
+
+    for index, wbits in enumerate(wbits_options):
+        decompressor = zlib.decompressobj(wbits)
+        try:
+            body = decompressor.decompress(data, max_bytes + 1)
+        except zlib.error:
+            if index == len(wbits_options) - 1:
+                raise
+            continue
+        if len(body) > max_bytes or decompressor.unconsumed_tail:
+            raise BodyTooLarge()
+        return body
+    raise zlib.error("无法解压")
+
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    """根据Accept-Encoding选择响应压缩方式，不接受压缩时返回None"""
+    best = accept_encodings.best_match(SUPPORTED_ENCODINGS)
+    return best if best in SUPPORTED_ENCODINGS else None
+
+
+def wants_msgpack() -> bool:
+    """客户端是否更希望收到MessagePack响应"""
+    if msgpack is None:
+        return False
+    return request.accept_mimetypes.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES) in MSGPACK_MIMETYPES
+
+
+class DecompressRequestMiddleware:
+    """WSGI中间件：在路由读取之前解压带Content-Encoding的请求体"""
+
+    def __init__(self, wsgi_app, max_body_bytes: int = MAX_BODY_BYTES):
+        self.wsgi_app = wsgi_app
+        self.max_body_bytes = max_body_bytes
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if encoding in SUPPORTED_ENCODINGS:
+            try:
+                length = int(environ.get("CONTENT_LENGTH") or -1)
+            except ValueError:
+                return self._error(start_response, "400 Bad Request", "Content-Length无效")
+            # 压缩后的请求体不会比解压上限还大，超过上限的直接拒绝，不读入内存
+            if length > self.max_body_bytes:
+                return self._error(start_response, "413 Request Entity Too Large", "请求体过大")
+            raw = environ["wsgi.input"].read(length if length >= 0 else self.max_body_bytes + 1)
+            if len(raw) > self.max_body_bytes:
+                return self._error(start_response, "413 Request Entity Too Large", "请求体过大")
+            try:
+                body = decompress(raw, encoding, self.max_body_bytes)
+            except BodyTooLarge:
+                return self._error(start_response, "413 Request Entity Too Large", "解压后的请求体过大")
+            except zlib.error:
+                return self._error(start_response, "400 Bad Request", f"无法按{encoding}解压请求体")
+
+            metrics.WIRE_BYTES.inc("request", encoding, amount=len(raw))
+            environ["wsgi.input"] = io.BytesIO(body)
+            environ["CONTENT_LENGTH"] = str(len(body))
+            del environ["HTTP_CONTENT_ENCODING"]
+        elif encoding and encoding != "identity":
+            return self._error(start_response, "415 Unsupported Media Type", f"不支持的内容编码: {encoding}")
+        return self.wsgi_app(environ, start_response)
+
+    @staticmethod
+    def _error(start_response, status: str, message: str):
+        body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+        start_response(status, [("Content-Type", JSON_MIMETYPE), ("Content-Length", str(len(body)))])
+        return [body]
+
+
+class WireRequest(Request):
+    """支持MessagePack请求体的Request"""
+
+    def get_json(self, force: bool = False, silent: bool = False, cache: bool = True) -> Any:
+        if self.mimetype not in MSGPACK_MIMETYPES or msgpack is None:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        try:
+            return msgpack.unpackb(self.get_data(cache=cache), raw=False)
+        except Exception as e:
+            if silent:
+                return None
+            raise BadRequest(f"无法解析MessagePack请求体: {e}")
+
+
+class WireJSONProvider(DefaultJSONProvider):
+    """JSON编解码：优先使用orjson，响应可协商为MessagePack"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is not None and not kwargs.get("indent"):
+            try:
+                return orjson.dumps(obj, default=self.default).decode("utf-8")
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        if wants_msgpack():
+            return self._app.response_class(msgpack.packb(obj, default=str), mimetype=MSGPACK_MIMETYPE)
+        if orjson is not None and not self._app.debug:
+            try:
+                # 直接输出bytes，省去一次str到bytes的转换
+                return self._app.response_class(orjson.dumps(obj, default=self.default), mimetype=self.mimetype)
+            except TypeError:
+                pass
+        return super().response(obj)
+
+
+def compress_response(response):
+    """按Accept-Encoding压缩较大的响应体"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    encoding = negotiate_encoding(request.accept_encodings) if len(data) >= COMPRESS_MIN_BYTES else None
+    if encoding is None:
+        metrics.WIRE_BYTES.inc("response", "identity", amount=len(data))
+        return response
+
+    compressed = compress(data, encoding)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    metrics.WIRE_BYTES.inc("response", encoding, amount=len(compressed))
+    return response
+
+
+def init_app(flask_app):
+    """在Flask应用上启用传输格式协商"""
+    flask_app.json = WireJSONProvider(flask_app)
+    flask_app.request_class = WireRequest
+    flask_app.wsgi_app = DecompressRequestMiddleware(flask_app.wsgi_app)
+    flask_app.after_request(compress_response)
@@ -73,6 +73,16 @@ configuration_options = {
             {description = "自定义", data = "custom"}
         },
         default = "http://localhost:8000"
+    },
+    {
+        name = "event_triggers",
+        label = "事件触发决策",
+        hover = "生命/饥饿跨过阈值、昼夜变化、库存装满、建造完成时才请求AI决策，定时决策只作兜底",
+        options = {
+            {description = "启用", data = true},
+            {description = "禁用", data = false}
+        },
+        default = true
     }
 }
 
@@ -12,6 +12,7 @@ local AI_ACTIVITY = GetModConfigData("ai_activity") or 0.6
 local AI_CHAT_FREQUENCY = GetModConfigData("ai_chat_frequency") or 180
 local ENABLE_AI_SERVICE = GetModConfigData("enable_ai_service") or true
 local AI_SERVICE_URL = GetModConfigData("ai_service_url") or "http://localhost:8000"
+local EVENT_TRIGGERS = GetModConfigData("event_triggers") ~= false
 
 -- 全局变量设置
 GLOBAL.AI_BUILDER_CONFIG = {
@@ -19,7 +20,8 @@ GLOBAL.AI_BUILDER_CONFIG = {
     activity_level = AI_ACTIVITY,
     chat_frequency = AI_CHAT_FREQUENCY,
     ai_service_enabled = ENABLE_AI_SERVICE,
-    ai_service_url = AI_SERVICE_URL
+    ai_service_url = AI_SERVICE_URL,
+    event_triggers = EVENT_TRIGGERS
 }
 
 -- 预制件资源注册
@@ -54,6 +56,7 @@ local components = {
     "ai_communicator",
     "ai_code_executor",      -- 新增：代码执行器
     "ai_builder_controller", -- 新增：主控制器
+    "ai_decision_triggers",  -- 事件触发决策
 }
 
 for _, component in ipairs(components) do
@@ -64,6 +67,39 @@ end
 modimport("scripts/brains/builder_brain.lua")
 modimport("scripts/stategraphs/SGbuilder_ed.lua")
 
+-- 资源节点和建筑生成时通知AI规划器增量更新地形缓存和占用网格（位置在生成后才设置，推迟一帧转发）
+-- 只转发落在某个已规划基地范围内的实体（范围由ai_planner登记在TheWorld.ai_planner_bases）
+local TRACKED_SPAWN_TAGS = {"pickable", "choppable", "mineable", "structure", "wall"}
+
+local function HasActiveBase()
+    local bases = GLOBAL.TheWorld.ai_planner_bases
+    return bases ~= nil and GLOBAL.next(bases) ~= nil
+end
+
+local function IsNearActiveBase(inst)
+    local bases = GLOBAL.TheWorld.ai_planner_bases
+    if not bases then return false end
+    local x, y, z = inst.Transform:GetWorldPosition()
+    for _, base in pairs(bases) do
+        if math.abs(x - base.x) <= base.half_size and math.abs(z - base.z) <= base.half_size then
+            return true
+        end
+    end
+    return false
+end
+
+AddPrefabPostInitAny(function(inst)
+    if not GLOBAL.TheWorld or not GLOBAL.TheWorld.ismastersim or not HasActiveBase() or
+       not inst:HasOneOfTags(TRACKED_SPAWN_TAGS) then
+        return
+    end
+    inst:DoTaskInTime(0, function()
+        if inst:IsValid() and inst.Transform and IsNearActiveBase(inst) then
+            GLOBAL.TheWorld:PushEvent("ai_entityspawned", {inst = inst})
+        end
+    end)
+end)
+
 -- 游戏数值调整
 TUNING.AI_BUILDER = {
     -- 基础属性
@@ -78,6 +114,8 @@ TUNING.AI_BUILDER = {
     
     -- AI行为参数
     DECISION_INTERVAL = 30,     -- 决策间隔(秒)
+    EVENT_DEBOUNCE = 2,         -- 事件触发决策的去抖时间(秒)
+    EVENT_HEARTBEAT = 90,       -- 启用事件触发后兜底定时决策的最短间隔(秒)
     PLANNING_RANGE = 20,        -- 规划范围
     MEMORY_DURATION = 86400,    -- 记忆持续时间(秒)
     
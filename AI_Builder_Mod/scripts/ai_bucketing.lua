@@ -0,0 +1,56 @@
+-- AI决策缓存键分档规则
+-- 由 ai_service/bucketing.py 生成（规则版本 1），请勿手动修改：
+--   python bucketing.py --lua ../scripts/ai_bucketing.lua
+
+local AIBucketing = {}
+
+AIBucketing.VERSION = 1
+
+AIBucketing.FIELDS = {
+    { name = "season", kind = "value", default = "autumn" },
+    { name = "time_phase", kind = "value", default = "day" },
+    { name = "health", kind = "band", default = 100, width = 10, minimum = 0, maximum = 100 },
+    { name = "hunger", kind = "band", default = 100, width = 10, minimum = 0, maximum = 100 },
+    { name = "sanity", kind = "band", default = 100, width = 20, minimum = 0, maximum = 100 },
+    { name = "wood_count", kind = "band", default = 0, width = 5, cap = 30, minimum = 0, maximum = 100000 },
+    { name = "stone_count", kind = "band", default = 0, width = 5, cap = 20, minimum = 0, maximum = 100000 },
+    { name = "food_count", kind = "band", default = 0, width = 5, cap = 20, minimum = 0, maximum = 100000 },
+    { name = "inventory_full", kind = "flag", default = false },
+    { name = "has_campfire", kind = "flag", default = false },
+    { name = "has_chest", kind = "flag", default = false },
+}
+
+local function ToNumber(value, default)
+    if type(value) == "boolean" then
+        return value and 1 or 0
+    end
+    return tonumber(value) or default
+end
+
+local function Band(field, value)
+    value = ToNumber(value, field.default)
+    if field.minimum and value < field.minimum then value = field.minimum end
+    if field.maximum and value > field.maximum then value = field.maximum end
+    if field.cap and value > field.cap then value = field.cap end
+    return math.floor(value / field.width)
+end
+
+-- 决策缓存键，与服务端返回的cache_key一致
+function AIBucketing.BucketKey(context)
+    local parts = { "v" .. AIBucketing.VERSION }
+    for _, field in ipairs(AIBucketing.FIELDS) do
+        local value = context[field.name]
+        if value == nil then
+            value = field.default
+        end
+        if field.kind == "band" then
+            value = Band(field, value)
+        elseif field.kind == "flag" then
+            value = (value and value ~= 0) and 1 or 0
+        end
+        table.insert(parts, tostring(value))
+    end
+    return table.concat(parts, "|")
+end
+
+return AIBucketing
@@ -0,0 +1,82 @@
+-- AI通用LRU缓存
+-- 哈希表 + 双向链表：查找、写入、淘汰都是O(1)，不需要遍历整张表找最久未使用的条目
+
+local LRUCache = Class(function(self, max_size)
+    self.max_size = max_size or 128
+    self.size = 0
+    self.entries = {}             -- 键 -> 节点 {key, value, prev, next}
+
+    -- 哨兵节点：head.next 为最近使用，tail.prev 为最久未使用
+    self.head = {}
+    self.tail = {}
+    self.head.next = self.tail
+    self.tail.prev = self.head
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+end)
+
+local function Unlink(node)
+    node.prev.next = node.next
+    node.next.prev = node.prev
+end
+
+function LRUCache:PushFront(node)
+    node.prev = self.head
+    node.next = self.head.next
+    self.head.next.prev = node
+    self.head.next = node
+end
+
+function LRUCache:Get(key)
+    local node = self.entries[key]
+    if node == nil then
+        self.misses = self.misses + 1
+        return nil
+    end
+
+    Unlink(node)
+    self:PushFront(node)
+    self.hits = self.hits + 1
+    return node.value
+end
+
+function LRUCache:Set(key, value)
+    local node = self.entries[key]
+    if node then
+        node.value = value
+        Unlink(node)
+    else
+        if self.size >= self.max_size then
+            local oldest = self.tail.prev
+            Unlink(oldest)
+            self.entries[oldest.key] = nil
+            self.size = self.size - 1
+            self.evictions = self.evictions + 1
+        end
+        node = {key = key, value = value}
+        self.entries[key] = node
+        self.size = self.size + 1
+    end
+    self:PushFront(node)
+end
+
+function LRUCache:Clear()
+    self.entries = {}
+    self.size = 0
+    self.head.next = self.tail
+    self.tail.prev = self.head
+end
+
+function LRUCache:GetStats()
+    return {
+        size = self.size,
+        max_size = self.max_size,
+        hits = self.hits,
+        misses = self.misses,
+        evictions = self.evictions,
+    }
+end
+
+return LRUCache
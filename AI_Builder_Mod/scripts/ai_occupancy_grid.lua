@@ -0,0 +1,235 @@
+-- AI规划占用网格
+-- 基地中心周围每格记录地面是否可建设（首次查询时计算并缓存）和被多少个障碍物的净空范围覆盖：
+-- 障碍物加入/移除时只更新其净空圆内的格子，位置查询只看一个格子；
+-- 已规划但未建造的位置作为预留占用，同一次规划的建筑不会互相重叠
+
+local EXCLUDE_TAGS = {"INLIMBO", "FX", "NOCLICK", "DECOR", "player", "character", "_inventoryitem"}
+
+local OccupancyGrid = Class(function(self, center, half_size, cell_size, clearance)
+    self.center = center
+    self.half_size = half_size
+    self.cell_size = cell_size or 1
+    self.clearance = clearance or 2       -- 与原 FindEntities(pos, 2) 的障碍物检查范围一致
+
+    self.size = math.floor(2 * half_size / self.cell_size) + 1
+    self.buildable = {}                   -- 格子序号 -> 地面是否可建设（nil为尚未计算）
+    self.blocked = {}                     -- 格子序号 -> 覆盖该格的障碍物/预留数
+    self.occupants = {}                   -- 障碍物键（实体GUID或预留键）-> 覆盖的格子序号列表
+    self.next_reservation = 0
+
+    self.stats = {
+        queries = 0,
+        outside = 0,                      -- 超出网格范围、由调用方走慢路径的查询
+        tile_lookups = 0,
+        entity_scans = 0,
+        obstacle_updates = 0
+    }
+end)
+
+-- 世界坐标所在的格子序号，超出网格时返回nil
+function OccupancyGrid:IndexOf(x, z)
+    local i = math.floor((x - self.center.x + self.half_size) / self.cell_size + 0.5)
+    local j = math.floor((z - self.center.z + self.half_size) / self.cell_size + 0.5)
+    if i < 0 or j < 0 or i >= self.size or j >= self.size then
+        return nil
+    end
+    return i * self.size + j
+end
+
+function OccupancyGrid:CellPosition(index)
+    local i = math.floor(index / self.size)
+    local j = index % self.size
+    return self.center.x - self.half_size + i * self.cell_size, self.center.z - self.half_size + j * self.cell_size
+end
+
+function OccupancyGrid:IsBuildableCell(index)
+    local buildable = self.buildable[index]
+    if buildable == nil then
+        local x, z = self:CellPosition(index)
+        local tile = TheWorld.Map:GetTileAtPoint(x, 0, z)
+        buildable = tile ~= nil and tile ~= GROUND.IMPASSABLE and tile ~= GROUND.INVALID and
+            not TheWorld.Map:IsOceanTileAtPoint(x, 0, z)
+        self.buildable[index] = buildable
+        self.stats.tile_lookups = self.stats.tile_lookups + 1
+    end
+    return buildable
+end
+
+-- 位置是否可以放置建筑；超出网格范围时返回nil
+function OccupancyGrid:IsFree(x, z)
+    self.stats.queries = self.stats.queries + 1
+    local index = self:IndexOf(x, z)
+    if index == nil then
+        self.stats.outside = self.stats.outside + 1
+        return nil
+    end
+    return (self.blocked[index] or 0) == 0 and self:IsBuildableCell(index)
+end
+
+-- 把以(x, z)为圆心、净空半径内的格子计入占用
+function OccupancyGrid:Occupy(key, x, z)
+    if self.occupants[key] then
+        return false
+    end
+    local cells = {}
+    local reach = math.ceil(self.clearance / self.cell_size)
+    local ci = math.floor((x - self.center.x + self.half_size) / self.cell_size + 0.5)
+    local cj = math.floor((z - self.center.z + self.half_size) / self.cell_size + 0.5)
+    local limit = self.clearance * self.clearance
+    for i = math.max(0, ci - reach), math.min(self.size - 1, ci + reach) do
+        for j = math.max(0, cj - reach), math.min(self.size - 1, cj + reach) do
+            local index = i * self.size + j
+            local px, pz = self:CellPosition(index)
+            local dx, dz = px - x, pz - z
+            if dx * dx + dz * dz <= limit then
+                self.blocked[index] = (self.blocked[index] or 0) + 1
+                table.insert(cells, index)
+            end
+        end
+    end
+    self.occupants[key] = cells
+    self.stats.obstacle_updates = self.stats.obstacle_updates + 1
+    return true
+end
+
+function OccupancyGrid:Vacate(key)
+    local cells = self.occupants[key]
+    if not cells then
+        return false
+    end
+    for _, index in ipairs(cells) do
+        local count = (self.blocked[index] or 1) - 1
+        self.blocked[index] = count > 0 and count or nil
+    end
+    self.occupants[key] = nil
+    self.stats.obstacle_updates = self.stats.obstacle_updates + 1
+    return true
+end
+
+-- 是否是会阻挡建造的静止实体（移动的生物和地上的物品不计）
+function OccupancyGrid:IsObstacle(ent)
+    return ent and ent:IsValid() and not ent:HasOneOfTags(EXCLUDE_TAGS) and ent.components.locomotor == nil
+end
+
+function OccupancyGrid:AddObstacle(ent)
+    if not self:IsObstacle(ent) then
+        return false
+    end
+    local x, y, z = ent.Transform:GetWorldPosition()
+    if math.abs(x - self.center.x) > self.half_size + self.clearance or
+       math.abs(z - self.center.z) > self.half_size + self.clearance then
+        return false
+    end
+    return self:Occupy(ent.GUID, x, z)
+end
+
+function OccupancyGrid:RemoveObstacle(ent)
+    return self:Vacate(ent.GUID)
+end
+
+-- 一次扫描网格范围内的全部障碍物，返回加入的实体列表（调用方据此监听移除事件）
+function OccupancyGrid:ScanObstacles()
+    local added = {}
+    local radius = self.half_size * 1.415 + self.clearance
+    local ents = TheSim:FindEntities(self.center.x, 0, self.center.z, radius, nil, EXCLUDE_TAGS)
+    for _, ent in ipairs(ents) do
+        if self:AddObstacle(ent) then
+            table.insert(added, ent)
+        end
+    end
+    self.stats.entity_scans = self.stats.entity_scans + 1
+    return added
+end
+
+-- 为已规划的位置预留占用，返回预留键（建造完成后释放，由实体本身接替占用）
+function OccupancyGrid:Reserve(x, z)
+    self.next_reservation = self.next_reservation + 1
+    local key = "plan:" .. self.next_reservation
+    self:Occupy(key, x, z)
+    return key
+end
+
+function OccupancyGrid:Release(key)
+    return self:Vacate(key)
+end
+
+-- 地块变化后重新计算区域内格子的可建设状态
+function OccupancyGrid:InvalidateRegion(x, z, radius)
+    local reach = math.ceil(radius / self.cell_size)
+    local ci = math.floor((x - self.center.x + self.half_size) / self.cell_size + 0.5)
+    local cj = math.floor((z - self.center.z + self.half_size) / self.cell_size + 0.5)
+    for i = math.max(0, ci - reach), math.min(self.size - 1, ci + reach) do
+        for j = math.max(0, cj - reach), math.min(self.size - 1, cj + reach) do
+            self.buildable[i * self.size + j] = nil
+        end
+    end
+end
+
+-- 批量查询：区域（圆心center、半径radius）内最多k个空闲位置，按与near（默认区域中心）的距离排序，
+-- 选出的位置两两间距不小于spacing（默认净空半径）
+function OccupancyGrid:FindFreeSpots(center, radius, k, spacing, near)
+    near = near or center
+    spacing = spacing or self.clearance
+    local candidates = {}
+    local reach = math.ceil(radius / self.cell_size)
+    local ci = math.floor((center.x - self.center.x + self.half_size) / self.cell_size + 0.5)
+    local cj = math.floor((center.z - self.center.z + self.half_size) / self.cell_size + 0.5)
+    local limit = radius * radius
+    for i = math.max(0, ci - reach), math.min(self.size - 1, ci + reach) do
+        for j = math.max(0, cj - reach), math.min(self.size - 1, cj + reach) do
+            local index = i * self.size + j
+            if (self.blocked[index] or 0) == 0 then
+                local x, z = self:CellPosition(index)
+                local dx, dz = x - center.x, z - center.z
+                if dx * dx + dz * dz <= limit and self:IsBuildableCell(index) then
+                    local nx, nz = x - near.x, z - near.z
+                    table.insert(candidates, {x = x, z = z, score = nx * nx + nz * nz})
+                end
+            end
+        end
+    end
+    table.sort(candidates, function(a, b) return a.score < b.score end)
+
+    local spots = {}
+    local min_sq = spacing * spacing
+    for _, candidate in ipairs(candidates) do
+        if #spots >= k then
+            break
+        end
+        local clear = true
+        for _, spot in ipairs(spots) do
+            local dx, dz = spot.x - candidate.x, spot.z - candidate.z
+            if dx * dx + dz * dz < min_sq then
+                clear = false
+                break
+            end
+        end
+        if clear then
+            table.insert(spots, Vector3(candidate.x, 0, candidate.z))
+        end
+    end
+    return spots
+end
+
+function OccupancyGrid:GetStats()
+    local obstacles, reservations = 0, 0
+    for key in pairs(self.occupants) do
+        if type(key) == "string" then
+            reservations = reservations + 1
+        else
+            obstacles = obstacles + 1
+        end
+    end
+    return {
+        cells = self.size * self.size,
+        obstacles = obstacles,
+        reservations = reservations,
+        queries = self.stats.queries,
+        outside = self.stats.outside,
+        tile_lookups = self.stats.tile_lookups,
+        entity_scans = self.stats.entity_scans,
+        obstacle_updates = self.stats.obstacle_updates
+    }
+end
+
+return OccupancyGrid
@@ -0,0 +1,204 @@
+-- AI规划地形缓存
+-- 基地周围的地块分类只在首次规划时全量扫描，之后只重新扫描被标记为变化的区域（如铲草皮）；
+-- 资源节点建立索引，由实体生成/移除事件增量维护，重新规划的开销与变化量成正比而不是与半径的平方成正比
+
+local TERRAIN_NONE = 0        -- 无效/不可通行
+local TERRAIN_WATER = 1
+local TERRAIN_ROCKY = 2
+local TERRAIN_BUILDABLE = 3
+
+local COUNT_FIELDS = {
+    [TERRAIN_WATER] = "water_tiles",
+    [TERRAIN_ROCKY] = "rocky_tiles",
+    [TERRAIN_BUILDABLE] = "buildable_area",
+}
+
+local RESOURCE_TAGS = {"pickable", "choppable", "mineable"}
+
+local TerrainCache = Class(function(self, center, radius, step, resource_type_fn)
+    self.center = center
+    self.radius = radius
+    self.step = step or 2
+    self.resource_type_fn = resource_type_fn
+
+    -- 格子与原先的扫描点一致：x, z 各从 -radius 到 radius，间隔step
+    self.size = math.floor(2 * radius / self.step) + 1
+    self.tiles = {}               -- 格子序号 -> 地块分类
+    self.dirty = {}               -- 待重新扫描的格子序号
+    self.dirty_count = 0
+    self.counts = {buildable_area = 0, water_tiles = 0, rocky_tiles = 0}
+
+    self.resources = {}           -- 实体GUID -> 资源节点
+    self.resource_list = nil      -- 资源节点数组，索引变化后重建
+    self.resources_scanned = false
+
+    self.stats = {
+        cells_scanned = 0,        -- 累计扫描的格子数（首次全量 + 之后的增量）
+        refreshes = 0,
+        resource_scans = 0,       -- 全量资源扫描次数（只在首次）
+        resource_updates = 0      -- 增量加入/移除的资源节点数
+    }
+
+    for index = 0, self.size * self.size - 1 do
+        self.dirty[index] = true
+    end
+    self.dirty_count = self.size * self.size
+end)
+
+function TerrainCache:CellPosition(index)
+    local i = math.floor(index / self.size)
+    local j = index % self.size
+    return self.center.x - self.radius + i * self.step, self.center.z - self.radius + j * self.step
+end
+
+function TerrainCache:Classify(x, z)
+    local tile = TheWorld.Map:GetTileAtPoint(x, 0, z)
+    if not tile or tile == GROUND.IMPASSABLE or tile == GROUND.INVALID then
+        return TERRAIN_NONE
+    elseif TheWorld.Map:IsOceanTileAtPoint(x, 0, z) then
+        return TERRAIN_WATER
+    elseif tile == GROUND.ROCKY then
+        return TERRAIN_ROCKY
+    end
+    return TERRAIN_BUILDABLE
+end
+
+-- 标记区域内的格子需要重新扫描
+function TerrainCache:InvalidateRegion(x, z, radius)
+    local min_i = math.max(0, math.floor((x - radius - self.center.x + self.radius) / self.step))
+    local max_i = math.min(self.size - 1, math.ceil((x + radius - self.center.x + self.radius) / self.step))
+    local min_j = math.max(0, math.floor((z - radius - self.center.z + self.radius) / self.step))
+    local max_j = math.min(self.size - 1, math.ceil((z + radius - self.center.z + self.radius) / self.step))
+    local marked = 0
+    for i = min_i, max_i do
+        for j = min_j, max_j do
+            local index = i * self.size + j
+            if not self.dirty[index] then
+                self.dirty[index] = true
+                self.dirty_count = self.dirty_count + 1
+                marked = marked + 1
+            end
+        end
+    end
+    return marked
+end
+
+-- 重新扫描被标记的格子，增量更新各类地块的计数，返回扫描的格子数
+function TerrainCache:Refresh()
+    if self.dirty_count == 0 then
+        return 0
+    end
+    local scanned = 0
+    for index in pairs(self.dirty) do
+        local x, z = self:CellPosition(index)
+        local old = self.tiles[index]
+        local new = self:Classify(x, z)
+        if old ~= new then
+            if COUNT_FIELDS[old] then
+                self.counts[COUNT_FIELDS[old]] = self.counts[COUNT_FIELDS[old]] - 1
+            end
+            if COUNT_FIELDS[new] then
+                self.counts[COUNT_FIELDS[new]] = self.counts[COUNT_FIELDS[new]] + 1
+            end
+            self.tiles[index] = new
+        end
+        scanned = scanned + 1
+    end
+    self.dirty = {}
+    self.dirty_count = 0
+    self.stats.cells_scanned = self.stats.cells_scanned + scanned
+    self.stats.refreshes = self.stats.refreshes + 1
+    return scanned
+end
+
+-- 是否在基地范围内
+function TerrainCache:Covers(x, z)
+    local dx, dz = x - self.center.x, z - self.center.z
+    return dx * dx + dz * dz <= self.radius * self.radius
+end
+
+function TerrainCache:IsResource(ent)
+    return ent and ent:IsValid() and ent:HasOneOfTags(RESOURCE_TAGS)
+end
+
+-- 加入资源节点（不在范围内或不是资源时返回false）
+function TerrainCache:AddResource(ent)
+    if not self:IsResource(ent) or self.resources[ent.GUID] then
+        return false
+    end
+    local x, y, z = ent.Transform:GetWorldPosition()
+    if not self:Covers(x, z) then
+        return false
+    end
+    self.resources[ent.GUID] = {
+        type = self.resource_type_fn and self.resource_type_fn(ent) or "other",
+        position = Vector3(x, y, z),
+        prefab = ent.prefab
+    }
+    self.resource_list = nil
+    self.stats.resource_updates = self.stats.resource_updates + 1
+    return true
+end
+
+-- 移除资源节点（被砍倒、挖掉或删除）
+function TerrainCache:RemoveResource(ent)
+    if not self.resources[ent.GUID] then
+        return false
+    end
+    self.resources[ent.GUID] = nil
+    self.resource_list = nil
+    self.stats.resource_updates = self.stats.resource_updates + 1
+    return true
+end
+
+-- 首次全量扫描资源节点，返回加入索引的实体列表（调用方据此监听移除事件）
+function TerrainCache:ScanResources()
+    local added = {}
+    local ents = TheSim:FindEntities(self.center.x, 0, self.center.z, self.radius, nil, {"INLIMBO"}, RESOURCE_TAGS)
+    for _, ent in ipairs(ents) do
+        if self:AddResource(ent) then
+            table.insert(added, ent)
+        end
+    end
+    self.resources_scanned = true
+    self.stats.resource_scans = self.stats.resource_scans + 1
+    return added
+end
+
+function TerrainCache:GetResourceNodes()
+    if not self.resource_list then
+        self.resource_list = {}
+        for _, node in pairs(self.resources) do
+            table.insert(self.resource_list, node)
+        end
+    end
+    return self.resource_list
+end
+
+-- 与原 AnalyzeTerrain 结果相同结构的地形分析
+function TerrainCache:GetAnalysis()
+    return {
+        buildable_area = self.counts.buildable_area,
+        water_tiles = self.counts.water_tiles,
+        rocky_tiles = self.counts.rocky_tiles,
+        resource_nodes = self:GetResourceNodes()
+    }
+end
+
+function TerrainCache:GetStats()
+    local resource_count = 0
+    for _ in pairs(self.resources) do
+        resource_count = resource_count + 1
+    end
+    return {
+        cells = self.size * self.size,
+        dirty_cells = self.dirty_count,
+        cells_scanned = self.stats.cells_scanned,
+        refreshes = self.stats.refreshes,
+        resource_nodes = resource_count,
+        resource_scans = self.stats.resource_scans,
+        resource_updates = self.stats.resource_updates
+    }
+end
+
+return TerrainCache
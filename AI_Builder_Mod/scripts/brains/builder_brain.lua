@@ -17,6 +17,7 @@ local BuilderBrain = Class(Brain, function(self, inst)
     -- 决策间隔
     self.decision_interval = TUNING.AI_BUILDER.DECISION_INTERVAL or 30
     self.last_decision_time = 0
+    self.trigger_reasons = nil    -- 事件触发的待处理决策（触发原因列表）
     
     -- 当前任务
     self.current_task = nil
@@ -53,6 +54,21 @@ function BuilderBrain:OnStart()
     }, 1)
     
     self.bt = BT(self.inst, root)
+    
+    -- 事件触发决策：关键状态变化时不等定时间隔
+    local triggers = self.inst.components.ai_decision_triggers
+    if triggers then
+        triggers:AddListener("brain", function(reasons)
+            self.trigger_reasons = reasons
+        end)
+    end
+end
+
+function BuilderBrain:OnStop()
+    local triggers = self.inst.components.ai_decision_triggers
+    if triggers then
+        triggers:RemoveListener("brain")
+    end
 end
 
 -- 创建紧急情况行为
@@ -180,7 +196,7 @@ end
 -- 检查是否应该请求AI决策
 function BuilderBrain:ShouldRequestAIDecision()
     local current_time = GetTime()
-    if current_time - self.last_decision_time < self.decision_interval then
+    if not self.trigger_reasons and current_time - self.last_decision_time < self:GetDecisionInterval() then
         return false
     end
     
@@ -275,6 +291,21 @@ function BuilderBrain:CreateInventoryBehavior()
 end
 
 -- 创建AI决策行为
+-- 决策间隔：优先使用服务端随上次决策给出的建议，否则使用固定间隔；
+-- 启用事件触发时较长的间隔放宽为兜底间隔
+function BuilderBrain:GetDecisionInterval()
+    local interval = self.decision_interval
+    local communicator = self.inst.components.ai_communicator
+    if communicator then
+        interval = communicator:GetDecisionInterval(interval)
+    end
+    local triggers = self.inst.components.ai_decision_triggers
+    if triggers then
+        interval = triggers:GetTimerInterval(interval)
+    end
+    return interval
+end
+
 function BuilderBrain:CreateAIDecisionBehavior()
     return DoAction(self.inst, function()
         local communicator = self.inst.components.ai_communicator
@@ -284,6 +315,10 @@ function BuilderBrain:CreateAIDecisionBehavior()
                 self:ExecuteAIDecision(decision)
             end
             self.last_decision_time = GetTime()
+            self.trigger_reasons = nil
+            if self.inst.components.ai_decision_triggers then
+                self.inst.components.ai_decision_triggers:NoteDecision()
+            end
         end
         return nil
     end)
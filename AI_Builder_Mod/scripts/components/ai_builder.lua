@@ -196,19 +196,20 @@ function AIBuilder:ExecuteBuild(project)
     
     -- 尝试建造
     local success = false
+    local build_pos = nil
     if project.position then
-        local x, z = project.position.x, project.position.z
-        success = self.inst.components.builder:DoBuild(recipe, Vector3(x, 0, z), project.rotation)
+        build_pos = Vector3(project.position.x, 0, project.position.z)
+        success = self.inst.components.builder:DoBuild(recipe, build_pos, project.rotation)
     else
         -- 在附近找个合适的位置
-        local build_pos = self:FindBuildPosition(recipe)
+        build_pos = self:FindBuildPosition(recipe)
         if build_pos then
             success = self.inst.components.builder:DoBuild(recipe, build_pos, project.rotation)
         end
     end
     
     if success then
-        self:RecordBuildSuccess(project.recipe_name)
+        self:RecordBuildSuccess(project.recipe_name, build_pos)
         self.last_build_time = GetTime()
         
         -- 更新建设历史
@@ -273,9 +274,10 @@ function AIBuilder:IsValidBuildPosition(pos, recipe)
 end
 
 -- 记录建造成功
-function AIBuilder:RecordBuildSuccess(recipe_name)
+function AIBuilder:RecordBuildSuccess(recipe_name, position)
     -- 重置失败计数
     self.build_failures[recipe_name] = 0
+    self.inst:PushEvent("ai_buildcomplete", {recipe_name = recipe_name, position = position})
 end
 
 -- 记录建造失败
@@ -13,7 +13,8 @@ local AiBuilderController = Class(function(self, inst)
     self.code_executor = nil
     
     -- 控制参数
-    self.ai_decision_interval = 10  -- AI决策间隔（秒）
+    self.ai_decision_interval = 10  -- AI决策间隔（秒），没有服务端建议时使用
+    self.adaptive_decision_interval = true  -- 按服务端随决策给出的建议间隔安排下一次决策
     self.last_ai_decision = 0
     self.current_ai_task = nil
     self.ai_task_timeout = 60  -- AI任务超时时间
@@ -21,6 +22,8 @@ local AiBuilderController = Class(function(self, inst)
     -- 代码生成模式
     self.code_generation_enabled = true
     self.fallback_to_manual = true
+    self.async_code_generation = true  -- 通过异步任务接口生成代码，不阻塞决策循环
+    self.pending_generation = nil      -- 等待结果的代码生成任务 {type, start_time}
     
     -- 性能监控
     self.performance_stats = {
@@ -44,6 +47,18 @@ function AiBuilderController:OnEntitySpawn()
     -- 启动AI控制循环
     self:StartAILoop()
     
+    -- 事件触发决策：关键状态变化时立即决策，不等定时间隔
+    local triggers = self.inst.components.ai_decision_triggers
+    if triggers then
+        triggers:AddListener("controller", function(reasons)
+            if self.enabled then
+                print("[AI控制器] 事件触发决策:", table.concat(reasons, ","))
+                self:MakeAIDecision()
+                self.last_ai_decision = GetTime()
+            end
+        end)
+    end
+    
     print("[AI构建者控制器] AI角色已启动，代码生成模式:", self.code_generation_enabled and "启用" or "禁用")
 end
 
@@ -51,13 +66,27 @@ function AiBuilderController:StartAILoop()
     """启动AI决策循环"""
     
     self.inst:DoPeriodicTask(1, function()
-        if self.enabled and GetTime() - self.last_ai_decision >= self.ai_decision_interval then
+        if self.enabled and GetTime() - self.last_ai_decision >= self:GetDecisionInterval() then
             self:MakeAIDecision()
             self.last_ai_decision = GetTime()
         end
     end)
 end
 
+function AiBuilderController:GetDecisionInterval()
+    """当前的决策间隔：局势平稳时服务端建议的间隔较长，紧急时较短；启用事件触发时较长的间隔放宽为兜底间隔"""
+    
+    local interval = self.ai_decision_interval
+    if self.adaptive_decision_interval and self.ai_communicator then
+        interval = self.ai_communicator:GetDecisionInterval(interval)
+    end
+    local triggers = self.inst.components.ai_decision_triggers
+    if self.adaptive_decision_interval and triggers then
+        interval = triggers:GetTimerInterval(interval)
+    end
+    return interval
+end
+
 function AiBuilderController:MakeAIDecision()
     """执行AI决策"""
     
@@ -73,6 +102,15 @@ function AiBuilderController:MakeAIDecision()
         self.current_ai_task = nil
     end
     
+    -- 代码生成任务还在等待结果时不再提交新任务
+    if self.pending_generation then
+        if GetTime() - self.pending_generation.start_time <= self.ai_task_timeout then
+            return
+        end
+        print("[AI控制器] 代码生成任务超时，放弃等待:", self.pending_generation.type)
+        self.pending_generation = nil
+    end
+    
     -- 如果没有当前任务，生成新任务
     if not self.current_ai_task then
         local task_type = self:DetermineNextTaskType()
@@ -137,8 +175,27 @@ function AiBuilderController:ExecuteAIGeneratedTask(task_type)
     self.performance_stats.total_ai_requests = self.performance_stats.total_ai_requests + 1
     local start_time = GetTime()
     
-    -- 请求AI代码生成
+    -- 请求AI代码生成：异步任务在结果就绪时回调，同步请求直接处理
+    if self.async_code_generation and self.ai_manager.RequestAICodeGenerationAsync then
+        local pending = {type = task_type, start_time = start_time}
+        self.pending_generation = pending
+        self.ai_manager:RequestAICodeGenerationAsync(task_type, context, function(result)
+            -- 已超时放弃的任务结果不再执行
+            if self.pending_generation ~= pending then
+                return
+            end
+            self.pending_generation = nil
+            self:OnAIGenerationResult(task_type, result, start_time)
+        end)
+        return
+    end
+    
     local result = self.ai_manager:RequestAICodeGeneration(task_type, context)
+    self:OnAIGenerationResult(task_type, result, start_time)
+end
+
+function AiBuilderController:OnAIGenerationResult(task_type, result, start_time)
+    """处理代码生成结果（同步和异步请求共用）"""
     
     local execution_time = GetTime() - start_time
     self:UpdatePerformanceStats(result.success, execution_time)
@@ -367,6 +424,9 @@ function AiBuilderController:GetPerformanceReport()
         success_rate = success_rate,
         average_execution_time = self.performance_stats.average_execution_time,
         current_task = self.current_ai_task and self.current_ai_task.type or "none",
+        decision_interval = self:GetDecisionInterval(),
+        decision_triggers = self.inst.components.ai_decision_triggers and
+            self.inst.components.ai_decision_triggers:GetStatus() or nil,
         code_generation_enabled = self.code_generation_enabled
     }
 end
@@ -389,6 +449,7 @@ function AiBuilderController:SetAIDecisionInterval(interval)
     """设置AI决策间隔"""
     
     self.ai_decision_interval = math.max(1, interval)
+    self.adaptive_decision_interval = false  -- 手动设置后固定使用该间隔
     print("[AI控制器] AI决策间隔设置为", self.ai_decision_interval, "秒")
 end
 
@@ -1,12 +1,36 @@
 -- AI代码执行器组件
 -- 负责安全执行AI生成的Lua代码
 
+local LRUCache = require("ai_lru_cache")
+
+-- 代码摘要：长度 + 引擎哈希 + 首尾片段，作为验证缓存的键，不再以整段代码为键
+local DIGEST_EDGE = 16
+
+local function CodeDigest(code)
+    local len = #code
+    local h
+    if hash ~= nil then
+        h = hash(code)
+    else
+        -- 没有引擎哈希时退回纯Lua多项式哈希
+        h = 0
+        for i = 1, len do
+            h = (h * 31 + string.byte(code, i)) % 4294967296
+        end
+    end
+    return string.format("%d:%s:%s:%s", len, tostring(h),
+        string.sub(code, 1, DIGEST_EDGE), string.sub(code, -DIGEST_EDGE))
+end
+
 local AiCodeExecutor = Class(function(self, inst)
     self.inst = inst
     self.generated_functions = {}
     self.execution_history = {}
     self.max_execution_time = 5 -- 最大执行时间（秒）
     self.security_enabled = true
+    
+    -- 验证结果缓存（以规范化代码的摘要为键，LRU淘汰）
+    self.validation_cache = LRUCache(128)
 end)
 
 function AiCodeExecutor:ExecuteGeneratedCode(lua_code, task_type, context)
@@ -60,13 +84,39 @@ function AiCodeExecutor:ExecuteGeneratedCode(lua_code, task_type, context)
     end
 end
 
+function AiCodeExecutor:NormalizeCode(lua_code)
+    """规范化代码（统一换行符、去除行尾空白），与服务端规则一致"""
+    local code = string.gsub(lua_code, "\r\n?", "\n")
+    code = string.gsub(code, "[ \t]+\n", "\n")
+    code = string.gsub(code, "^%s+", "")
+    code = string.gsub(code, "%s+$", "")
+    return code
+end
+
 function AiCodeExecutor:ValidateCodeSafety(lua_code)
-    """验证代码安全性"""
+    """验证代码安全性（带缓存）"""
     
     if not self.security_enabled then
         return true
     end
     
+    local code = self:NormalizeCode(lua_code)
+    local key = CodeDigest(code)
+    
+    local cached = self.validation_cache:Get(key)
+    if cached ~= nil then
+        return cached
+    end
+    
+    local is_safe = self:CheckCodeSafety(code)
+    self.validation_cache:Set(key, is_safe)
+    
+    return is_safe
+end
+
+function AiCodeExecutor:CheckCodeSafety(lua_code)
+    """执行实际的安全检查（不使用缓存）"""
+    
     -- 危险函数模式检查
     local dangerous_patterns = {
         "io%.",           -- 文件操作
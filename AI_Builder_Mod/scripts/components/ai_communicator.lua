@@ -2,6 +2,7 @@
 -- 负责与DeepSeek API通信和本地决策
 
 local json = require("util/json")
+local AIBucketing = require("ai_bucketing")
 local AIComm = Class(function(self, inst)
     self.inst = inst
     self.enabled = GLOBAL.AI_BUILDER_CONFIG.ai_service_enabled or false
@@ -10,16 +11,38 @@ local AIComm = Class(function(self, inst)
     self.api_url = GLOBAL.AI_BUILDER_CONFIG.ai_service_url or "http://localhost:8000"
     self.api_timeout = 10
     self.max_retries = 3
+    self.transport = nil          -- HTTP传输函数（SetTransport设置），未设置时使用模拟响应
     
     -- 通信状态
     self.last_request_time = 0
     self.request_interval = TUNING.AI_BUILDER.DECISION_INTERVAL or 30
     self.api_available = false
     self.consecutive_failures = 0
+    self.request_counter = 0
+    self.decision_requests = 0    -- 实际发往服务端的决策请求数（不含缓存命中和本地规则）
+    self.stats_start_time = GetTime()
+    self.retry_after_until = 0    -- 服务端过载降级时给出的退避截止时间，之前只用本地规则
+    
+    -- 决策间隔：服务端随决策给出下次请求的建议秒数（局势平稳时长、紧急时短）
+    self.advised_interval = nil   -- 最近一次建议，未收到或改用本地规则时为nil
+    self.min_decision_interval = 3
+    self.max_decision_interval = 120
+    
+    -- 异步代码生成任务：提交后按服务端建议的间隔长轮询结果
+    self.job_poll_wait = 20       -- 每次长轮询最多等待的秒数
+    self.job_timeout = 90         -- 超过该时间仍未完成则放弃
+    
+    -- 增量上下文会话：服务端保存上次确认的上下文，之后只发送变化的字段
+    self.session_id = string.format("ed%d", inst.GUID or 0)
+    self.session_sent = 0         -- 最近发送的版本号
+    self.session_version = nil    -- 服务端已确认的版本号
+    self.session_context = nil    -- 服务端已确认的上下文
+    self.session_inflight = 0
     
     -- 缓存系统
     self.decision_cache = {}
     self.cache_expiry = 300 -- 5分钟缓存
+    self.bucket_mismatches = 0    -- 本地缓存键与服务端规范键不一致的次数（分档规则版本不同）
     
     -- 本地备用规则引擎
     self.fallback_enabled = true
@@ -118,29 +141,66 @@ function AIComm:TestAPIConnection()
     end)
 end
 
--- 发送HTTP请求（模拟实现）
+-- 设置HTTP传输函数 transport(url, body, headers, callback)
+-- callback(success, response)：response为响应表或JSON字符串；请求头（压缩协商、关联ID）由传输函数随请求发出
+function AIComm:SetTransport(transport)
+    self.transport = transport
+end
+
+-- 发送HTTP请求：配置了传输函数时经由它发出，否则模拟
 function AIComm:SendRequest(endpoint, data, callback)
-    -- 这里是简化的HTTP请求实现
-    -- 在实际MOD中需要使用饥荒的网络API或外部脚本
+    -- 饥荒的网络API不支持自定义请求头，实际请求需要由外部脚本或网络模块通过SetTransport接入
     
     local full_url = self.api_url .. endpoint
     local request_data = json.encode(data)
     
-    -- 模拟异步请求
-    self.inst:DoTaskInTime(1, function()
-        if self.api_available and math.random() > 0.1 then -- 90%成功率模拟
-            local mock_response = self:GenerateMockResponse(endpoint, data)
-            callback(true, mock_response)
+    -- 关联ID：服务端追踪（/debug/trace）沿用该ID，便于对照游戏日志排查慢请求
+    local correlation_id = self:NextCorrelationId()
+    -- 服务端对较大的响应（生成的Lua代码等）按Accept-Encoding压缩，由HTTP层解压
+    local headers = {
+        ["Content-Type"] = "application/json",
+        ["Accept-Encoding"] = "gzip, deflate",
+        ["X-Correlation-ID"] = correlation_id
+    }
+    
+    local function on_response(success, response)
+        if success and type(response) == "string" then
+            local ok, decoded = pcall(json.decode, response)
+            success, response = ok, ok and decoded or "响应解析失败"
+        end
+        if success then
+            callback(true, response)
         else
             self.consecutive_failures = self.consecutive_failures + 1
             if self.consecutive_failures > 3 then
                 self.api_available = false
             end
-            callback(false, "请求失败")
+            print("[AI Builder] 请求失败: " .. endpoint .. " (关联ID: " .. correlation_id .. ")")
+            callback(false, response or "请求失败")
+        end
+    end
+    
+    if self.transport then
+        self.transport(full_url, request_data, headers, on_response)
+        return
+    end
+    
+    -- 模拟异步请求（请求头不会真正发出）
+    self.inst:DoTaskInTime(1, function()
+        if self.api_available and math.random() > 0.1 then -- 90%成功率模拟
+            on_response(true, self:GenerateMockResponse(endpoint, data))
+        else
+            on_response(false, "请求失败")
         end
     end)
 end
 
+-- 生成请求关联ID（实体GUID + 递增序号）
+function AIComm:NextCorrelationId()
+    self.request_counter = self.request_counter + 1
+    return string.format("ed%d-%d", self.inst.GUID or 0, self.request_counter)
+end
+
 -- 生成模拟响应（用于测试）
 function AIComm:GenerateMockResponse(endpoint, request_data)
     if endpoint == "/ping" then
@@ -157,6 +217,18 @@ function AIComm:GenerateMockResponse(endpoint, request_data)
             message = "我正在分析当前情况，马上就有建设建议了。",
             tone = "professional"
         }
+    elseif endpoint == "/generate_lua_code/jobs" then
+        return {job_id = "mock-job", status = "queued", poll_after = 1}
+    elseif string.find(endpoint, "^/jobs/") then
+        return {
+            job_id = "mock-job",
+            status = "done",
+            result = {
+                success = true,
+                lua_code = 'function ExecuteAITask(inst)\n    return {action="analyze_situation", status="thinking", message="分析当前情况"}\nend',
+                reasoning = "模拟任务结果"
+            }
+        }
     end
     
     return {status = "unknown_endpoint"}
@@ -164,7 +236,7 @@ end
 
 -- 请求AI决策
 function AIComm:RequestDecision(context, callback)
-    if not self.enabled or not self.api_available then
+    if not self.enabled or not self.api_available or self:IsBackingOff() then
         -- 使用本地规则引擎
         local decision = self:GetLocalDecision(context)
         if callback then callback(true, decision) end
@@ -175,45 +247,202 @@ function AIComm:RequestDecision(context, callback)
     local cache_key = self:GenerateCacheKey(context)
     local cached_decision = self.decision_cache[cache_key]
     if cached_decision and GetTime() - cached_decision.timestamp < self.cache_expiry then
+        self:NoteAdvisedInterval(cached_decision.decision)
         if callback then callback(true, cached_decision.decision) end
         return
     end
     
     -- 准备请求数据
     local request_data = {
-        context = context,
         timestamp = GetTime(),
         mode = self.inst.components.ai_builder and self.inst.components.ai_builder.work_mode or "collaborative"
     }
+    local version = self:AttachContext(request_data, context)
     
     -- 发送请求
+    self.decision_requests = self.decision_requests + 1
     self:SendRequest("/decision", request_data, function(success, response)
+        self:OnContextSent(success, version, context)
         if success and response then
-            -- 缓存决策
-            self.decision_cache[cache_key] = {
-                decision = response,
-                timestamp = GetTime()
-            }
+            -- 缓存决策（过载降级的后备决策不缓存，退避结束后重新请求）
+            if not self:NoteRetryAfter(response) then
+                self:CheckBucketKey(cache_key, response)
+                self:NoteAdvisedInterval(response)
+                self.decision_cache[cache_key] = {
+                    decision = response,
+                    timestamp = GetTime()
+                }
+            end
             
             if callback then callback(true, response) end
         else
             -- 降级到本地规则
+            self.advised_interval = nil
             local local_decision = self:GetLocalDecision(context)
             if callback then callback(false, local_decision) end
         end
     end)
 end
 
+-- 记录服务端建议的下次决策间隔（缓存命中时沿用该决策附带的建议）
+function AIComm:NoteAdvisedInterval(response)
+    local interval = tonumber(response.next_decision_in)
+    if interval then
+        self.advised_interval = math.max(self.min_decision_interval, math.min(self.max_decision_interval, interval))
+    end
+end
+
+-- 下次请求决策前应等待的秒数：有服务端建议时用建议值，否则用调用方的固定间隔
+function AIComm:GetDecisionInterval(default_interval)
+    if self.advised_interval and self.enabled and self.api_available and not self:IsBackingOff() then
+        return self.advised_interval
+    end
+    return default_interval
+end
+
+-- 服务端过载时返回本地后备结果（source = "shed"）并给出retry_after秒数：
+-- 退避期间不再请求服务端也不重试，避免重试加重过载。返回是否为降级响应
+function AIComm:NoteRetryAfter(response)
+    if response.source ~= "shed" then
+        return false
+    end
+    local retry_after = tonumber(response.retry_after) or self.api_timeout
+    self.retry_after_until = math.max(self.retry_after_until, GetTime() + retry_after)
+    print(string.format("[AI Builder] 服务繁忙，%d秒内使用本地规则", retry_after))
+    return true
+end
+
+function AIComm:IsBackingOff()
+    return GetTime() < self.retry_after_until
+end
+
+-- 提交异步代码生成任务：POST立即返回任务ID，之后长轮询 /jobs/<id> 直到完成，
+-- 不再让一次代码生成占住HTTP请求几十秒。callback(success, result)，result与同步接口的响应相同
+function AIComm:SubmitCodeGenerationJob(request_data, callback)
+    if not self.enabled or not self.api_available or self:IsBackingOff() then
+        callback(false, "AI服务不可用")
+        return
+    end
+    
+    self:SendRequest("/generate_lua_code/jobs", request_data, function(success, response)
+        if not success or not response then
+            callback(false, "任务提交失败")
+        elseif response.status == "done" then
+            -- 任务排队已满时服务端直接返回后备代码
+            self:NoteRetryAfter(response)
+            callback(true, response.result)
+        elseif response.job_id then
+            self:PollJob(response.job_id, GetTime() + self.job_timeout, response.poll_after, callback)
+        else
+            callback(false, response.error or "任务提交失败")
+        end
+    end)
+end
+
+function AIComm:PollJob(job_id, deadline, delay, callback)
+    self.inst:DoTaskInTime(tonumber(delay) or 1, function()
+        local endpoint = string.format("/jobs/%s?wait=%d", job_id, self.job_poll_wait)
+        self:SendRequest(endpoint, nil, function(success, response)
+            if success and response and response.status == "done" then
+                local result = response.result or {}
+                self:NoteRetryAfter(result)
+                callback(true, result)
+            elseif success and response and (response.status == "queued" or response.status == "running")
+                    and GetTime() < deadline then
+                self:PollJob(job_id, deadline, response.poll_after, callback)
+            else
+                -- 任务失败、已过期或超时
+                callback(false, response and response.error or "任务未完成")
+            end
+        end)
+    end)
+end
+
+-- 比较两个上下文字段是否相同（表按内容比较）
+local function ValuesEqual(a, b)
+    if type(a) ~= "table" or type(b) ~= "table" then
+        return a == b
+    end
+    for key, value in pairs(a) do
+        if not ValuesEqual(value, b[key]) then
+            return false
+        end
+    end
+    for key in pairs(b) do
+        if a[key] == nil then
+            return false
+        end
+    end
+    return true
+end
+
+-- 附加上下文：只有在服务端已确认上一版本且没有其他请求在途时才发送增量，否则发送完整上下文
+function AIComm:AttachContext(request_data, context)
+    self.session_sent = self.session_sent + 1
+    local version = self.session_sent
+    request_data.session = {entity_id = self.session_id, version = version}
+    
+    local can_delta = self.session_context ~= nil
+        and self.session_inflight == 0
+        and self.session_version == version - 1
+    self.session_inflight = self.session_inflight + 1
+    
+    if not can_delta then
+        request_data.context = context
+        return version
+    end
+    
+    local delta = {}
+    for key, value in pairs(context) do
+        if not ValuesEqual(self.session_context[key], value) then
+            delta[key] = value
+        end
+    end
+    local removed = {}
+    for key in pairs(self.session_context) do
+        if context[key] == nil then
+            table.insert(removed, key)
+        end
+    end
+    
+    request_data.context_delta = delta
+    if #removed > 0 then
+        request_data.context_removed = removed
+    end
+    return version
+end
+
+-- 请求完成后更新会话：成功则记录已确认的上下文，失败（含服务端要求重新同步）则下次发送完整上下文
+function AIComm:OnContextSent(success, version, context)
+    self.session_inflight = math.max(0, self.session_inflight - 1)
+    if success then
+        if self.session_version == nil or version > self.session_version then
+            self.session_version = version
+            -- 深拷贝，避免base_center等共享表被原地修改后漏发变化
+            self.session_context = deepcopy(context)
+        end
+    else
+        self.session_version = nil
+        self.session_context = nil
+    end
+end
+
 -- 生成缓存键
 function AIComm:GenerateCacheKey(context)
-    -- 基于关键上下文信息生成键
-    local key_parts = {
-        tostring(context.season or ""),
-        tostring(context.time_phase or ""),
-        tostring(math.floor(context.health or 0 / 10) * 10),
-        tostring(math.floor(context.hunger or 0 / 10) * 10)
-    }
-    return table.concat(key_parts, "_")
+    -- 分档规则由服务端 bucketing.py 生成，与服务端决策缓存键一致
+    return AIBucketing.BucketKey(context)
+end
+
+-- 服务端随决策返回规范缓存键：不一致说明本地分档规则版本过旧，需要重新生成 ai_bucketing.lua
+function AIComm:CheckBucketKey(cache_key, response)
+    if not response.cache_key or response.cache_key == cache_key then
+        return
+    end
+    self.bucket_mismatches = self.bucket_mismatches + 1
+    if self.bucket_mismatches == 1 then
+        print(string.format("[AI Builder] 缓存键与服务端不一致（本地规则版本%d，服务端%s）: %s ~= %s",
+            AIBucketing.VERSION, tostring(response.bucket_version), cache_key, response.cache_key))
+    end
 end
 
 -- 本地决策引擎
@@ -310,7 +539,7 @@ end
 
 -- 请求对话响应
 function AIComm:RequestChatResponse(player_message, callback)
-    if not self.enabled or not self.api_available then
+    if not self.enabled or not self.api_available or self:IsBackingOff() then
         local response = self:GetLocalChatResponse(player_message)
         if callback then callback(true, response) end
         return
@@ -319,16 +548,18 @@ function AIComm:RequestChatResponse(player_message, callback)
     local context = self:BuildContext()
     local request_data = {
         player_message = player_message,
-        context = context,
         character_info = {
             name = "建造师艾德",
             role = "建设工程师",
             personality = "专业、务实、友善"
         }
     }
+    local version = self:AttachContext(request_data, context)
     
     self:SendRequest("/chat", request_data, function(success, response)
+        self:OnContextSent(success, version, context)
         if success and response then
+            self:NoteRetryAfter(response)
             if callback then callback(true, response) end
         else
             local local_response = self:GetLocalChatResponse(player_message)
@@ -463,6 +694,10 @@ function AIComm:GetStatus()
         api_available = self.api_available,
         consecutive_failures = self.consecutive_failures,
         cache_size = table.getn(self.decision_cache),
+        bucket_mismatches = self.bucket_mismatches,
+        advised_interval = self.advised_interval,
+        decision_requests = self.decision_requests,
+        decision_requests_per_hour = self.decision_requests * 3600 / math.max(1, GetTime() - self.stats_start_time),
         fallback_active = not self.api_available and self.fallback_enabled
     }
 end
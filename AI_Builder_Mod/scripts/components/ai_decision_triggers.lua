@@ -0,0 +1,217 @@
+-- AI决策事件触发组件
+-- 固定间隔轮询既滞后于真实事件，又会在什么都没变时请求决策：
+-- 监听生命/饥饿跨过阈值、昼夜阶段变化、库存装满和建造完成，去抖合并后只在决策分档实际变化时触发决策，
+-- 定时决策退化为长间隔的兜底
+
+local AIBucketing = require("ai_bucketing")
+
+local AIDecisionTriggers = Class(function(self, inst)
+    self.inst = inst
+    self.enabled = GLOBAL.AI_BUILDER_CONFIG.event_triggers ~= false
+
+    -- 去抖：事件发生后等待debounce秒再触发，期间的事件合并为一次；两次触发至少间隔min_gap秒
+    self.debounce = TUNING.AI_BUILDER.EVENT_DEBOUNCE or 2
+    self.min_gap = 5
+
+    -- 兜底定时决策：服务端建议的间隔不超过short_interval时照常使用（紧急、夜晚无火等），
+    -- 否则至少间隔heartbeat_interval秒，其余时间靠事件触发
+    self.heartbeat_interval = TUNING.AI_BUILDER.EVENT_HEARTBEAT or 90
+    self.short_interval = 15
+
+    -- 阈值（百分比，升序）；跨过最低阈值视为紧急，立即触发
+    self.thresholds = {
+        health = {0.3, 0.5},
+        hunger = {0.2, 0.4},
+    }
+    self.hysteresis = 0.02        -- 在阈值附近来回波动时不重复触发
+    self.levels = {}              -- 各状态当前所在的档位
+    self.was_full = false
+
+    self.listeners = {}           -- 名称 -> function(reasons)
+    self.pending = nil            -- 等待触发的事件 {reasons, always, urgent}
+    self.pending_task = nil
+    self.last_fire_time = -math.huge
+    self.last_key = nil           -- 上次决策时的决策缓存键
+
+    self.stats = {
+        events = 0,               -- 收到的事件数
+        coalesced = 0,            -- 合并进已等待的触发
+        unchanged = 0,            -- 决策分档未变化而丢弃
+        fired = 0                 -- 实际触发的决策数
+    }
+
+    if self.enabled then
+        self:StartListening()
+    end
+end)
+
+-- 注册实体和世界事件
+function AIDecisionTriggers:StartListening()
+    self.inst:ListenForEvent("healthdelta", function(inst, data)
+        self:OnStatDelta("health", data and data.newpercent)
+    end)
+    self.inst:ListenForEvent("hungerdelta", function(inst, data)
+        self:OnStatDelta("hunger", data and data.newpercent)
+    end)
+    self.inst:WatchWorldState("phase", function(inst, phase)
+        self:Trigger("phase_" .. tostring(phase), false, false)
+    end)
+    self.inst:ListenForEvent("itemget", function() self:OnInventoryChanged() end)
+    self.inst:ListenForEvent("itemlose", function() self:OnInventoryChanged() end)
+    self.inst:ListenForEvent("ai_buildcomplete", function(inst, data)
+        -- 建造进度不在决策缓存键中，完成建造总是触发
+        self:Trigger("build_complete", true, false)
+    end)
+end
+
+-- 注册触发回调（大脑、控制器各一个）
+function AIDecisionTriggers:AddListener(name, fn)
+    self.listeners[name] = fn
+end
+
+function AIDecisionTriggers:RemoveListener(name)
+    self.listeners[name] = nil
+end
+
+-- 计算百分比所在的档位：低于第一个阈值为0，高于最后一个阈值为阈值个数
+function AIDecisionTriggers:LevelOf(stat, percent)
+    local level = 0
+    for i, threshold in ipairs(self.thresholds[stat]) do
+        if percent >= threshold then
+            level = i
+        end
+    end
+    return level
+end
+
+-- 生命/饥饿变化：跨过阈值（超出滞回范围）时触发，跌破最低阈值为紧急
+function AIDecisionTriggers:OnStatDelta(stat, percent)
+    if percent == nil then
+        return
+    end
+    local thresholds = self.thresholds[stat]
+    local level = self.levels[stat]
+    local new_level = self:LevelOf(stat, percent)
+    if level == nil then
+        self.levels[stat] = new_level
+        return
+    end
+    if new_level < level and percent < thresholds[new_level + 1] - self.hysteresis then
+        self.levels[stat] = new_level
+        self:Trigger(stat .. "_below_" .. thresholds[new_level + 1], false, new_level == 0)
+    elseif new_level > level and percent >= thresholds[new_level] + self.hysteresis then
+        self.levels[stat] = new_level
+        self:Trigger(stat .. "_above_" .. thresholds[new_level], false, false)
+    end
+end
+
+-- 库存从未满变为已满时触发
+function AIDecisionTriggers:OnInventoryChanged()
+    local inventory = self.inst.components.inventory
+    local is_full = inventory ~= nil and inventory:IsFull()
+    if is_full and not self.was_full then
+        self:Trigger("inventory_full", false, false)
+    end
+    self.was_full = is_full
+end
+
+-- 记录事件：已有等待中的触发时合并，紧急事件立即触发
+function AIDecisionTriggers:Trigger(reason, always, urgent)
+    if not self.enabled then
+        return
+    end
+    self.stats.events = self.stats.events + 1
+
+    local pending = self.pending
+    if pending then
+        self.stats.coalesced = self.stats.coalesced + 1
+        table.insert(pending.reasons, reason)
+        pending.always = pending.always or always
+        if urgent and not pending.urgent then
+            pending.urgent = true
+            self:Schedule(0)
+        end
+        return
+    end
+
+    self.pending = {reasons = {reason}, always = always, urgent = urgent}
+    local delay = 0
+    if not urgent then
+        delay = math.max(self.debounce, self.last_fire_time + self.min_gap - GetTime())
+    end
+    self:Schedule(delay)
+end
+
+function AIDecisionTriggers:Schedule(delay)
+    if self.pending_task then
+        self.pending_task:Cancel()
+    end
+    self.pending_task = self.inst:DoTaskInTime(delay, function()
+        self.pending_task = nil
+        self:Fire()
+    end)
+end
+
+-- 当前上下文的决策缓存键
+function AIDecisionTriggers:CurrentKey()
+    local communicator = self.inst.components.ai_communicator
+    if not communicator then
+        return nil
+    end
+    return AIBucketing.BucketKey(communicator:BuildContext())
+end
+
+-- 去抖结束：决策分档没有变化（且不是必须触发的事件）时丢弃，否则通知各回调
+function AIDecisionTriggers:Fire()
+    local pending = self.pending
+    self.pending = nil
+    if not pending then
+        return
+    end
+
+    local key = self:CurrentKey()
+    if not pending.always and not pending.urgent and key ~= nil and key == self.last_key then
+        self.stats.unchanged = self.stats.unchanged + 1
+        return
+    end
+
+    self.last_key = key
+    self.last_fire_time = GetTime()
+    self.stats.fired = self.stats.fired + 1
+    for name, fn in pairs(self.listeners) do
+        fn(pending.reasons)
+    end
+end
+
+-- 任何决策（事件或定时）之后记录当时的决策缓存键，之后的事件与之比较
+function AIDecisionTriggers:NoteDecision()
+    self.last_key = self:CurrentKey()
+end
+
+-- 定时决策的间隔：启用事件触发后，较长的间隔放宽到兜底间隔
+function AIDecisionTriggers:GetTimerInterval(interval)
+    if not self.enabled or interval <= self.short_interval then
+        return interval
+    end
+    return math.max(interval, self.heartbeat_interval)
+end
+
+function AIDecisionTriggers:GetStatus()
+    return {
+        enabled = self.enabled,
+        pending = self.pending ~= nil,
+        events = self.stats.events,
+        coalesced = self.stats.coalesced,
+        unchanged = self.stats.unchanged,
+        fired = self.stats.fired
+    }
+end
+
+function AIDecisionTriggers:OnRemoveFromEntity()
+    if self.pending_task then
+        self.pending_task:Cancel()
+        self.pending_task = nil
+    end
+end
+
+return AIDecisionTriggers
@@ -474,8 +474,51 @@ end
 function AIManager:RequestAICodeGeneration(task_type, context)
     """请求AI生成任务代码"""
     
+    -- 服务端过载退避期间直接使用后备方案
+    local communicator = self.inst.components.ai_communicator
+    if communicator and communicator:IsBackingOff() then
+        return {
+            success = false,
+            error = "AI服务繁忙",
+            fallback_action = self.code_executor:GetFallbackAction(task_type)
+        }
+    end
+    
     -- 准备请求数据
-    local request_data = {
+    local request_data = self:BuildCodeGenerationRequest(task_type, context)
+    
+    print("[AI管理器] 请求AI生成代码，任务类型:", task_type)
+    
+    -- 发送请求到AI服务
+    local success, response = self:SendAIRequest("/generate_lua_code", request_data)
+    return self:HandleGeneratedCode(success, response, task_type, request_data)
+end
+
+-- 异步版本：提交代码生成任务后立即返回，结果就绪时调用callback(result)，result与同步版本相同
+function AIManager:RequestAICodeGenerationAsync(task_type, context, callback)
+    local communicator = self.inst.components.ai_communicator
+    if not communicator then
+        callback(self:RequestAICodeGeneration(task_type, context))
+        return
+    end
+    if communicator:IsBackingOff() then
+        callback({
+            success = false,
+            error = "AI服务繁忙",
+            fallback_action = self.code_executor:GetFallbackAction(task_type)
+        })
+        return
+    end
+    
+    local request_data = self:BuildCodeGenerationRequest(task_type, context)
+    print("[AI管理器] 提交AI代码生成任务，任务类型:", task_type)
+    communicator:SubmitCodeGenerationJob(request_data, function(success, response)
+        callback(self:HandleGeneratedCode(success, response, task_type, request_data))
+    end)
+end
+
+function AIManager:BuildCodeGenerationRequest(task_type, context)
+    return {
         task_type = task_type,
         character_state = self:GetCharacterState(),
         environment_info = self:GetEnvironmentInfo(),
@@ -483,14 +526,16 @@ function AIManager:RequestAICodeGeneration(task_type, context)
         current_needs = self:GetCurrentNeeds(),
         context = context or {}
     }
-    
-    print("[AI管理器] 请求AI生成代码，任务类型:", task_type)
-    
-    -- 发送请求到AI服务
-    local success, response = self:SendAIRequest("/generate_lua_code", request_data)
-    
-    if success and response and response.lua_code then
+end
+
+-- 执行服务端返回的代码（同步和异步请求共用）
+function AIManager:HandleGeneratedCode(success, response, task_type, request_data)
+    local communicator = self.inst.components.ai_communicator
+    if success and type(response) == "table" and response.lua_code then
         print("[AI管理器] 收到AI生成的代码")
+        if communicator then
+            communicator:NoteRetryAfter(response)
+        end
         
         -- 执行生成的代码
         local execution_result = self.code_executor:ExecuteGeneratedCode(
@@ -1,6 +1,9 @@
 -- AI规划组件
 -- 负责基地规划、布局设计和长期建设策略
 
+local TerrainCache = require("ai_terrain_cache")
+local OccupancyGrid = require("ai_occupancy_grid")
+
 local AIPlanner = Class(function(self, inst)
     self.inst = inst
     self.enabled = true
@@ -31,6 +34,39 @@ local AIPlanner = Class(function(self, inst)
     -- 规划历史
     self.planning_history = {}
     self.last_plan_update = 0
+    
+    -- 地形缓存：基地中心不变时重复使用，只重新扫描变化的区域；资源节点由生成/移除事件增量维护
+    self.terrain_cache = nil
+    self._on_resource_gone = function(ent)
+        if self.terrain_cache then
+            self.terrain_cache:RemoveResource(ent)
+        end
+    end
+    
+    -- 占用网格：位置检查只查一个格子，障碍物由生成/移除事件增量维护
+    self.occupancy = nil
+    self.occupancy_margin = 8       -- 网格比基地半径多覆盖的范围（生产区延伸到中心外24格）
+    self.structure_spacing = 4      -- 替补位置之间的最小间距
+    self._on_obstacle_gone = function(ent)
+        if self.occupancy then
+            self.occupancy:RemoveObstacle(ent)
+        end
+    end
+    -- 规划位置上建成的建筑被拆除/烧毁时，该规划恢复为未建造并重新预留位置
+    self._on_planned_removed = function(ent)
+        self:OnPlannedStructureRemoved(ent)
+    end
+    self.inst:ListenForEvent("ai_buildcomplete", function(inst, data)
+        if data and data.recipe_name and data.position then
+            self:MarkStructureBuilt({recipe_name = data.recipe_name, position = data.position})
+        end
+    end)
+    self.inst:ListenForEvent("ai_entityspawned", function(world, data)
+        self:OnEntitySpawned(data and data.inst)
+    end, TheWorld)
+    self.inst:ListenForEvent("onterraform", function(world, data)
+        self:OnTerraform(data)
+    end, TheWorld)
 end)
 
 -- 初始化基地规划
@@ -50,50 +86,173 @@ function AIPlanner:InitializeBasePlanning(center_point)
     end
 end
 
--- 分析地形
+-- 分析地形：首次全量扫描，之后只重新扫描被标记为变化的格子
 function AIPlanner:AnalyzeTerrain()
     if not self.base_center then return end
     
-    local terrain_analysis = {
-        buildable_area = 0,
-        water_tiles = 0,
-        rocky_tiles = 0,
-        resource_nodes = {}
-    }
-    
-    local x, z = self.base_center.x, self.base_center.z
-    local range = self.base_radius
+    local cache = self:GetTerrainCache()
+    cache:Refresh()
+    self.terrain_analysis = cache:GetAnalysis()
+end
+
+-- 获取当前基地的地形缓存，基地中心或半径变化时重建
+function AIPlanner:GetTerrainCache()
+    local cache = self.terrain_cache
+    if cache and cache.radius == self.base_radius and
+       self:GetDistance(cache.center, self.base_center) < 0.5 then
+        return cache
+    end
     
-    -- 扫描地形格子
-    for dx = -range, range, 2 do
-        for dz = -range, range, 2 do
-            local test_x, test_z = x + dx, z + dz
-            local tile = TheWorld.Map:GetTileAtPoint(test_x, 0, test_z)
-            
-            if tile and tile ~= GROUND.IMPASSABLE and tile ~= GROUND.INVALID then
-                if TheWorld.Map:IsOceanTileAtPoint(test_x, 0, test_z) then
-                    terrain_analysis.water_tiles = terrain_analysis.water_tiles + 1
-                elseif tile == GROUND.ROCKY then
-                    terrain_analysis.rocky_tiles = terrain_analysis.rocky_tiles + 1
-                else
-                    terrain_analysis.buildable_area = terrain_analysis.buildable_area + 1
-                end
-            end
+    self:ReleaseTerrainCache()
+    cache = TerrainCache(self.base_center, self.base_radius, 2, function(ent)
+        return self:GetResourceType(ent)
+    end)
+    self.terrain_cache = cache
+    for _, ent in ipairs(cache:ScanResources()) do
+        self:WatchResource(ent)
+    end
+    self:RegisterTrackedArea()
+    return cache
+end
+
+-- 取消对旧缓存中资源节点的监听
+function AIPlanner:ReleaseTerrainCache()
+    if not self.terrain_cache then return end
+    for guid in pairs(self.terrain_cache.resources) do
+        local ent = Ents[guid]
+        if ent then
+            self.inst:RemoveEventCallback("onremove", self._on_resource_gone, ent)
+            self.inst:RemoveEventCallback("workfinished", self._on_resource_gone, ent)
         end
     end
-    
-    -- 扫描资源节点
-    local resources = TheSim:FindEntities(x, 0, z, range, {"pickable", "choppable", "mineable"})
-    for _, resource in ipairs(resources) do
-        local rx, ry, rz = resource.Transform:GetWorldPosition()
-        table.insert(terrain_analysis.resource_nodes, {
-            type = self:GetResourceType(resource),
-            position = Vector3(rx, ry, rz),
-            prefab = resource.prefab
-        })
+    self.terrain_cache = nil
+end
+
+-- 在世界上登记基地范围（正方形，覆盖地形缓存和占用网格），modmain只转发范围内的实体生成事件
+function AIPlanner:RegisterTrackedArea()
+    local bases = TheWorld.ai_planner_bases
+    if not bases then
+        bases = {}
+        TheWorld.ai_planner_bases = bases
+    end
+    bases[self] = {
+        x = self.base_center.x,
+        z = self.base_center.z,
+        half_size = math.max(self.base_radius, self.base_radius + self.occupancy_margin)
+    }
+end
+
+function AIPlanner:UnregisterTrackedArea()
+    if TheWorld.ai_planner_bases then
+        TheWorld.ai_planner_bases[self] = nil
+    end
+end
+
+-- 资源节点被移除或采完（树被砍倒、石头被挖掉）时从索引中删除
+function AIPlanner:WatchResource(ent)
+    self.inst:ListenForEvent("onremove", self._on_resource_gone, ent)
+    self.inst:ListenForEvent("workfinished", self._on_resource_gone, ent)
+end
+
+-- 新生成的资源节点和建筑（modmain中转发的 ai_entityspawned 事件）
+function AIPlanner:OnEntitySpawned(ent)
+    -- 尚未规划基地（没有地形缓存和占用网格）时无需处理
+    if not ent or (not self.terrain_cache and not self.occupancy) then return end
+    if self.terrain_cache and self.terrain_cache:AddResource(ent) then
+        self:WatchResource(ent)
+    end
+    if self.occupancy and self.occupancy:AddObstacle(ent) then
+        self:WatchObstacle(ent)
+    end
+    -- 建在规划位置上的建筑（AI或玩家建造）接替该位置的预留
+    if ent:IsValid() and ent:HasOneOfTags({"structure", "wall"}) then
+        self:MarkStructureBuilt({recipe_name = ent.prefab, position = ent:GetPosition(), entity = ent})
+    end
+end
+
+-- 地块被改变（铲草皮、铺地皮）时标记所在区域需要重新扫描
+function AIPlanner:OnTerraform(data)
+    if not self.terrain_cache or not data or not data.x or not data.y then return end
+    local x, y, z = TheWorld.Map:GetTileCenterPoint(data.x, data.y)
+    if x and z then
+        self.terrain_cache:InvalidateRegion(x, z, TILE_SCALE or 4)
+        if self.occupancy then
+            self.occupancy:InvalidateRegion(x, z, TILE_SCALE or 4)
+        end
+    end
+end
+
+-- 获取当前基地的占用网格，基地中心或半径变化时重建（只做一次实体扫描）
+function AIPlanner:GetOccupancyGrid()
+    if not self.base_center then return nil end
+    local grid = self.occupancy
+    local half_size = self.base_radius + self.occupancy_margin
+    if grid and grid.half_size == half_size and self:GetDistance(grid.center, self.base_center) < 0.5 then
+        return grid
     end
     
-    self.terrain_analysis = terrain_analysis
+    self:ReleaseOccupancyGrid()
+    grid = OccupancyGrid(self.base_center, half_size, 1, 2)
+    self.occupancy = grid
+    for _, ent in ipairs(grid:ScanObstacles()) do
+        self:WatchObstacle(ent)
+    end
+    self:RegisterTrackedArea()
+    -- 新网格中重新预留尚未建造的规划位置
+    self:ForEachPlannedStructure(function(planned)
+        if not planned.built then
+            planned.reservation = grid:Reserve(planned.position.x, planned.position.z)
+        end
+    end)
+    return grid
+end
+
+function AIPlanner:ReleaseOccupancyGrid()
+    if not self.occupancy then return end
+    self:ForEachPlannedStructure(function(planned)
+        planned.reservation = nil
+    end)
+    for key in pairs(self.occupancy.occupants) do
+        local ent = type(key) == "number" and Ents[key] or nil
+        if ent then
+            self.inst:RemoveEventCallback("onremove", self._on_obstacle_gone, ent)
+            self.inst:RemoveEventCallback("enterlimbo", self._on_obstacle_gone, ent)
+        end
+    end
+    self.occupancy = nil
+end
+
+-- 障碍物被移除或被捡起（进入INLIMBO）时释放占用
+function AIPlanner:WatchObstacle(ent)
+    self.inst:ListenForEvent("onremove", self._on_obstacle_gone, ent)
+    self.inst:ListenForEvent("enterlimbo", self._on_obstacle_gone, ent)
+end
+
+function AIPlanner:ForEachPlannedStructure(fn)
+    for _, zone in pairs(self.zones) do
+        for _, planned in ipairs(zone.planned_structures) do
+            fn(planned)
+        end
+    end
+end
+
+-- 释放规划的预留占用
+function AIPlanner:ReleaseReservation(planned)
+    if planned.reservation and self.occupancy then
+        self.occupancy:Release(planned.reservation)
+    end
+    planned.reservation = nil
+end
+
+-- 丢弃当前规划前释放所有预留，并停止监听规划位置上的建筑
+function AIPlanner:ReleasePlannedStructures()
+    self:ForEachPlannedStructure(function(planned)
+        self:ReleaseReservation(planned)
+        if planned.entity then
+            self.inst:RemoveEventCallback("onremove", self._on_planned_removed, planned.entity)
+            planned.entity = nil
+        end
+    end)
 end
 
 -- 获取资源类型
@@ -113,6 +272,9 @@ end
 function AIPlanner:CreateZoneLayout()
     if not self.base_center then return end
     
+    -- 重新规划（如同一中心再次初始化）时，旧规划的预留不能留在网格里
+    self:ReleasePlannedStructures()
+    
     local cx, cz = self.base_center.x, self.base_center.z
     
     -- 核心区（中心）
@@ -154,6 +316,9 @@ end
 
 -- 生成初始规划
 function AIPlanner:GenerateInitialPlan()
+    -- 位置检查使用占用网格（只扫描一次实体）
+    self:GetOccupancyGrid()
+    
     -- 核心区规划
     self:PlanCoreStructures()
     
@@ -169,6 +334,41 @@ function AIPlanner:GenerateInitialPlan()
     self.last_plan_update = GetTime()
 end
 
+-- 把建筑加入区域规划，并在占用网格中预留该位置
+function AIPlanner:AddPlannedStructure(zone, recipe_name, position, priority)
+    local structure = {
+        recipe_name = recipe_name,
+        position = position,
+        priority = priority,
+        zone = zone.type
+    }
+    if self.occupancy then
+        structure.reservation = self.occupancy:Reserve(position.x, position.z)
+    end
+    table.insert(zone.planned_structures, structure)
+    return structure
+end
+
+-- 按首选位置规划一组建筑；substitute为true时，首选位置不可用的建筑改用区域内最近的空闲位置（一次批量查询）
+function AIPlanner:PlanZoneStructures(zone, entries, substitute)
+    local blocked = {}
+    for _, entry in ipairs(entries) do
+        if self:IsPositionSuitable(entry.position, entry.recipe) then
+            self:AddPlannedStructure(zone, entry.recipe, entry.position, entry.priority)
+        elseif substitute then
+            table.insert(blocked, entry)
+        end
+    end
+    
+    local grid = self.occupancy
+    if #blocked > 0 and grid then
+        local spots = grid:FindFreeSpots(zone.center, zone.radius, #blocked, self.structure_spacing)
+        for i, spot in ipairs(spots) do
+            self:AddPlannedStructure(zone, blocked[i].recipe, spot, blocked[i].priority)
+        end
+    end
+end
+
 -- 规划核心建筑
 function AIPlanner:PlanCoreStructures()
     local core_zone = self.zones.core
@@ -181,17 +381,12 @@ function AIPlanner:PlanCoreStructures()
         {recipe = "researchlab2", priority = 0.7, offset = Vector3(4, 0, -2)}
     }
     
+    local entries = {}
     for _, struct in ipairs(structures) do
-        local pos = core_zone.center + struct.offset
-        if self:IsPositionSuitable(pos, struct.recipe) then
-            table.insert(core_zone.planned_structures, {
-                recipe_name = struct.recipe,
-                position = pos,
-                priority = struct.priority,
-                zone = "core"
-            })
-        end
+        table.insert(entries, {recipe = struct.recipe, priority = struct.priority,
+                               position = core_zone.center + struct.offset})
     end
+    self:PlanZoneStructures(core_zone, entries, true)
 end
 
 -- 规划生产建筑
@@ -208,18 +403,12 @@ function AIPlanner:PlanProductionStructures()
     
     local grid_spacing = 4
     local current_x, current_z = 0, 0
+    local entries = {}
     
     for _, struct in ipairs(structures) do
         for i = 1, (struct.count or 1) do
-            local pos = prod_zone.center + Vector3(current_x, 0, current_z)
-            if self:IsPositionSuitable(pos, struct.recipe) then
-                table.insert(prod_zone.planned_structures, {
-                    recipe_name = struct.recipe,
-                    position = pos,
-                    priority = struct.priority,
-                    zone = "production"
-                })
-            end
+            table.insert(entries, {recipe = struct.recipe, priority = struct.priority,
+                                   position = prod_zone.center + Vector3(current_x, 0, current_z)})
             
             current_x = current_x + grid_spacing
             if current_x > 8 then
@@ -228,6 +417,7 @@ function AIPlanner:PlanProductionStructures()
             end
         end
     end
+    self:PlanZoneStructures(prod_zone, entries, true)
 end
 
 -- 规划存储建筑
@@ -250,22 +440,17 @@ function AIPlanner:PlanStorageStructures()
     }
     
     local pos_index = 1
+    local entries = {}
     for _, struct in ipairs(structures) do
         for i = 1, (struct.count or 1) do
             if pos_index <= #positions then
-                local pos = storage_zone.center + positions[pos_index]
-                if self:IsPositionSuitable(pos, struct.recipe) then
-                    table.insert(storage_zone.planned_structures, {
-                        recipe_name = struct.recipe,
-                        position = pos,
-                        priority = struct.priority,
-                        zone = "storage"
-                    })
-                end
+                table.insert(entries, {recipe = struct.recipe, priority = struct.priority,
+                                       position = storage_zone.center + positions[pos_index]})
                 pos_index = pos_index + 1
             end
         end
     end
+    self:PlanZoneStructures(storage_zone, entries, true)
 end
 
 -- 规划防御建筑
@@ -277,20 +462,13 @@ function AIPlanner:PlanDefenseStructures()
     local wall_radius = 14
     local wall_segments = 16
     
+    -- 围墙和陷阱位置固定，首选位置不可用时跳过
+    local entries = {}
     for i = 0, wall_segments - 1 do
         local angle = (i / wall_segments) * 2 * PI
         local x = defense_zone.center.x + math.cos(angle) * wall_radius
         local z = defense_zone.center.z + math.sin(angle) * wall_radius
-        local pos = Vector3(x, 0, z)
-        
-        if self:IsPositionSuitable(pos, "wall_hay") then
-            table.insert(defense_zone.planned_structures, {
-                recipe_name = "wall_hay",
-                position = pos,
-                priority = 0.6,
-                zone = "defense"
-            })
-        end
+        table.insert(entries, {recipe = "wall_hay", priority = 0.6, position = Vector3(x, 0, z)})
     end
     
     -- 添加一些陷阱
@@ -302,20 +480,21 @@ function AIPlanner:PlanDefenseStructures()
     }
     
     for _, offset in ipairs(trap_positions) do
-        local pos = defense_zone.center + offset
-        if self:IsPositionSuitable(pos, "trap") then
-            table.insert(defense_zone.planned_structures, {
-                recipe_name = "trap",
-                position = pos,
-                priority = 0.5,
-                zone = "defense"
-            })
-        end
+        table.insert(entries, {recipe = "trap", priority = 0.5, position = defense_zone.center + offset})
     end
+    self:PlanZoneStructures(defense_zone, entries, false)
 end
 
--- 检查位置是否合适
+-- 检查位置是否合适：网格范围内查占用网格，范围外逐项检查
 function AIPlanner:IsPositionSuitable(pos, recipe_name)
+    local grid = self.occupancy
+    if grid then
+        local free = grid:IsFree(pos.x, pos.z)
+        if free ~= nil then
+            return free
+        end
+    end
+    
     -- 检查地面类型
     local tile = TheWorld.Map:GetTileAtPoint(pos.x, pos.y, pos.z)
     if tile == GROUND.IMPASSABLE or tile == GROUND.INVALID then
@@ -357,14 +536,22 @@ function AIPlanner:GetNextPlannedStructure()
     return all_structures[1]
 end
 
--- 标记建筑为已建造
+-- 标记建筑为已建造：建造完成事件（ai_buildcomplete）和建筑生成事件都会调用，
+-- 后者带上实体，以便建筑被移除时恢复规划
 function AIPlanner:MarkStructureBuilt(structure)
     for zone_name, zone in pairs(self.zones) do
         for _, planned in ipairs(zone.planned_structures) do
             if planned.recipe_name == structure.recipe_name and
+               (not planned.built or (structure.entity and not planned.entity)) and
                planned.position and structure.position and
                self:GetDistance(planned.position, structure.position) < 3 then
                 planned.built = true
+                -- 建成的建筑由生成事件加入占用网格，释放规划时的预留
+                self:ReleaseReservation(planned)
+                if structure.entity then
+                    planned.entity = structure.entity
+                    self.inst:ListenForEvent("onremove", self._on_planned_removed, structure.entity)
+                end
                 return true
             end
         end
@@ -372,6 +559,19 @@ function AIPlanner:MarkStructureBuilt(structure)
     return false
 end
 
+-- 规划位置上的建筑被移除：恢复为未建造并重新预留，等待重建
+function AIPlanner:OnPlannedStructureRemoved(ent)
+    self:ForEachPlannedStructure(function(planned)
+        if planned.entity == ent then
+            planned.entity = nil
+            planned.built = false
+            if self.occupancy then
+                planned.reservation = self.occupancy:Reserve(planned.position.x, planned.position.z)
+            end
+        end
+    end)
+end
+
 -- 更新规划
 function AIPlanner:UpdatePlanning()
     local current_time = GetTime()
@@ -510,8 +710,17 @@ function AIPlanner:GetPlanningStats()
         total_planned = total_planned,
         total_built = total_built,
         completion_rate = total_planned > 0 and (total_built / total_planned) or 0,
-        zones_count = table.getn(self.zones)
+        zones_count = table.getn(self.zones),
+        terrain_cache = self.terrain_cache and self.terrain_cache:GetStats() or nil,
+        occupancy = self.occupancy and self.occupancy:GetStats() or nil
     }
 end
 
+function AIPlanner:OnRemoveFromEntity()
+    self:UnregisterTrackedArea()
+    self:ReleasePlannedStructures()
+    self:ReleaseTerrainCache()
+    self:ReleaseOccupancyGrid()
+end
+
 return AIPlanner
\ No newline at end of file
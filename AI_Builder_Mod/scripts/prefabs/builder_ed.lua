@@ -138,6 +138,7 @@ local function fn()
     inst:AddComponent("ai_communicator")
     inst:AddComponent("ai_code_executor")  -- 代码执行器
     inst:AddComponent("ai_builder_controller")  -- 主控制器
+    inst:AddComponent("ai_decision_triggers")   -- 事件触发决策
     
     -- 大脑组件
     inst:SetBrain(BuilderBrain)